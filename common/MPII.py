@@ -4,6 +4,7 @@ import numpy as np
 from pycocotools.coco import COCO
 # from config import cfg
 from utils.data_utils import world2cam, cam2pixel, pixel2cam, process_bbox
+from common.columnar_store import ColumnarStore
 class MPII:
 
     def __init__(self, data_split):
@@ -52,5 +53,5 @@ class MPII:
                 'joint_vis': joint_vis,
             })
 
-        return data
+        return ColumnarStore.from_records(data)
 
@@ -0,0 +1,87 @@
+from __future__ import absolute_import, division
+
+import os
+import os.path as osp
+import json
+import struct
+
+import numpy as np
+
+'''
+Compiled binary cache of the annotation columns built by the dataset classes (see common/columnar_store.py).
+
+file layout
+    magic (8 bytes) | version (uint32) | header length (uint64) | JSON header | column blocks
+every column block starts at an offset aligned to CACHE_ALIGN, so each one can be
+memory-mapped directly with np.memmap.
+'''
+
+CACHE_MAGIC = b'POSECACH'
+CACHE_VERSION = 2
+CACHE_ALIGN = 64
+_PREFIX = struct.Struct('<8sIQ')
+
+
+def source_signature(file_list):
+    # (name, mtime, size) of every source file. any change invalidates the cache
+    signature = []
+    for file_path in file_list:
+        stat = os.stat(file_path)
+        signature.append([osp.basename(file_path), stat.st_mtime_ns, stat.st_size])
+    return signature
+
+
+def save_cache(path, columns, num, key):
+    header = {'version': CACHE_VERSION, 'key': key, 'num': num, 'columns': {}}
+    offset = 0
+    blocks = []
+    for name, arr in columns.items():
+        arr = np.ascontiguousarray(arr)
+        offset = (offset + CACHE_ALIGN - 1) // CACHE_ALIGN * CACHE_ALIGN
+        header['columns'][name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset}
+        blocks.append((offset, arr))
+        offset += arr.nbytes
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = (_PREFIX.size + len(header_bytes) + CACHE_ALIGN - 1) // CACHE_ALIGN * CACHE_ALIGN
+
+    # write to a temporary file first so that a crash never leaves a broken cache behind
+    os.makedirs(osp.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp.%d' % os.getpid()
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREFIX.pack(CACHE_MAGIC, CACHE_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for block_offset, arr in blocks:
+            f.seek(data_start + block_offset)
+            f.write(arr.tobytes())
+    os.replace(tmp_path, path)
+
+
+def load_cache(path, key):
+    '''
+    return (columns, num) with every column memory-mapped read-only,
+    or None when the file is missing, from another version or built from other sources
+    '''
+    if not osp.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        prefix = f.read(_PREFIX.size)
+        if len(prefix) != _PREFIX.size:
+            return None
+        magic, version, header_len = _PREFIX.unpack(prefix)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            return None
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    if header.get('key') != key:
+        return None
+
+    data_start = (_PREFIX.size + header_len + CACHE_ALIGN - 1) // CACHE_ALIGN * CACHE_ALIGN
+    columns = {}
+    for name, spec in header['columns'].items():
+        shape = tuple(spec['shape'])
+        if int(np.prod(shape)) == 0:
+            columns[name] = np.zeros(shape, dtype=np.dtype(spec['dtype']))
+            continue
+        columns[name] = np.memmap(path, dtype=np.dtype(spec['dtype']), mode='r',
+                                  offset=data_start + spec['offset'], shape=shape)
+    return columns, header['num']
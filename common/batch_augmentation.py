@@ -0,0 +1,53 @@
+from __future__ import absolute_import, division
+
+import torch
+import torch.nn.functional as F
+
+from common.common_dataset import input_shape
+
+'''
+Batched image augmentation on the training device.
+
+With device_augment=True the training loaders (DatasetLoader_3d_mppe, DatasetLoader_MOBIS) return
+    img = {'canvas': uint8 BGR source crop (H_c, W_c, 3), 'theta': (2, 3), 'color_scale': (3,), 'occlusion': (4,)}
+instead of the normalized patch (see generate_patch_canvas), and BatchAugmenter builds the whole batch at once:
+synthetic occlusion, affine warp + flip (grid sampling), BGR -> RGB, color scale and normalization.
+the joint targets are computed by the workers exactly as before. the images are an approximation of the
+per-sample patches for source regions larger than the canvas, which are area-downsampled (see generate_patch_canvas).
+'''
+
+
+class BatchAugmenter(object):
+    def __init__(self, mean, std, device, output_shape=input_shape):
+        self.device = device
+        self.output_shape = output_shape
+        # images are kept in 0~255 as in the per-sample loaders (ToTensor does not divide float patches)
+        self.mean = torch.tensor(mean, dtype=torch.float32, device=device).view(1, 3, 1, 1)
+        self.std = torch.tensor(std, dtype=torch.float32, device=device).view(1, 3, 1, 1)
+
+    def __call__(self, img):
+        canvas = img['canvas'].to(self.device, non_blocking=True)
+        theta = img['theta'].to(self.device, non_blocking=True)
+        color_scale = img['color_scale'].to(self.device, non_blocking=True)
+        occlusion = img['occlusion'].to(self.device, non_blocking=True)
+
+        # (B, H, W, 3) BGR uint8 -> (B, 3, H, W) RGB float
+        x = canvas.permute(0, 3, 1, 2).flip(1).float()
+        batch_size, _, canvas_h, canvas_w = x.shape
+
+        # synthetic occlusion: noise in the rectangle, truncated like the uint8 fill of the workers
+        ys = torch.arange(canvas_h, device=self.device, dtype=torch.float32).view(1, canvas_h, 1)
+        xs = torch.arange(canvas_w, device=self.device, dtype=torch.float32).view(1, 1, canvas_w)
+        x0, y0, x1, y1 = [occlusion[:, i].view(-1, 1, 1) for i in range(4)]
+        # applied to every batch: no host sync on the mask, all-False without occlusion
+        mask = (xs >= x0) & (xs < x1) & (ys >= y0) & (ys < y1)
+        noise = (torch.rand_like(x) * 255).floor()
+        x = torch.where(mask.unsqueeze(1), noise, x)
+
+        # affine warp (+ flip), zero outside the source like cv2.warpAffine
+        grid = F.affine_grid(theta, (batch_size, 3, self.output_shape[0], self.output_shape[1]), align_corners=True)
+        x = F.grid_sample(x, grid, mode='bilinear', padding_mode='zeros', align_corners=True)
+        x = x.round()  # the per-sample patch is uint8
+
+        x = torch.clamp(x * color_scale.view(-1, 3, 1, 1), 0, 255)
+        return (x - self.mean) / self.std
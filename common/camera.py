@@ -26,10 +26,47 @@ def world_to_camera(X, R, t):
     return wrap(qrot, False, np.tile(Rt, X.shape[:-1] + (1,)), X - t)  # Rotate and translate
 
 
+def quaternion_to_matrix(q):
+    """
+    Rotation matrices (*, 3, 3) of normalized quaternions (*, 4) in (w, x, y, z) order, numpy.
+    matrix @ v equals qrot(q, v)
+    """
+    q = np.asarray(q, dtype=np.float64)
+    w, x, y, z = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    R = np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y),
+                  2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x),
+                  2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)], axis=-1)
+    return R.reshape(q.shape[:-1] + (3, 3))
+
+
+def world_to_camera_batch(X, R, t):
+    """
+    world_to_camera for all cameras at once, without torch.
+    X -- world positions (N, J, 3)
+    R -- camera orientations as quaternions (C, 4)
+    t -- camera translations (C, 3)
+    returns the camera space positions (C, N, J, 3)
+    """
+    X = np.asarray(X)
+    dtype = np.result_type(X, np.float32)
+    # rows: (R^-1 (x - t))^T = (x - t)^T M(R)
+    M = quaternion_to_matrix(R).astype(dtype)
+    t = np.asarray(t, dtype=dtype).reshape(-1, 1, 3)
+    return np.matmul(X.reshape(1, -1, 3) - t, M).reshape((len(M),) + X.shape)
+
+
 def camera_to_world(X, R, t):
     return wrap(qrot, False, np.tile(R, X.shape[:-1] + (1,)), X) + t
 
 
+def expand_camera_params(camera_index, camera_table):
+    """
+    Per-frame intrinsic parameters (N, 9) from the per-frame camera ids of PoseDataSet (N,)
+    and its camera table (K, 9), gathered on the device of camera_table.
+    """
+    return camera_table[camera_index.to(camera_table.device).long()]
+
+
 def project_to_2d(X, camera_params):
     """
     Project 3D points to 2D using the Human3.6M camera projection function.
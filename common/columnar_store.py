@@ -0,0 +1,224 @@
+from __future__ import absolute_import, division
+
+import numpy as np
+
+'''
+Columnar (struct-of-arrays) storage of the per-frame annotation records.
+
+The dataset classes used to keep one dict of small numpy arrays per frame. Here every field
+is one contiguous array indexed by the frame, and the image paths live in an interned table
+(unique directories + one byte blob of file names), so no per-frame python object exists
+until a record is requested. This keeps forked DataLoader workers copy-on-write friendly.
+
+column naming in to_columns() / from_columns()
+    <name>                          : dense field, (N, ...)
+    <name>__dir_blob/__dir_offsets  : interned directory table of a path field
+    <name>__dir_index               : directory of every frame
+    <name>__blob/__offsets          : file names of a path field
+    <name>__values/__offsets/__shapes : ragged field (e.g. segmentation of MOBIS)
+'''
+
+
+def _encode_strings(strings):
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _decode_strings(blob, offsets):
+    blob = blob.tobytes()
+    return [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+
+class PathTable(object):
+    def __init__(self, dirs, dir_index, name_blob, name_offsets):
+        self.dirs = dirs  # a few hundred strings for the whole dataset
+        self.dir_index = dir_index
+        self.name_blob = name_blob
+        self.name_offsets = name_offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        dir_ids = {}
+        dir_index = np.empty(len(strings), dtype=np.int32)
+        names = []
+        for i, s in enumerate(strings):
+            head, sep, tail = s.rpartition('/')
+            d = head + sep
+            if d not in dir_ids:
+                dir_ids[d] = len(dir_ids)
+            dir_index[i] = dir_ids[d]
+            names.append(tail)
+        name_blob, name_offsets = _encode_strings(names)
+        return cls(list(dir_ids.keys()), dir_index, name_blob, name_offsets)
+
+    def __len__(self):
+        return len(self.dir_index)
+
+    def __getitem__(self, index):
+        start, end = self.name_offsets[index], self.name_offsets[index + 1]
+        return self.dirs[self.dir_index[index]] + self.name_blob[start:end].tobytes().decode('utf-8')
+
+    def to_columns(self, name):
+        dir_blob, dir_offsets = _encode_strings(self.dirs)
+        return {
+            name + '__dir_blob': dir_blob,
+            name + '__dir_offsets': dir_offsets,
+            name + '__dir_index': self.dir_index,
+            name + '__blob': self.name_blob,
+            name + '__offsets': self.name_offsets,
+        }
+
+    @classmethod
+    def from_columns(cls, columns, name):
+        dirs = _decode_strings(columns[name + '__dir_blob'], columns[name + '__dir_offsets'])
+        return cls(dirs, columns[name + '__dir_index'], columns[name + '__blob'], columns[name + '__offsets'])
+
+    @classmethod
+    def concatenate(cls, tables):
+        dirs = []
+        dir_ids = {}
+        dir_index, name_blob, name_offsets = [], [], []
+        blob_start = 0
+        for i, table in enumerate(tables):
+            remap = np.zeros(len(table.dirs), dtype=np.int32)
+            for j, d in enumerate(table.dirs):
+                if d not in dir_ids:
+                    dir_ids[d] = len(dirs)
+                    dirs.append(d)
+                remap[j] = dir_ids[d]
+            dir_index.append(remap[table.dir_index])
+            name_blob.append(np.asarray(table.name_blob))
+            offsets = np.asarray(table.name_offsets)
+            name_offsets.append(offsets[(0 if i == 0 else 1):] + blob_start)
+            blob_start += int(offsets[-1])
+        return cls(dirs, np.concatenate(dir_index), np.concatenate(name_blob), np.concatenate(name_offsets))
+
+
+class RaggedColumn(object):
+    def __init__(self, values, offsets, shapes):
+        self.values = values
+        self.offsets = offsets
+        self.shapes = shapes
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([a.size for a in arrays])
+        shapes = np.array([a.shape for a in arrays], dtype=np.int64)
+        return cls(np.concatenate([a.ravel() for a in arrays]), offsets, shapes)
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def __getitem__(self, index):
+        return self.values[self.offsets[index]:self.offsets[index + 1]].reshape(self.shapes[index])
+
+    def to_columns(self, name):
+        return {name + '__values': self.values, name + '__offsets': self.offsets, name + '__shapes': self.shapes}
+
+    @classmethod
+    def from_columns(cls, columns, name):
+        return cls(columns[name + '__values'], columns[name + '__offsets'], columns[name + '__shapes'])
+
+    @classmethod
+    def concatenate(cls, columns):
+        offsets = [np.asarray(columns[0].offsets)]
+        for col in columns[1:]:
+            offsets.append(np.asarray(col.offsets)[1:] + offsets[-1][-1])
+        return cls(np.concatenate([np.asarray(c.values) for c in columns]), np.concatenate(offsets),
+                   np.concatenate([np.asarray(c.shapes) for c in columns]))
+
+
+class ColumnarStore(object):
+    '''
+    drop-in replacement of the list-of-dicts db.data.
+    len(store) and store[i] behave like the list, store[i] building the record dict on request
+    (array fields are read-only views, so callers must not modify them in place).
+    store.column(name) returns the whole (N, ...) array of a field.
+    '''
+
+    def __init__(self, fields, num):
+        self.fields = fields  # name -> ndarray / PathTable / RaggedColumn, in record order
+        self.num = num
+
+    @classmethod
+    def from_records(cls, records):
+        fields = {}
+        if len(records) > 0:
+            for name, value in records[0].items():
+                values = [r[name] for r in records]
+                if isinstance(value, str):
+                    fields[name] = PathTable.from_strings(values)
+                    continue
+                values = [np.asarray(v) for v in values]
+                if all(v.shape == values[0].shape for v in values):
+                    fields[name] = np.stack(values)
+                else:
+                    fields[name] = RaggedColumn.from_arrays(values)
+        return cls(fields, len(records))
+
+    def to_columns(self):
+        columns = {}
+        for name, field in self.fields.items():
+            if isinstance(field, (PathTable, RaggedColumn)):
+                columns.update(field.to_columns(name))
+            else:
+                columns[name] = field
+        return columns
+
+    @classmethod
+    def from_columns(cls, columns, num):
+        fields = {}
+        for key in columns:
+            if '__' not in key:
+                fields[key] = np.asarray(columns[key])
+                continue
+            name, part = key.split('__', 1)
+            if name in fields:
+                continue
+            if part.startswith('dir_') or part in ('blob',):
+                fields[name] = PathTable.from_columns(columns, name)
+            elif part in ('values', 'shapes'):
+                fields[name] = RaggedColumn.from_columns(columns, name)
+            elif part == 'offsets':
+                fields[name] = PathTable.from_columns(columns, name) if (name + '__blob') in columns \
+                    else RaggedColumn.from_columns(columns, name)
+        return cls(fields, num)
+
+    @classmethod
+    def concatenate(cls, stores):
+        stores = [s for s in stores if len(s) > 0]
+        if len(stores) == 0:
+            return cls({}, 0)
+        fields = {}
+        for name, field in stores[0].fields.items():
+            parts = [s.fields[name] for s in stores]
+            if isinstance(field, PathTable):
+                fields[name] = PathTable.concatenate(parts)
+            elif isinstance(field, RaggedColumn):
+                fields[name] = RaggedColumn.concatenate(parts)
+            else:
+                fields[name] = np.concatenate(parts)
+        return cls(fields, sum(len(s) for s in stores))
+
+    def keys(self):
+        return self.fields.keys()
+
+    def column(self, name):
+        return self.fields[name]
+
+    def __len__(self):
+        return self.num
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.num
+        if index < 0 or index >= self.num:
+            raise IndexError('index {} is out of range'.format(index))
+        return {name: field[index] for name, field in self.fields.items()}
+
+    def __iter__(self):
+        for i in range(self.num):
+            yield self[i]
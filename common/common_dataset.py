@@ -3,13 +3,16 @@ import cv2
 import random
 import time
 import torch
-import copy
 import math
+import torchvision.transforms as transforms
 from torch.utils.data.dataset import Dataset
 from data_extra.dataset_converter import COCO2HUMAN, MPII2HUMAN
 from data_extra.dataset_converter import transform_joint_to_other_db
+from common.keypoint_export import load_keypoints_2d
+from utils.affine import affine_transform_batch  # trans_point2d for all points at once
 input_shape = (256, 256) 
 output_shape = (64, 64)
+canvas_shape = (512, 512) # source crop of the batched (device) augmentation, larger regions are downsampled (approximation)
 bbox_3d_shape = (2000, 2000, 2000)
 
 class DatasetLoader(Dataset):
@@ -50,13 +53,14 @@ class DatasetLoader(Dataset):
     def __getitem__(self, index):
         
         joints_have_depth = self.joints_have_depth
-        data = copy.deepcopy(self.db[index])
+        # records are read-only views of the dataset store: never modify them in place
+        data = self.db[index]
 
-        bbox = data['bbox'] # top_left_x, top_left_y, width, height
+        bbox = data['bbox'].copy() # top_left_x, top_left_y, width, height
         joint_img = data['joint_img']
         joint_cam = data['joint_cam']
         joint_vis = data['joint_vis']
-        joint_img_not_norm = joint_img.copy()[:, :2]
+        joint_img_not_norm = joint_img[:, :2].copy()
         
         # 1. load image
         cvimg = cv2.imread(data['img_path'], cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
@@ -73,18 +77,7 @@ class DatasetLoader(Dataset):
             img_patch[:, :, i] = np.clip(img_patch[:, :, i] * color_scale[i], 0, 255)
         
         # joint_img in image plane to bbox plane
-        for i in range(len(joint_img)):
-            joint_img[i, 0:2] = trans_point2d(joint_img[i, 0:2], trans)
-            joint_img[i, 2] /= (2000/2.) # expect depth lies in -bbox_3d_shape[0]/2 ~ bbox_3d_shape[0]/2 -> -1.0 ~ 1.0
-            joint_img[i, 2] = (joint_img[i,2] + 1.0)/2. # 0~1 normalize
-            joint_vis[i] *= (
-                            (joint_img[i,0] >= 0) & \
-                            (joint_img[i,0] < input_shape[1]) & \
-                            (joint_img[i,1] >= 0) & \
-                            (joint_img[i,1] < input_shape[0]) & \
-                            (joint_img[i,2] >= 0) & \
-                            (joint_img[i,2] < 1)
-                            )
+        joint_img, joint_vis = transform_joints_to_patch(joint_img, joint_vis, trans)
         joint_img = joint_img[:, :2]
             
         ## to meter unit
@@ -101,7 +94,7 @@ class DatasetLoader(Dataset):
         elif self.vis:
             return data['img_path'], img_patch, bbox, normalize_screen_coordinates(joint_img_not_norm, img_width, img_height).astype(np.float32)#, data['root_cam'], data['f'], data['c']#, normalize_screen_coordinates(joint_img, img_width, img_height).astype(np.float32)
         elif self.only_2d:
-            return img_patch, self.transform(img_patch_not_norm), bbox, joint_img_not_norm, data['f'], data['c'], joint_cam
+            return img_patch, self.transform(img_patch_not_norm), bbox, joint_img_not_norm, data['f'].copy(), data['c'].copy(), joint_cam
         else:
             return img_patch, joint_img, joint_cam, joint_vis, bbox, img_width, img_height
     
@@ -109,7 +102,7 @@ class DatasetLoader(Dataset):
         return len(self.db)
     
 class DatasetLoader_only_lifting(Dataset):
-    def __init__(self, db, ref_joints_name, is_train, transform, keypoints='gt', viz=False):
+    def __init__(self, db, ref_joints_name, is_train, transform, keypoints='gt', viz=False, precompute=False):
         
         self.db = db.data
         self.joint_num = db.joint_num
@@ -132,15 +125,16 @@ class DatasetLoader_only_lifting(Dataset):
         # use the .npz file
         self.keypoints = keypoints
         if self.keypoints != 'gt':
-            train_path = self.keypoints + '_train.npz'
-            valid_path = self.keypoints + '_valid.npz'
+            train_path = self.keypoints + '_train'
+            valid_path = self.keypoints + '_valid'
             if self.is_train:
                 path_2d = train_path
             else:
                 path_2d = valid_path
-            keypoints_2d = np.load(path_2d)
-            x_2d = np.expand_dims(keypoints_2d['x'], 2)
-            y_2d = np.expand_dims(keypoints_2d['y'], 2)
+            # {path_2d}.npz, or the {path_2d}_x.npy / _y.npy pair (common/keypoint_export.py)
+            x_2d, y_2d = load_keypoints_2d(path_2d)
+            x_2d = np.expand_dims(x_2d, 2)
+            y_2d = np.expand_dims(y_2d, 2)
             self.keypoints_2d = np.concatenate([x_2d, y_2d], 2)
             assert len(self.keypoints) != len(self.db)
             
@@ -153,18 +147,44 @@ class DatasetLoader_only_lifting(Dataset):
         # visualize
         self.viz = viz
         
+        # whole-array mode: every output is precomputed as one tensor and indexed by whole batches
+        # (a list of indices, see batch_sampler_loader)
+        self.precompute = precompute and not viz
+        if self.precompute:
+            self.arrays = self.build_arrays()
+        
+    def build_arrays(self):
+        # the outputs of __getitem__ for all frames: joint_img_, joint_cam, joint_vis, root_cam, f, c, joint_img
+        joint_img = np.asarray(self.db.column('joint_img'))[:, :, :2]
+        if self.keypoints != 'gt':
+            joint_img = self.keypoints_2d
+        img_width = np.asarray(self.db.column('img_width'))
+        img_height = np.asarray(self.db.column('img_height'))
+        # normalize_screen_coordinates with a different image size per frame
+        offset = np.stack([np.ones(len(img_width)), img_height / img_width], 1)[:, None, :]
+        joint_img_ = joint_img / img_width.reshape(-1, 1, 1) * 2 - offset
+
+        joint_cam = np.asarray(self.db.column('joint_cam')) / 1000.
+        joint_vis = np.asarray(self.db.column('joint_vis')) > 0
+        arrays = [joint_img_.astype(np.float32), joint_cam.astype(np.float32), joint_vis.astype(np.float32),
+                  self.db.column('root_cam'), self.db.column('f'), self.db.column('c'), joint_img.astype(np.float32)]
+        return tuple(torch.from_numpy(np.array(a)) for a in arrays)
+
     def __getitem__(self, index):
         
+        if self.precompute:
+            return tuple(a[index] for a in self.arrays)
+        
         joints_have_depth = self.joints_have_depth
 
-        data = copy.deepcopy(self.db[index])
+        # records are read-only views of the dataset store: never modify them in place
+        data = self.db[index]
 
-        bbox = data['bbox']
         joint_img = data['joint_img']
         joint_cam = data['joint_cam']
         joint_vis = data['joint_vis']
-        root_cam = data['root_cam']
-        f, c = data['f'], data['c']
+        root_cam = data['root_cam'].copy()
+        f, c = data['f'].copy(), data['c'].copy()
 
         # normalize
         joint_img = joint_img[:, :2]
@@ -173,7 +193,7 @@ class DatasetLoader_only_lifting(Dataset):
         if self.keypoints != 'gt':
             joint_img = self.keypoints_2d[index]
         # normalize
-        joint_img_ = normalize_screen_coordinates(joint_img.copy(), img_width, img_height)
+        joint_img_ = normalize_screen_coordinates(joint_img, img_width, img_height)
 
         ## to meter unit
         joint_cam = joint_cam / 1000.
@@ -194,6 +214,12 @@ class DatasetLoader_only_lifting(Dataset):
     def __len__(self):
         return len(self.db)
 
+def batch_sampler_loader(dataset, batch_size, shuffle, num_workers=0, pin_memory=False):
+    # DataLoader of a dataset indexed by whole batches (lists of indices), e.g. DatasetLoader_only_lifting(precompute=True)
+    sampler = torch.utils.data.RandomSampler(dataset) if shuffle else torch.utils.data.SequentialSampler(dataset)
+    sampler = torch.utils.data.BatchSampler(sampler, batch_size=batch_size, drop_last=False)
+    return torch.utils.data.DataLoader(dataset, sampler=sampler, batch_size=None, num_workers=num_workers, pin_memory=pin_memory)
+
 class DatasetLoader_only_inferencing(Dataset):
     def __init__(self, db, ref_joints_name, is_train, transform):
         
@@ -220,9 +246,10 @@ class DatasetLoader_only_inferencing(Dataset):
         flip_pairs = self.flip_pairs
         joints_have_depth = self.joints_have_depth
 
-        data = copy.deepcopy(self.db[index])
+        # records are read-only views of the dataset store: never modify them in place
+        data = self.db[index]
 
-        bbox = data['bbox']
+        bbox = data['bbox'].copy() # top_left_x, top_left_y, width, height
         joint_img = data['joint_img']
         joint_cam = data['joint_cam']
         joint_vis = data['joint_vis']
@@ -303,9 +330,10 @@ class DatasetLoader_saved_test(Dataset):
     def __getitem__(self, index):
         
         joints_have_depth = self.joints_have_depth
-        data = copy.deepcopy(self.db[index])
+        # records are read-only views of the dataset store: never modify them in place
+        data = self.db[index]
 
-        bbox = data['bbox'] # top_left_x, top_left_y, width, height
+        bbox = data['bbox'].copy() # top_left_x, top_left_y, width, height
         joint_img = data['joint_img']
         
         # img_width, img_height = data['img_width'], data['img_height']
@@ -330,7 +358,7 @@ class DatasetLoader_saved_test(Dataset):
 # helper functions
 
 class DatasetLoader_3d_mppe(Dataset):
-    def __init__(self, db, ref_joints_name, is_train, transform, vis=False):
+    def __init__(self, db, ref_joints_name, is_train, transform, vis=False, device_augment=False):
         
         self.db = db.data
         self.joint_num = db.joint_num
@@ -343,15 +371,20 @@ class DatasetLoader_3d_mppe(Dataset):
         self.transform = transform
         self.is_train = is_train
         self.vis = vis
+        # fused patch generation when transform is ToTensor + Normalize
+        self.patch_norm = get_normalize_params(transform)
+        # train: return the source canvas and augmentation parameters instead of the patch
+        self.device_augment = device_augment
         
     def __getitem__(self, index):
         
         joints_have_depth = self.joints_have_depth
-        data = copy.deepcopy(self.db[index])
+        # records are read-only views of the dataset store: never modify them in place
+        data = self.db[index]
 
-        bbox = data['bbox'] # top_left_x, top_left_y, width, height
-        joint_img = data['joint_img']
-        joint_vis = data['joint_vis']
+        bbox = data['bbox'].copy() # top_left_x, top_left_y, width, height
+        joint_img = data['joint_img'].copy()
+        joint_vis = data['joint_vis'].copy()
         
         # 1. load image
         cvimg = cv2.imread(data['img_path'], cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
@@ -366,18 +399,25 @@ class DatasetLoader_3d_mppe(Dataset):
             scale, rot, do_flip, color_scale, do_occlusion = 1.0, 0.0, False, [1.0, 1.0, 1.0], False    
             
         # 3. crop patch from img and perform data augmentation (flip, rot, color scale, synthetic occlusion)
-        img_patch, trans = generate_patch_image(cvimg, bbox, do_flip, scale, rot, do_occlusion)
-        img_patch = img_patch.astype(np.float32)
-        for i in range(img_channels):
-            img_patch[:, :, i] = np.clip(img_patch[:, :, i] * color_scale[i], 0, 255)
+        if self.device_augment and self.is_train:
+            # finished on the device by common.batch_augmentation.BatchAugmenter
+            canvas, theta, occlusion, trans = generate_patch_canvas(cvimg, bbox, do_flip, scale, rot, do_occlusion, canvas_shape)
+            img_patch = {'canvas': canvas, 'theta': theta, 'color_scale': np.array(color_scale, dtype=np.float32), 'occlusion': occlusion}
+        elif self.patch_norm is not None:
+            img_patch, trans = generate_patch_tensor(cvimg, bbox, do_flip, scale, rot, do_occlusion, color_scale, *self.patch_norm)
+        else:
+            img_patch, trans = generate_patch_image(cvimg, bbox, do_flip, scale, rot, do_occlusion)
+            img_patch = img_patch.astype(np.float32)
+            for i in range(img_channels):
+                img_patch[:, :, i] = np.clip(img_patch[:, :, i] * color_scale[i], 0, 255)
+            img_patch = self.transform(img_patch)
         
         # for valid loader
         if not self.is_train:
-            img_patch = self.transform(img_patch)
             joint_cam = data['joint_cam']
             joint_cam = (joint_cam).astype(np.float32)
-            f, c = data['f'], data['c']
-            root_cam = data['root_cam']
+            f, c = data['f'].copy(), data['c'].copy()
+            root_cam = data['root_cam'].copy()
             if self.vis:
                 return data['img_path'], img_patch, bbox, f, c, root_cam
             else:
@@ -391,23 +431,11 @@ class DatasetLoader_3d_mppe(Dataset):
                 joint_vis[pair[0], :], joint_vis[pair[1], :] = joint_vis[pair[1], :], joint_vis[pair[0], :].copy()
 
         # joint_img in image plane to bbox plane
-        for i in range(len(joint_img)):
-            joint_img[i, 0:2] = trans_point2d(joint_img[i, 0:2], trans)
-            joint_img[i, 2] /= (2000/2.) # expect depth lies in -bbox_3d_shape[0]/2 ~ bbox_3d_shape[0]/2 -> -1.0 ~ 1.0
-            joint_img[i, 2] = (joint_img[i,2] + 1.0)/2. # 0~1 normalize
-            joint_vis[i] *= (
-                            (joint_img[i,0] >= 0) & \
-                            (joint_img[i,0] < input_shape[1]) & \
-                            (joint_img[i,1] >= 0) & \
-                            (joint_img[i,1] < input_shape[0]) & \
-                            (joint_img[i,2] >= 0) & \
-                            (joint_img[i,2] < 1)
-                            )
+        joint_img, joint_vis = transform_joints_to_patch(joint_img, joint_vis, trans)
         joint_img[:, 0] = joint_img[:, 0] / 4
         joint_img[:, 1] = joint_img[:, 1] / 4
         joint_img[:, 2] = joint_img[:, 2] * 64
         
-        img_patch = self.transform(img_patch)
         if self.ref_joints_name is not None:
             joint_img = transform_joint_to_other_db(joint_img, self.joints_name, self.ref_joints_name)
             joint_vis = transform_joint_to_other_db(joint_vis, self.joints_name, self.ref_joints_name)
@@ -422,7 +450,7 @@ class DatasetLoader_3d_mppe(Dataset):
 
 
 class DatasetLoader_MOBIS(Dataset):
-    def __init__(self, db, ref_joints_name, is_train, transform, vis=False):
+    def __init__(self, db, ref_joints_name, is_train, transform, vis=False, device_augment=False):
         self.db = db.data
         self.joint_num = db.num_joints
         self.skeleton = db.skeleton
@@ -434,16 +462,21 @@ class DatasetLoader_MOBIS(Dataset):
         self.transform = transform
         self.is_train = is_train
         self.vis = vis
+        # fused patch generation when transform is ToTensor + Normalize
+        self.patch_norm = get_normalize_params(transform)
+        # train: return the source canvas and augmentation parameters instead of the patch
+        self.device_augment = device_augment
         
     def __getitem__(self, index):
         
         joints_have_depth = self.joints_have_depth
-        data = copy.deepcopy(self.db[index])
+        # records are read-only views of the dataset store: never modify them in place
+        data = self.db[index]
 
-        bbox = data['bbox'] # top_left_x, top_left_y, width, height
-        joint_img = data['joint_img']
+        bbox = data['bbox'].copy() # top_left_x, top_left_y, width, height
+        joint_img = data['joint_img'].copy()
         joint_vis = data['joint_vis']
-        joint_vis = np.expand_dims(joint_vis,axis=1)
+        joint_vis = np.expand_dims(joint_vis,axis=1).copy()
         
         # 1. load image
         cvimg = cv2.imread(data['img_path'], cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
@@ -458,14 +491,21 @@ class DatasetLoader_MOBIS(Dataset):
             scale, rot, do_flip, color_scale, do_occlusion = 1.0, 0.0, False, [1.0, 1.0, 1.0], False    
             
         # 3. crop patch from img and perform data augmentation (flip, rot, color scale, synthetic occlusion)
-        img_patch, trans = generate_patch_image(cvimg, bbox, do_flip, scale, rot, do_occlusion)
-        img_patch = img_patch.astype(np.float32)
-        for i in range(img_channels):
-            img_patch[:, :, i] = np.clip(img_patch[:, :, i] * color_scale[i], 0, 255)
+        if self.device_augment and self.is_train:
+            # finished on the device by common.batch_augmentation.BatchAugmenter
+            canvas, theta, occlusion, trans = generate_patch_canvas(cvimg, bbox, do_flip, scale, rot, do_occlusion, canvas_shape)
+            img_patch = {'canvas': canvas, 'theta': theta, 'color_scale': np.array(color_scale, dtype=np.float32), 'occlusion': occlusion}
+        elif self.patch_norm is not None:
+            img_patch, trans = generate_patch_tensor(cvimg, bbox, do_flip, scale, rot, do_occlusion, color_scale, *self.patch_norm)
+        else:
+            img_patch, trans = generate_patch_image(cvimg, bbox, do_flip, scale, rot, do_occlusion)
+            img_patch = img_patch.astype(np.float32)
+            for i in range(img_channels):
+                img_patch[:, :, i] = np.clip(img_patch[:, :, i] * color_scale[i], 0, 255)
+            img_patch = self.transform(img_patch)
         
         # for valid loader
         if not self.is_train:
-            img_patch = self.transform(img_patch)
             if self.vis:
                 return data['img_path'], img_patch, bbox, f, c, root_cam
             else:
@@ -480,23 +520,11 @@ class DatasetLoader_MOBIS(Dataset):
                 joint_vis[pair[0], :], joint_vis[pair[1], :] = joint_vis[pair[1], :], joint_vis[pair[0], :].copy()
 
         # joint_img in image plane to bbox plane
-        for i in range(len(joint_img)):
-            joint_img[i, 0:2] = trans_point2d(joint_img[i, 0:2], trans)
-            joint_img[i, 2] /= (2000/2.) # expect depth lies in -bbox_3d_shape[0]/2 ~ bbox_3d_shape[0]/2 -> -1.0 ~ 1.0
-            joint_img[i, 2] = (joint_img[i,2] + 1.0)/2. # 0~1 normalize
-            joint_vis[i] *= (
-                            (joint_img[i,0] >= 0) & \
-                            (joint_img[i,0] < input_shape[1]) & \
-                            (joint_img[i,1] >= 0) & \
-                            (joint_img[i,1] < input_shape[0]) & \
-                            (joint_img[i,2] >= 0) & \
-                            (joint_img[i,2] < 1)
-                            )
+        joint_img, joint_vis = transform_joints_to_patch(joint_img, joint_vis, trans)
         joint_img[:, 0] = joint_img[:, 0] / 4
         joint_img[:, 1] = joint_img[:, 1] / 4
         joint_img[:, 2] = joint_img[:, 2] * 64
         
-        img_patch = self.transform(img_patch)
         if self.ref_joints_name is not None:
             joint_img = transform_joint_to_other_db(joint_img, self.joints_name, self.ref_joints_name)
             joint_vis = transform_joint_to_other_db(joint_vis, self.joints_name, self.ref_joints_name)
@@ -566,33 +594,71 @@ def get_aug_config():
     return scale, rot, do_flip, color_scale, do_occlusion
 
 
+def sample_occlusion(bbox, img_width, img_height, rng=random):
+    '''
+    random rectangle (xmin, ymin, w, h) around the bbox and inside the image, drawn in bounded time
+    (4 draws of rng.random()): the position is sampled directly from the feasible range instead of retrying
+    until the rectangle fits, and a rectangle larger than the image is shrunk to fit
+    '''
+    area_min = 0.0
+    area_max = 0.7
+    synth_area = (rng.random() * (area_max - area_min) + area_min) * bbox[2] * bbox[3]
+
+    ratio_min = 0.3
+    ratio_max = 1/0.3
+    synth_ratio = (rng.random() * (ratio_max - ratio_min) + ratio_min)
+
+    synth_h = min(math.sqrt(synth_area * synth_ratio), img_height - 1)
+    synth_w = min(math.sqrt(synth_area / synth_ratio), img_width - 1)
+    synth_xmin = _sample_occlusion_start(bbox[0], bbox[2], synth_w, img_width, rng)
+    synth_ymin = _sample_occlusion_start(bbox[1], bbox[3], synth_h, img_height, rng)
+    return int(synth_xmin), int(synth_ymin), int(synth_w), int(synth_h)
+
+def _sample_occlusion_start(bb_start, bb_size, synth_size, img_size, rng=random):
+    # uniform in bb_start + [0, bb_size - synth_size - 1) clipped to [0, img_size - synth_size)
+    low = min(bb_start, bb_start + bb_size - synth_size - 1)
+    high = max(bb_start, bb_start + bb_size - synth_size - 1)
+    low, high = max(low, 0.), min(high, img_size - synth_size)
+    if low > high: # the bbox range lies outside the image: anywhere in the image
+        low, high = 0., img_size - synth_size
+    draw = rng.random() # drawn in every case, a constant number of draws per rectangle
+    if low == high: # a single feasible position
+        return low
+    return low + draw * (high - low)
+
+def occlusion_inside_image(occlusion, img_width, img_height):
+    # rectangle (xmin, ymin, w, h) of sample_occlusion within the image
+    xmin, ymin, w, h = occlusion
+    return 0 <= w and 0 <= h and 0 <= xmin and 0 <= ymin and xmin + w <= img_width and ymin + h <= img_height
+
+_noise_bank = None
+
+def get_noise_bank(h, w):
+    # uint8 noise (0 ~ 254 as np.random.rand(h, w, 3) * 255) generated once per process, grown on demand
+    global _noise_bank
+    if _noise_bank is None or _noise_bank.shape[0] < h or _noise_bank.shape[1] < w:
+        bank_h = max(h, 1024 if _noise_bank is None else _noise_bank.shape[0])
+        bank_w = max(w, 1024 if _noise_bank is None else _noise_bank.shape[1])
+        _noise_bank = np.random.randint(0, 255, (bank_h, bank_w, 3), dtype=np.uint8)
+    return _noise_bank
+
+def synthetic_occlusion(img, bbox):
+    # fill a random rectangle inside the bbox with noise, in place
+    img_height, img_width, img_channels = img.shape
+    xmin, ymin, w, h = sample_occlusion(bbox, img_width, img_height)
+    noise_bank = get_noise_bank(h, w)
+    noise_y = random.randint(0, noise_bank.shape[0] - h)
+    noise_x = random.randint(0, noise_bank.shape[1] - w)
+    img[ymin:ymin+h, xmin:xmin+w, :] = noise_bank[noise_y:noise_y+h, noise_x:noise_x+w, :img_channels]
+    return img
+
 def generate_patch_image(cvimg, bbox, do_flip, scale, rot, do_occlusion):
     img = cvimg.copy()
     img_height, img_width, img_channels = img.shape
 
     # synthetic occlusion
     if do_occlusion:
-        while True:
-            area_min = 0.0
-            area_max = 0.7
-            synth_area = (random.random() * (area_max - area_min) + area_min) * bbox[2] * bbox[3]
-
-            ratio_min = 0.3
-            ratio_max = 1/0.3
-            synth_ratio = (random.random() * (ratio_max - ratio_min) + ratio_min)
-
-            synth_h = math.sqrt(synth_area * synth_ratio)
-            synth_w = math.sqrt(synth_area / synth_ratio)
-            synth_xmin = random.random() * (bbox[2] - synth_w - 1) + bbox[0]
-            synth_ymin = random.random() * (bbox[3] - synth_h - 1) + bbox[1]
-
-            if synth_xmin >= 0 and synth_ymin >= 0 and synth_xmin + synth_w < img_width and synth_ymin + synth_h < img_height:
-                xmin = int(synth_xmin)
-                ymin = int(synth_ymin)
-                w = int(synth_w)
-                h = int(synth_h)
-                img[ymin:ymin+h, xmin:xmin+w, :] = np.random.rand(h, w, 3) * 255
-                break
+        synthetic_occlusion(img, bbox)
 
     bb_c_x = float(bbox[0] + 0.5*bbox[2])
     bb_c_y = float(bbox[1] + 0.5*bbox[3])
@@ -611,6 +677,124 @@ def generate_patch_image(cvimg, bbox, do_flip, scale, rot, do_occlusion):
 
     return img_patch, trans
 
+def get_normalize_params(transform):
+    '''
+    (mean, std) when transform is Compose([ToTensor(), Normalize(mean, std)]), otherwise None.
+    the loaders then skip the transform and build the input with generate_patch_tensor
+    '''
+    if not isinstance(transform, transforms.Compose) or len(transform.transforms) != 2:
+        return None
+    to_tensor, normalize = transform.transforms
+    if not isinstance(to_tensor, transforms.ToTensor) or not isinstance(normalize, transforms.Normalize):
+        return None
+    return np.asarray(normalize.mean, dtype=np.float32), np.asarray(normalize.std, dtype=np.float32)
+
+def generate_patch_tensor(cvimg, bbox, do_flip, scale, rot, do_occlusion, color_scale, mean, std):
+    '''
+    generate_patch_image + color scale + ToTensor + Normalize of the float patch in one pass.
+    writes the normalized (3, H, W) RGB float32 tensor straight from the BGR source image:
+    the flip is folded into the affine warp and the source is copied only for the synthetic occlusion.
+    as for float patches, ToTensor does not divide by 255: (min(patch * color_scale, 255) - mean) / std
+    returns (tensor, trans), trans being the joint transform of generate_patch_image
+    '''
+    img_height, img_width, img_channels = cvimg.shape
+    img = cvimg
+    if do_occlusion:
+        img = synthetic_occlusion(cvimg.copy(), bbox)
+
+    bb_c_x = float(bbox[0] + 0.5*bbox[2])
+    bb_c_y = float(bbox[1] + 0.5*bbox[3])
+    bb_width = float(bbox[2])
+    bb_height = float(bbox[3])
+
+    if do_flip:
+        bb_c_x = img_width - bb_c_x - 1
+
+    trans = gen_trans_from_patch_cv(bb_c_x, bb_c_y, bb_width, bb_height, input_shape[1], input_shape[0], scale, rot, inv=False)
+    warp = trans
+    if do_flip:
+        # warping img[:, ::-1] by trans == warping img by trans @ (x -> img_width - 1 - x)
+        flip = np.array([[-1, 0, img_width - 1], [0, 1, 0], [0, 0, 1]], dtype=trans.dtype)
+        warp = np.dot(trans, flip)
+    img_patch = cv2.warpAffine(img, warp, (int(input_shape[1]), int(input_shape[0])), flags=cv2.INTER_LINEAR)
+
+    patch = np.empty((img_channels, input_shape[0], input_shape[1]), dtype=np.float32)
+    for i in range(img_channels):
+        out = patch[i]
+        np.multiply(img_patch[:, :, img_channels - 1 - i], np.float32(color_scale[i]), out=out) # BGR -> RGB
+        np.clip(out, 0, 255, out=out)
+        out -= mean[i]
+        out /= std[i]
+    return torch.from_numpy(patch), trans
+
+def generate_patch_canvas(cvimg, bbox, do_flip, scale, rot, do_occlusion, canvas_shape):
+    '''
+    worker side of the batched augmentation (common/batch_augmentation.py).
+    instead of the patch, crop the source region the patch is sampled from into a fixed uint8 BGR canvas
+    and return the parameters to finish on the device.
+    this is an approximation of generate_patch_image (trans, hence the joints, are the same):
+    when the region fits in the canvas the patch only differs by rounding (1 grey level), but a region larger
+    than the canvas (large bbox or scale) is area-downsampled into it first, so the patch is smoother than the
+    bilinear sampling of the full-resolution image (a few grey levels on average, single pixels up to ~100
+    on textured images, see tests/test_batch_augmentation.py).
+    returns (canvas, theta, occlusion, trans)
+        theta     : (2, 3) affine_grid matrix, output patch -> canvas (align_corners=True), flip included
+        occlusion : (4,) rectangle x0, y0, x1, y1 in canvas pixels to fill with noise, all 0 without occlusion
+        trans     : the joint transform of generate_patch_image
+    '''
+    img_height, img_width, img_channels = cvimg.shape
+    canvas_h, canvas_w = canvas_shape
+    patch_h, patch_w = input_shape
+
+    bb_c_x = float(bbox[0] + 0.5*bbox[2])
+    bb_c_y = float(bbox[1] + 0.5*bbox[3])
+    bb_width = float(bbox[2])
+    bb_height = float(bbox[3])
+
+    if do_flip:
+        bb_c_x = img_width - bb_c_x - 1
+
+    trans = gen_trans_from_patch_cv(bb_c_x, bb_c_y, bb_width, bb_height, input_shape[1], input_shape[0], scale, rot, inv=False)
+    warp = np.concatenate((trans, [[0, 0, 1]]), 0)
+    if do_flip:
+        warp = np.dot(warp, np.array([[-1, 0, img_width - 1], [0, 1, 0], [0, 0, 1]], dtype=warp.dtype))
+
+    # source region covered by the patch (+1 pixel for the bilinear neighbours)
+    corners = np.array([[0, 0, 1], [patch_w - 1, 0, 1], [0, patch_h - 1, 1], [patch_w - 1, patch_h - 1, 1]], dtype=np.float64)
+    src_corners = np.dot(corners, np.linalg.inv(warp).T)[:, :2]
+    x0, y0 = np.floor(src_corners.min(0)) - 1
+    x1, y1 = np.ceil(src_corners.max(0)) + 1
+    region_w, region_h = int(x1 - x0 + 1), int(y1 - y0 + 1)
+
+    # source -> canvas: an integer shift (copy, zero outside the image) when the region fits
+    shift = np.array([[1, 0, -x0], [0, 1, -y0]], dtype=np.float64)
+    if region_w <= canvas_w and region_h <= canvas_h:
+        canvas = cv2.warpAffine(cvimg, shift, (int(canvas_w), int(canvas_h)), flags=cv2.INTER_NEAREST)
+        kx, ky = 1.0, 1.0
+        to_canvas = np.array([[1, 0, -x0], [0, 1, -y0], [0, 0, 1]], dtype=np.float64)
+    else:
+        # otherwise area-downsample the region into the canvas
+        region = cv2.warpAffine(cvimg, shift, (region_w, region_h), flags=cv2.INTER_NEAREST)
+        new_w, new_h = min(region_w, canvas_w), min(region_h, canvas_h)
+        canvas = np.zeros((canvas_h, canvas_w, img_channels), dtype=cvimg.dtype)
+        canvas[:new_h, :new_w] = cv2.resize(region, (new_w, new_h), interpolation=cv2.INTER_AREA)
+        kx, ky = new_w / region_w, new_h / region_h
+        to_canvas = np.array([[kx, 0, kx * (0.5 - x0) - 0.5], [0, ky, ky * (0.5 - y0) - 0.5], [0, 0, 1]], dtype=np.float64)
+
+    # output patch (normalized) -> canvas (normalized)
+    patch_to_canvas = np.dot(to_canvas, np.linalg.inv(warp))
+    norm_canvas = np.array([[2. / (canvas_w - 1), 0, -1], [0, 2. / (canvas_h - 1), -1], [0, 0, 1]])
+    denorm_patch = np.array([[(patch_w - 1) / 2., 0, (patch_w - 1) / 2.], [0, (patch_h - 1) / 2., (patch_h - 1) / 2.], [0, 0, 1]])
+    theta = np.dot(norm_canvas, np.dot(patch_to_canvas, denorm_patch))[:2].astype(np.float32)
+
+    occlusion = np.zeros(4, dtype=np.float32)
+    if do_occlusion:
+        xmin, ymin, w, h = sample_occlusion(bbox, img_width, img_height)
+        # canvas pixels whose centers fall in the rectangle
+        occlusion[:] = [kx * (xmin - x0), ky * (ymin - y0), kx * (xmin + w - x0), ky * (ymin + h - y0)]
+
+    return canvas, theta, occlusion, trans
+
 def rotate_2d(pt_2d, rot_rad):
     x = pt_2d[0]
     y = pt_2d[1]
@@ -658,6 +842,24 @@ def trans_point2d(pt_2d, trans):
     dst_pt = np.dot(trans, src_pt)
     return dst_pt[0:2]
 
+def transform_joints_to_patch(joint_img, joint_vis, trans):
+    '''
+    joint_img (J, 3) in image plane -> bbox (patch) plane, depth normalized to 0~1
+    joints falling out of the patch or the depth range get joint_vis 0.
+    returns new arrays of the dtype of the inputs (float32 from the stores, as the former in-place transform),
+    the inputs are not modified
+    '''
+    joint_xy = affine_transform_batch(joint_img[:, :2], trans)
+    joint_z = joint_img[:, 2:3] / (bbox_3d_shape[0]/2.) # expect depth lies in -bbox_3d_shape[0]/2 ~ bbox_3d_shape[0]/2 -> -1.0 ~ 1.0
+    joint_z = (joint_z + 1.0)/2. # 0~1 normalize
+    joint_img = np.concatenate((joint_xy, joint_z, joint_img[:, 3:]), axis=1).astype(joint_img.dtype, copy=False)
+
+    in_patch = (joint_img[:, 0] >= 0) & (joint_img[:, 0] < input_shape[1]) & \
+               (joint_img[:, 1] >= 0) & (joint_img[:, 1] < input_shape[0]) & \
+               (joint_img[:, 2] >= 0) & (joint_img[:, 2] < 1)
+    joint_vis = joint_vis * in_patch.reshape((-1,) + (1,) * (joint_vis.ndim - 1))
+    return joint_img, joint_vis
+
 def normalize_screen_coordinates(X, w, h):
     assert X.shape[-1] == 2
 
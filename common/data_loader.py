@@ -3,20 +3,50 @@ from __future__ import print_function, absolute_import
 import numpy as np
 import torch
 from torch.utils.data import Dataset
-from functools import reduce
+
+
+def intern_actions(actions, action_names=None):
+    """
+    actions: one entry per sequence, either a list of action names (one per frame)
+    or an integer array/tensor of codes into action_names.
+    returns (codes, action_names): the per-frame codes (int16) and the lookup table extended by the new names.
+    linear in the number of frames
+    """
+    lookup = {}
+    for name in (action_names if action_names is not None else []):
+        lookup[name] = len(lookup)
+    codes = []
+    for chunk in actions:
+        if torch.is_tensor(chunk):
+            chunk = chunk.cpu().numpy()
+        if isinstance(chunk, np.ndarray) and chunk.dtype.kind in 'iu':
+            codes.append(chunk.astype(np.int16))
+            continue
+        if len(chunk) == 0:
+            continue
+        names, inverse = np.unique(np.asarray(chunk), return_inverse=True)
+        remap = np.array([lookup.setdefault(name, len(lookup)) for name in names.tolist()], dtype=np.int16)
+        codes.append(remap[inverse.reshape(-1)])
+    codes = np.concatenate(codes) if len(codes) > 0 else np.zeros(0, dtype=np.int16)
+    return codes, list(lookup.keys())
 
 
 #####################################
 # data loader with four output
 #####################################
 class PoseDataSet(Dataset):
-    def __init__(self, poses_3d, poses_2d, actions, cams):
+    def __init__(self, poses_3d, poses_2d, actions, cams, action_names=None, decode_actions=False, cam_table=None):
         assert poses_3d is not None
 
         self._poses_3d = np.concatenate(poses_3d)
         self._poses_2d = np.concatenate(poses_2d)
-        self._actions = reduce(lambda x, y: x + y, actions)
+        # actions as int16 codes into self.action_names, decoded to names by __getitem__ only if decode_actions
+        self._actions, self.action_names = intern_actions(actions, action_names)
+        self.decode_actions = decode_actions
+        # with cam_table, cams are per-frame camera ids (uint8) into the (K, 9) intrinsics table,
+        # expanded inside the batch by common.camera.expand_camera_params. otherwise (N, 9) intrinsics
         self._cams = np.concatenate(cams)
+        self.cam_table = cam_table
 
         assert self._poses_3d.shape[0] == self._poses_2d.shape[0] and self._poses_3d.shape[0] == len(self._actions)
         assert self._poses_3d.shape[0] == self._cams.shape[0]
@@ -30,6 +60,8 @@ class PoseDataSet(Dataset):
 
         out_pose_3d = torch.from_numpy(out_pose_3d).float()
         out_pose_2d = torch.from_numpy(out_pose_2d).float()
+        if self.decode_actions:
+            out_action = self.action_names[out_action]
 
         return out_pose_3d, out_pose_2d, out_action, out_cam
 
@@ -112,3 +144,47 @@ class PoseTarget2D(Dataset):
     def __len__(self):
         return len(self._poses_2d)
 
+
+#############################################################
+# loader keeping the whole dataset on the training device
+#############################################################
+class DeviceBatchLoader(object):
+    """
+    replacement of torch DataLoader for datasets that fit on the training device.
+    items are whole-dataset tensors (moved to the device once) or python lists (e.g. decoded actions), all of the same length.
+    every epoch draws one permutation on the device and yields the batches as tuples in the order of items,
+    without worker processes, pinning or collate. slices (views) are yielded when not shuffling.
+    """
+    def __init__(self, items, batch_size, shuffle, device):
+        self.items = [item.to(device) if torch.is_tensor(item) else item for item in items]
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.device = device
+        self.num = len(self.items[0])
+        assert all(len(item) == self.num for item in self.items)
+
+    @classmethod
+    def from_pose_dataset(cls, dataset, batch_size, shuffle, device):
+        # same outputs as DataLoader(PoseDataSet): pose_3d, pose_2d, action, cam
+        actions = torch.from_numpy(dataset._actions)
+        if dataset.decode_actions:
+            actions = [dataset.action_names[code] for code in dataset._actions]
+        items = [torch.from_numpy(dataset._poses_3d).float(), torch.from_numpy(dataset._poses_2d).float(),
+                 actions, torch.from_numpy(dataset._cams)]
+        loader = cls(items, batch_size, shuffle, device)
+        loader.dataset = dataset  # e.g. for dataset.cam_table, as DataLoader.dataset
+        return loader
+
+    def __len__(self):
+        return (self.num + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        order = torch.randperm(self.num, device=self.device) if self.shuffle else None
+        has_list = any(not torch.is_tensor(item) for item in self.items)
+        for start in range(0, self.num, self.batch_size):
+            if order is None:
+                yield tuple(item[start:start + self.batch_size] for item in self.items)
+                continue
+            index = order[start:start + self.batch_size]
+            index_list = index.tolist() if has_list else None
+            yield tuple(item[index] if torch.is_tensor(item) else [item[i] for i in index_list] for item in self.items)
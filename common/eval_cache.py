@@ -0,0 +1,99 @@
+from __future__ import absolute_import, division
+
+import os.path as osp
+import re
+
+import numpy as np
+import torch
+
+from common.annotation_cache import save_cache, load_cache, source_signature
+from common.common_dataset import DatasetLoader_only_lifting
+from common.keypoint_export import keypoints_2d_files
+
+'''
+Evaluation tensor cache of the Human3.6M test set for the lifting network (run_evaluate_custom.py).
+
+The inputs and targets of DatasetLoader_only_lifting for one --keypoints source are materialized once
+    joint_img_ (normalized 2D input), joint_cam, joint_vis, root_cam, f, c, joint_img, action
+into one file of the annotation cache format (common/annotation_cache.py), which is memory-mapped by the
+next runs: no Human36M object is built and nothing is computed per sample, so a sweep over checkpoints
+only costs the forward passes.
+the cache is rebuilt when the annotations of the test subjects or the 2D keypoint files change, or when
+EVAL_CACHE_VERSION is increased (to be done with any change of the cached columns or of how they are computed).
+'''
+
+cache_dir = osp.join('./data/Human3.6M/cache')
+annot_path = osp.join('./data/Human3.6M/annotations')
+columns_order = ('joint_img_', 'joint_cam', 'joint_vis', 'root_cam', 'f', 'c', 'joint_img')
+test_subjects = (9, 11)  # Human36M('test').get_subject(), protocol 2
+EVAL_CACHE_VERSION = 1
+
+
+def eval_cache_path(keypoints):
+    return osp.join(cache_dir, 'Human36M_test_eval_{}.bin'.format(keypoints))
+
+
+def eval_source_files(keypoints):
+    # annotation files of the test subjects, then the 2D keypoint files
+    source_files = []
+    for subject in test_subjects:
+        for suffix in ('_data.json', '_camera.json', '_joint_3d.json'):
+            source_files.append(osp.join(annot_path, 'Human36M_subject' + str(subject) + suffix))
+    if keypoints != 'gt':
+        source_files += keypoints_2d_files(keypoints + '_valid')
+    return source_files
+
+
+def eval_cache_key(keypoints):
+    return {'version': EVAL_CACHE_VERSION, 'split': 'test', 'keypoints': keypoints,
+            'sources': source_signature(eval_source_files(keypoints))}
+
+
+def frame_actions(img_path):
+    # action code of every frame (index into Human36M.action_name) from the image directories, s_09_act_02_...
+    dir_action = np.array([int(re.search(r'act_(\d+)', d).group(1)) - 2 for d in img_path.dirs], dtype=np.int16)
+    return dir_action[np.asarray(img_path.dir_index)]
+
+
+def build_eval_cache(keypoints, load_workers=0):
+    from common.h36m_dataset_custom import Human36M
+    db = Human36M('test', load_workers=load_workers)
+    assert tuple(db.get_subject()) == test_subjects, 'test subjects {} instead of {}'.format(db.get_subject(), test_subjects)
+    dataset = DatasetLoader_only_lifting(db, ref_joints_name=None, is_train=False, transform=None, keypoints=keypoints,
+                                         precompute=True)
+    columns = dict(zip(columns_order, [a.numpy() for a in dataset.arrays]))
+    columns['action'] = frame_actions(db.data.column('img_path'))
+    columns['action_name'] = np.array(db.action_name)
+    path = eval_cache_path(keypoints)
+    print('==> Save the evaluation cache to ' + path)
+    save_cache(path, columns, len(dataset), eval_cache_key(keypoints))
+    return load_cache(path, eval_cache_key(keypoints))
+
+
+def load_eval_cache(keypoints, load_workers=0):
+    # (columns, num), memory-mapped. built from the test set on the first call
+    cached = load_cache(eval_cache_path(keypoints), eval_cache_key(keypoints))
+    if cached is not None:
+        print('==> Load the evaluation cache ' + eval_cache_path(keypoints))
+        return cached
+    return build_eval_cache(keypoints, load_workers)
+
+
+class EvalCacheLoader(object):
+    """
+    sequential batches of the evaluation cache, in the output order of DatasetLoader_only_lifting
+    (joint_img_, joint_cam, joint_vis, root_cam, f, c, joint_img), sliced from the memory-mapped columns.
+    """
+    def __init__(self, columns, num, batch_size):
+        self.columns = columns
+        self.num = num
+        self.batch_size = batch_size
+        self.actions = columns['action']
+        self.action_names = [str(name) for name in columns['action_name']]
+
+    def __len__(self):
+        return (self.num + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        for start in range(0, self.num, self.batch_size):
+            yield tuple(torch.from_numpy(np.array(self.columns[name][start:start + self.batch_size])) for name in columns_order)
@@ -5,6 +5,7 @@ import copy
 from common.skeleton import Skeleton
 from common.mocap_dataset import MocapDataset
 from common.camera import normalize_screen_coordinates
+from common.pose_archive import load_pose_data
 
 h36m_skeleton = Skeleton(parents=[-1, 0, 1, 2, 3, 4, 0, 6, 7, 8, 9, 0, 11, 12, 13, 14, 12,
                                   16, 17, 18, 19, 20, 19, 22, 12, 24, 25, 26, 27, 28, 27, 30],
@@ -256,7 +257,8 @@ class Human36mDataset(MocapDataset):
                                                    cam['tangential_distortion']))
 
         # Load serialized dataset
-        data = np.load(path, allow_pickle=True)['positions_3d'].item()
+        # from the memory-mapped archive next to path if one was converted (common.pose_archive)
+        data = load_pose_data(path, 'positions_3d')
 
         self._data = {}
         for subject, actions in data.items():
@@ -1,21 +1,27 @@
 import os
 import os.path as osp
-from pycocotools.coco import COCO
 import numpy as np
 import cv2
 import random
 import json
-from utils.data_utils import world2cam, cam2pixel, pixel2cam, process_bbox, cam2pixel_custom
+from multiprocessing import Pool
+from utils.data_utils import world2cam, cam2pixel, pixel2cam, process_bbox, cam2pixel_custom, process_bbox_batch
+from common.annotation_cache import source_signature, save_cache, load_cache
+from common.columnar_store import ColumnarStore, PathTable
 
 class Human36M:
     # if original -> 18 points as 3DMPPE
     # else -> 16 keypoints as PoseAug
-    def __init__(self, data_split, original=False):
+    def __init__(self, data_split, original=False, use_cache=True, vectorized=True, load_workers=0):
         print(f'==> {data_split} dataset of Human3.6M is being loaded..')
         self.original = original
         self.data_split = data_split
+        self.use_cache = use_cache
+        self.vectorized = vectorized # False -> project every frame one by one (reference path)
+        self.load_workers = load_workers # > 0 -> parse and project each subject in its own process
         self.img_dir = osp.join('./data/Human3.6M/images')
         self.annot_path = osp.join('./data/Human3.6M/annotations')
+        self.cache_dir = osp.join('./data/Human3.6M/cache')
         self.human_bbox_root_dir = osp.join('./data/bbox_root/bbox_root_human36m_output.json')
         # self.joint_num = 18 # original:17, but manually added 'Thorax'
         if original:
@@ -75,35 +81,54 @@ class Human36M:
         joint_coord = np.concatenate((joint_coord, thorax), axis=0)
         return joint_coord
 
+    def add_thorax_batch(self, joint_coord):
+        # joint_coord: (N, joint_num, 3)
+        thorax = (joint_coord[:, self.lshoulder_idx:self.lshoulder_idx+1, :] + joint_coord[:, self.rshoulder_idx:self.rshoulder_idx+1, :]) * 0.5
+        joint_coord = np.concatenate((joint_coord, thorax), axis=1)
+        return joint_coord
+
+    def get_source_files(self):
+        source_files = []
+        for subject in self.get_subject():
+            for suffix in ('_data.json', '_camera.json', '_joint_3d.json'):
+                source_files.append(osp.join(self.annot_path, 'Human36M_subject' + str(subject) + suffix))
+        return source_files
+
+    def get_cache_key(self):
+        # everything that changes the content of self.data
+        return {
+            'data_split': self.data_split,
+            'protocol': self.protocol,
+            'sampling_ratio': self.get_subsampling_ratio(),
+            'original': self.original,
+            'img_dir': self.img_dir,
+            'sources': source_signature(self.get_source_files()),
+        }
+
     def load_data(self):
+        if not self.use_cache:
+            return self.load_data_from_json()
+
+        cache_name = 'Human36M_{}_protocol{}_sample{}_{}.bin'.format(self.data_split, self.protocol, self.get_subsampling_ratio(),
+                                                                     'original' if self.original else 'custom')
+        cache_path = osp.join(self.cache_dir, cache_name)
+        key = self.get_cache_key()
+        cached = load_cache(cache_path, key)
+        if cached is not None:
+            print('==> Load data of H36M from the cache ' + cache_path)
+            columns, num = cached
+            return ColumnarStore.from_columns(columns, num)
+
+        data = self.load_data_from_json()
+        print('==> Save the cache of H36M to ' + cache_path)
+        save_cache(cache_path, data.to_columns(), len(data), key)
+        return data
+
+    def load_data_from_json(self):
         print('==> Load data of H36M Protocol ' + str(self.protocol))
 
         subject_list = self.get_subject()
-        sampling_ratio = self.get_subsampling_ratio()
         
-        # aggregate annotations from each subject
-        db = COCO()
-        cameras = {}
-        joints = {}
-        for subject in subject_list:
-            # data load
-            # print(os.path.abspath(__file__))
-            with open(osp.join(self.annot_path, 'Human36M_subject' + str(subject) + '_data.json'),'r') as f:
-                annot = json.load(f)
-            if len(db.dataset) == 0:
-                for k,v in annot.items():
-                    db.dataset[k] = v
-            else:
-                for k,v in annot.items():
-                    db.dataset[k] += v
-            # camera load
-            with open(osp.join(self.annot_path, 'Human36M_subject' + str(subject) + '_camera.json'),'r') as f:
-                cameras[str(subject)] = json.load(f)
-            # joint coordinate load
-            with open(osp.join(self.annot_path, 'Human36M_subject' + str(subject) + '_joint_3d.json'),'r') as f:
-                joints[str(subject)] = json.load(f)
-        db.createIndex()
-    
         # if self.data_split == 'test' and not True:
         #     print("Get bounding box and root from " + self.human_bbox_root_dir)
         #     bbox_root_result = {}
@@ -114,20 +139,115 @@ class Human36M:
         # else:
         print("==> Get bounding box and root from groundtruth")
 
+        if self.load_workers > 0 and len(subject_list) > 1:
+            # each worker only sends back the compact columns of its subject, never the parsed json
+            with Pool(min(self.load_workers, len(subject_list))) as pool:
+                stores = list(pool.imap(self.load_subject, subject_list))
+        else:
+            stores = [self.load_subject(subject) for subject in subject_list]
+        return ColumnarStore.concatenate(stores)
+
+    def load_subject(self, subject):
+        anns, imgs, cameras, joints = self.load_annotations(subject)
+        if self.vectorized:
+            return self.project_batch(anns, imgs, cameras, joints)
+        return self.project_per_frame(anns, imgs, cameras, joints)
+
+    def load_annotations(self, subject):
+        # annotations of one subject, joined to their images.
+        # the frames dropped by subsampling are filtered out before anything is indexed,
+        # so no COCO index is built over the whole subject
+        subject_list = self.get_subject()
+        sampling_ratio = self.get_subsampling_ratio()
+        # data load
+        with open(osp.join(self.annot_path, 'Human36M_subject' + str(subject) + '_data.json'),'r') as f:
+            annot = json.load(f)
+        imgs_kept = {}
+        for img in annot['images']:
+            # check subject and frame_idx
+            if img['subject'] not in subject_list:
+                continue
+            if img['frame_idx'] % sampling_ratio != 0:
+                continue
+            imgs_kept[img['id']] = img
+        anns, imgs = [], []
+        for ann in annot['annotations']:
+            img = imgs_kept.get(ann['image_id'])
+            if img is None:
+                continue
+            anns.append(ann)
+            imgs.append(img)
+        del annot
+
+        cameras = {}
+        joints = {}
+        # camera load
+        with open(osp.join(self.annot_path, 'Human36M_subject' + str(subject) + '_camera.json'),'r') as f:
+            cameras[str(subject)] = json.load(f)
+        # joint coordinate load
+        with open(osp.join(self.annot_path, 'Human36M_subject' + str(subject) + '_joint_3d.json'),'r') as f:
+            joints[str(subject)] = json.load(f)
+        return anns, imgs, cameras, joints
+
+    def project_batch(self, anns, imgs, cameras, joints):
+        # same result as project_per_frame, but every (subject, camera) group is projected with one matmul
+        num = len(anns)
+        if num == 0:
+            return ColumnarStore({}, 0)
+
+        subject = np.array([img['subject'] for img in imgs])
+        cam_idx = np.array([img['cam_idx'] for img in imgs])
+        img_width = np.array([img['width'] for img in imgs])
+        img_height = np.array([img['height'] for img in imgs])
+        joint_world = np.array([joints[str(img['subject'])][str(img['action_idx'])][str(img['subaction_idx'])][str(img['frame_idx'])] for img in imgs], dtype=np.float32)
+        joint_world = self.add_thorax_batch(joint_world)
+        joint_cam = np.empty_like(joint_world)
+        joint_img = np.empty_like(joint_world)
+        f = np.empty((num, 2), dtype=np.float32)
+        c = np.empty((num, 2), dtype=np.float32)
+
+        # project world coordinate to cam, image coordinate space
+        groups = np.unique(np.stack((subject, cam_idx), axis=1), axis=0)
+        for group_subject, group_cam in groups:
+            idx = np.nonzero((subject == group_subject) & (cam_idx == group_cam))[0]
+            cam_param = cameras[str(group_subject)][str(group_cam)]
+            R,t,f_cam,c_cam = np.array(cam_param['R'], dtype=np.float32), np.array(cam_param['t'], dtype=np.float32), np.array(cam_param['f'], dtype=np.float32), np.array(cam_param['c'], dtype=np.float32)
+            group_cam_coord = world2cam(joint_world[idx].reshape(-1, 3), R, t)
+            joint_cam[idx] = group_cam_coord.reshape(len(idx), -1, 3)
+            joint_img[idx] = cam2pixel_custom(group_cam_coord, f_cam, c_cam).reshape(len(idx), -1, 3)
+            f[idx] = f_cam
+            c[idx] = c_cam
+        joint_img[:, :, 2] = joint_img[:, :, 2] - joint_cam[:, self.root_idx, 2:3]
+        root_cam = joint_cam[:, self.root_idx]
+
+        bbox, valid = process_bbox_batch(np.array([ann['bbox'] for ann in anns]), img_width, img_height)
+
+        if not self.original:
+            joint_img = joint_img[:, self.joint_select]
+            joint_cam = joint_cam[:, self.joint_select]
+
+        keep = np.nonzero(valid)[0]
+        img_path = PathTable.from_strings([osp.join(self.img_dir, imgs[i]['file_name']) for i in keep])
+        return ColumnarStore({
+            'img_width' : img_width[keep],
+            'img_height' : img_height[keep],
+            'img_path': img_path,
+            'img_id': np.array([anns[i]['image_id'] for i in keep]),
+            'bbox': bbox[keep],
+            'joint_img': joint_img[keep], # [org_img_x, org_img_y, depth - root_depth]
+            'joint_cam': joint_cam[keep], # [X, Y, Z] in camera coordinate
+            'joint_vis': np.ones((len(keep), self.joint_num, 1)),
+            'root_cam': root_cam[keep], # [X, Y, Z] in camera coordinate
+            'f': f[keep],
+            'c': c[keep]}, len(keep))
+
+    def project_per_frame(self, anns, imgs, cameras, joints):
         data = []
-        for aid in db.anns.keys():
-            ann = db.anns[aid]
+        for ann, img in zip(anns, imgs):
             image_id = ann['image_id']
-            img = db.loadImgs(image_id)[0]
             img_path = osp.join(self.img_dir, img['file_name'])
             img_width, img_height = img['width'], img['height']
-        
-            # check subject and frame_idx
-            subject = img['subject']; frame_idx = img['frame_idx'];
-            if subject not in subject_list:
-                continue
-            if frame_idx % sampling_ratio != 0:
-                continue
+            subject = img['subject']
 
             # camera parameter
             cam_idx = img['cam_idx']
@@ -165,4 +285,4 @@ class Human36M:
                 'f': f,
                 'c': c})
         
-        return data
\ No newline at end of file
+        return ColumnarStore.from_records(data)
\ No newline at end of file
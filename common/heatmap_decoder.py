@@ -0,0 +1,58 @@
+from __future__ import absolute_import, division
+
+import torch
+
+'''
+Torch decoding of the 2D heatmaps (PeleeNet / SimpleBaseline) on the device of the model.
+
+get_max_preds of run_2d_save.py / run_visualize.py pulled the whole (B, J, H, W) heatmaps to the host
+and decoded them with numpy. decode_heatmaps does the same where the heatmaps are, so that only the
+(B, J, 3) keypoints [x, y, maxval] are copied to the host.
+'''
+
+
+def get_max_preds_torch(batch_heatmaps):
+    '''
+    same as get_max_preds (numpy): (preds (B, J, 2) float32, maxvals (B, J, 1)) in heatmap pixels,
+    preds is 0 where the maximum is not positive
+    '''
+    assert batch_heatmaps.dim() == 4, 'batch_images should be 4-ndim'
+    batch_size, num_joints, _, width = batch_heatmaps.shape
+    maxvals, idx = batch_heatmaps.reshape(batch_size, num_joints, -1).max(2, keepdim=True)
+    preds = torch.cat([idx % width, torch.div(idx, width, rounding_mode='floor')], 2).float()
+    preds = preds * (maxvals > 0.0).float()
+    return preds, maxvals
+
+
+def refine_subpixel(batch_heatmaps, preds):
+    # quarter offset towards the higher neighbour, for the maxima not on the border of the heatmap
+    batch_size, num_joints, height, width = batch_heatmaps.shape
+    px = preds[:, :, 0].long()
+    py = preds[:, :, 1].long()
+    inside = ((px > 1) & (px < width - 1) & (py > 1) & (py < height - 1)).unsqueeze(2)  # as hrnet get_final_preds
+    px = px.clamp(1, width - 2)
+    py = py.clamp(1, height - 2)
+
+    flat = batch_heatmaps.reshape(batch_size, num_joints, -1)
+
+    def at(y, x):
+        return flat.gather(2, (y * width + x).unsqueeze(2)).squeeze(2)
+
+    diff = torch.stack([at(py, px + 1) - at(py, px - 1), at(py + 1, px) - at(py - 1, px)], 2)
+    return preds + torch.where(inside, torch.sign(diff) * .25, torch.zeros_like(diff))
+
+
+def decode_heatmaps(batch_heatmaps, bbox=None, subpixel=False):
+    '''
+    keypoints (B, J, 3) [x, y, maxval] of the heatmaps (B, J, H, W), on their device.
+    with bbox (B, 4) [x, y, w, h], x and y are back-projected from the heatmap to the image (bbox) space
+    '''
+    preds, maxvals = get_max_preds_torch(batch_heatmaps)
+    if subpixel:
+        preds = refine_subpixel(batch_heatmaps, preds)
+    if bbox is not None:
+        heatmap_h, heatmap_w = batch_heatmaps.shape[2:]
+        bbox = bbox.to(preds.device, preds.dtype)
+        scale = torch.stack([bbox[:, 2] / heatmap_w, bbox[:, 3] / heatmap_h], 1).unsqueeze(1)
+        preds = preds * scale + bbox[:, None, :2]
+    return torch.cat([preds, maxvals.to(preds.dtype)], 2)
@@ -0,0 +1,122 @@
+from __future__ import print_function, absolute_import, division
+
+import time
+
+import numpy as np
+import torch
+
+'''
+Device-agnostic inference of the entry points (run_2d_save.py, run_visualize.py, run_evaluate_*.py,
+run_train_one_stage.py), for nodes with or without accelerators.
+
+    --device            auto (cuda if available, else cpu) / cuda / cpu
+    --num_threads       intra-op threads of the CPU kernels, 0: torch default (one per core)
+    --interop_threads   inter-op threads, 0: torch default
+    --channels_last     NHWC memory format for the image networks (PeleeNet, PoseResNet, ResPoseNet),
+                        the layout the CPU convolution kernels (oneDNN) are fastest with
+    --latency_report    latency per batch and throughput of the forward passes, printed at the end
+
+the forward passes run under inference_mode (torch.inference_mode, or no_grad for older torch):
+no autograd bookkeeping nor version counters on the outputs.
+'''
+
+
+def get_device(args):
+    name = getattr(args, 'device', 'auto')
+    if name == 'auto':
+        name = 'cuda' if torch.cuda.is_available() else 'cpu'
+    if name.startswith('cuda') and not torch.cuda.is_available():
+        raise RuntimeError('--device {} but no CUDA device is available (use --device cpu)'.format(name))
+    return torch.device(name)
+
+
+def configure_threads(args):
+    # to be called before the first parallel work (torch refuses to change the inter-op pool afterwards)
+    if getattr(args, 'num_threads', 0) > 0:
+        torch.set_num_threads(args.num_threads)
+    if getattr(args, 'interop_threads', 0) > 0:
+        try:
+            torch.set_num_interop_threads(args.interop_threads)
+        except RuntimeError:
+            print('==> Inter-op threads already started, --interop_threads ignored')
+    print('==> Threads: {} intra-op, {} inter-op'.format(torch.get_num_threads(), torch.get_num_interop_threads()))
+
+
+def synchronize(device):
+    # wait for the queued kernels, before reading a clock
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+
+
+def inference_mode():
+    if hasattr(torch, 'inference_mode'):
+        return torch.inference_mode()
+    return torch.no_grad()
+
+
+def prepare_model(model, device, channels_last=False):
+    # model on device, in NHWC if channels_last (image networks only)
+    if channels_last:
+        return model.to(device, memory_format=torch.channels_last)
+    return model.to(device)
+
+
+def prepare_input(img, device, channels_last=False):
+    # (B, C, H, W) image batch on device, in the memory format of prepare_model
+    img = img.to(device, non_blocking=True)
+    if channels_last:
+        img = img.contiguous(memory_format=torch.channels_last)
+    return img
+
+
+class LatencyMeter(object):
+    """
+    wall time of the forward passes, between start() and stop(num_frames).
+    CUDA is synchronized around every pass, the first warmup batches (allocator, cudnn / oneDNN
+    kernel selection) are not counted.
+    """
+    def __init__(self, device, name='forward', warmup=2, enabled=True):
+        self.device = device
+        self.name = name
+        self.warmup = warmup
+        self.enabled = enabled
+        self.latency = []
+        self.frames = []
+        self.seen = 0
+        self.begin = None
+
+    def start(self):
+        if self.enabled:
+            synchronize(self.device)
+            self.begin = time.perf_counter()
+
+    def stop(self, num_frames):
+        if not self.enabled:
+            return
+        synchronize(self.device)
+        elapsed = time.perf_counter() - self.begin
+        self.seen += 1
+        if self.seen > self.warmup:
+            self.latency.append(elapsed)
+            self.frames.append(num_frames)
+
+    def attach(self, model):
+        # times every forward pass of model (forward hooks), e.g. inside the evaluate functions
+        if self.enabled:
+            model.register_forward_pre_hook(lambda module, inputs: self.start())
+            model.register_forward_hook(lambda module, inputs, output: self.stop(len(inputs[0])))
+        return self
+
+    def report(self):
+        if not self.enabled:
+            return
+        if not self.latency:
+            print('==> {}: fewer than {} batches, no latency measured'.format(self.name, self.warmup + 1))
+            return
+        latency = np.array(self.latency) * 1e3
+        throughput = np.sum(self.frames) / np.sum(self.latency)
+        print('==> {} on {} ({} threads): {} batches of {:.0f} frames'.format(
+            self.name, self.device, torch.get_num_threads(), len(latency), np.mean(self.frames)))
+        print('{:>12s}{:>12s}{:>12s}{:>12s}{:>16s}'.format('mean (ms)', 'p50 (ms)', 'p95 (ms)', 'max (ms)', 'frames/s'))
+        print('{:>12.2f}{:>12.2f}{:>12.2f}{:>12.2f}{:>16.1f}'.format(
+            latency.mean(), np.percentile(latency, 50), np.percentile(latency, 95), latency.max(), throughput))
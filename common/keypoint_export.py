@@ -0,0 +1,131 @@
+from __future__ import absolute_import, division
+
+import json
+import os
+
+import numpy as np
+from torch.utils.data import DataLoader, Subset
+
+from common.annotation_cache import source_signature
+
+'''
+Streaming export of the 2D keypoints of a dataset split (run_2d_save.py, run_2d_detection_save.py).
+
+The keypoints [x, y, maxval] of every frame are written to a memory-mapped array preallocated for the
+whole split and indexed by dataset position,
+    {save_name}.partial.npy     (N, J, 3) float32
+    {save_name}.progress.json   frames done (always a whole number of chunks, or N), and what produced them:
+                                weight file (path, mtime and size), subpixel decoding, array shape
+the batches are buffered and flushed chunk by chunk, the progress is recorded after each flush.
+a restarted run with the same weights, decoding and number of frames skips the frames already done
+(see remaining_loader), otherwise it starts over.
+
+finalize writes the format read by DatasetLoader_only_lifting
+    'npz' : {save_name}.npz with x, y, maxval (N, J)
+    'npy' : {save_name}_x.npy / {save_name}_y.npy, memory-mappable
+and removes the partial files.
+'''
+
+
+class KeypointWriter(object):
+    def __init__(self, save_name, num, chunk_size=4096, weights=None, subpixel=False):
+        self.save_name = save_name
+        self.num = num
+        self.chunk_size = chunk_size
+        # what the keypoints depend on besides the dataset, a resumed export must match it
+        self.config = {'weights': weights, 'subpixel': bool(subpixel),
+                       'weights_signature': source_signature([weights]) if weights and os.path.isfile(weights) else None}
+        self.array_path = save_name + '.partial.npy'
+        self.progress_path = save_name + '.progress.json'
+        self.out = None
+        self.done = 0
+        self.buffer = []
+        self.buffered = 0
+
+        if os.path.isfile(self.progress_path) and os.path.isfile(self.array_path):
+            with open(self.progress_path) as f:
+                progress = json.load(f)
+            out = np.load(self.array_path, mmap_mode='r+')
+            if progress['num'] == num and progress.get('config') == self.config and progress.get('shape') == list(out.shape) \
+                    and out.shape[0] == num:
+                self.done = progress['done']
+                self.out = out
+                print('==> Resume the export of {} from frame {}/{}'.format(save_name, self.done, num))
+            else:
+                del out
+                print('==> Export of {} started with other weights, decoding or frames, starting over'.format(save_name))
+
+    def remaining_loader(self, loader):
+        # loader restricted to the frames not written yet (loader must not shuffle)
+        return loader_from(loader, self.done)
+
+    def write(self, keypoints, start=None):
+        # keypoints (B, J, 3) of the next frames. with start, the dataset position of keypoints[0]:
+        # the frames already written are skipped (writers resumed at different positions)
+        if start is not None:
+            position = self.done + self.buffered  # next frame to write
+            assert start <= position, 'Frames {} to {} are missing'.format(position, start)
+            keypoints = keypoints[position - start:]
+            if len(keypoints) == 0:
+                return
+        if self.out is None:
+            self.out = np.lib.format.open_memmap(self.array_path, mode='w+', dtype=np.float32,
+                                                 shape=(self.num,) + keypoints.shape[1:])
+        assert keypoints.shape[1:] == self.out.shape[1:], \
+            'Keypoints {} instead of {} of {} (remove it to start over)'.format(keypoints.shape[1:], self.out.shape[1:], self.array_path)
+        self.buffer.append(keypoints)
+        self.buffered += len(keypoints)
+        if self.buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffered == 0:
+            return
+        chunk = np.concatenate(self.buffer, axis=0)
+        self.out[self.done:self.done + len(chunk)] = chunk
+        self.out.flush()
+        self.done += len(chunk)
+        self.buffer, self.buffered = [], 0
+        with open(self.progress_path + '.tmp', 'w') as f:
+            json.dump({'num': self.num, 'done': self.done, 'chunk_size': self.chunk_size, 'config': self.config,
+                       'shape': list(self.out.shape)}, f)
+        os.replace(self.progress_path + '.tmp', self.progress_path)
+
+    def finalize(self, export_format='npz'):
+        self.flush()
+        assert self.done == self.num, 'Exported {} of {} frames'.format(self.done, self.num)
+        keypoints_2d = self.out
+        if export_format == 'npz':
+            np.savez(self.save_name, x=keypoints_2d[:, :, 0], y=keypoints_2d[:, :, 1], maxval=keypoints_2d[:, :, 2])
+        elif export_format == 'npy':
+            np.save(self.save_name + '_x.npy', keypoints_2d[:, :, 0])
+            np.save(self.save_name + '_y.npy', keypoints_2d[:, :, 1])
+        else:
+            raise KeyError('Invalid export format: {}'.format(export_format))
+        self.out = None
+        del keypoints_2d
+        os.remove(self.array_path)
+        os.remove(self.progress_path)
+
+
+def loader_from(loader, start):
+    # the frames of a (not shuffled) loader from dataset position start on
+    if start == 0:
+        return loader
+    return DataLoader(Subset(loader.dataset, range(start, len(loader.dataset))), batch_size=loader.batch_size,
+                      shuffle=False, num_workers=loader.num_workers, pin_memory=loader.pin_memory)
+
+
+def keypoints_2d_files(save_name):
+    # files of an exported split: the npz, or the npy pair
+    if os.path.isfile(save_name + '.npz'):
+        return [save_name + '.npz']
+    return [save_name + '_x.npy', save_name + '_y.npy']
+
+
+def load_keypoints_2d(save_name):
+    # (x, y), each (N, J), of an exported split. the npy pair is memory-mapped
+    if os.path.isfile(save_name + '.npz'):
+        keypoints_2d = np.load(save_name + '.npz')
+        return keypoints_2d['x'], keypoints_2d['y']
+    return np.load(save_name + '_x.npy', mmap_mode='r'), np.load(save_name + '_y.npy', mmap_mode='r')
@@ -8,6 +8,7 @@ import cv2
 import random
 import json
 from utils.data_utils import world2cam, cam2pixel, pixel2cam, process_bbox, cam2pixel_custom
+from common.columnar_store import ColumnarStore
 
 
 class MOBIS_DATASET:
@@ -92,4 +93,4 @@ class MOBIS_DATASET:
                 'segmentation' : segmentation,
             })
             
-        return data
\ No newline at end of file
+        return ColumnarStore.from_records(data)
\ No newline at end of file
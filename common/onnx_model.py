@@ -0,0 +1,95 @@
+from __future__ import print_function, absolute_import, division
+
+import inspect
+import os
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+'''
+ONNX export of the inference networks and their ONNX Runtime (CPU) counterpart.
+
+run_export_onnx.py serializes
+    the 2D estimator    pelee / resnet_{50,101,152}   (B, 3, 256, 256) -> heatmaps (B, J, 64, 64)
+    the lifting network mlp (LinearModel)             (B, 16, 2) -> (B, 16, 3)
+with a dynamic batch dimension, and checks every file against the PyTorch outputs (check_parity).
+
+OnnxModel runs an exported file in an ONNX Runtime session with the call interface of the torch model
+(torch.Tensor in, CPU torch.Tensor out), so that it can replace it as is: run_2d_save.py,
+run_2d_detection_save.py, run_evaluate_custom.py and run_evaluate_2d_only.py load it when the weight path
+(--path_2d, --paths_2d, --evaluate) is a .onnx file.
+
+onnx (export) and onnxruntime (OnnxModel) are optional, imported only by these functions.
+'''
+
+input_name = 'input'
+output_name = 'output'
+
+
+def export_onnx(model, example, path, opset_version=13):
+    # model (in eval mode, on the CPU) to path, the first dimension of the input and output is dynamic
+    model = model.cpu().eval()
+    kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        kwargs['dynamo'] = False  # TorchScript exporter, the one taking dynamic_axes
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(model, (example.cpu(),), path, input_names=[input_name], output_names=[output_name],
+                          dynamic_axes={input_name: {0: 'batch'}, output_name: {0: 'batch'}},
+                          opset_version=opset_version, do_constant_folding=True, **kwargs)
+    import onnx
+    onnx.checker.check_model(onnx.load(path))
+    return path
+
+
+def check_parity(model, path, frame_shape, batch_sizes=(1, 3), atol=1e-4, num_threads=0):
+    """
+    max absolute difference between the PyTorch model and the ONNX Runtime session of path on random
+    inputs (batch_size,) + frame_shape, for batch sizes other than the exported one.
+    raises AssertionError above atol
+    """
+    model = model.cpu().eval()
+    session = OnnxModel(path, num_threads=num_threads)
+    max_error = 0.
+    for batch_size in batch_sizes:
+        inputs = torch.randn((batch_size,) + tuple(frame_shape))
+        with torch.no_grad():
+            expected = model(inputs).numpy()
+        outputs = session(inputs).numpy()
+        assert outputs.shape == expected.shape, \
+            'Output shape {} of {} instead of {}'.format(outputs.shape, path, expected.shape)
+        max_error = max(max_error, float(np.abs(outputs - expected).max()))
+    assert max_error <= atol, 'ONNX Runtime and PyTorch outputs of {} differ by {:.3g} (> {:.3g})'.format(path, max_error, atol)
+    return max_error
+
+
+class OnnxModel(nn.Module):
+    """
+    exported network (export_onnx) run by ONNX Runtime on the CPU with the full graph optimizations.
+    inputs are reshaped to the exported frame shape (e.g. (B, 32) -> (B, 16, 2) for the lifting network),
+    outputs are CPU tensors.
+    """
+    def __init__(self, path, num_threads=0, interop_threads=0):
+        super(OnnxModel, self).__init__()
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        if interop_threads > 0:
+            options.inter_op_num_threads = interop_threads
+        self.path = path
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.frame_shape = tuple(self.session.get_inputs()[0].shape[1:])
+        print('==> ONNX Runtime session of {}'.format(path))
+
+    def forward(self, x):
+        x = x.detach().cpu().reshape((x.shape[0],) + self.frame_shape).float().contiguous()
+        return torch.from_numpy(self.session.run(None, {self.input_name: x.numpy()})[0])
+
+
+def is_onnx(path):
+    return path.endswith('.onnx')
@@ -0,0 +1,134 @@
+from __future__ import print_function, absolute_import, division
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from common.annotation_cache import source_signature
+
+'''
+Memory-mappable pose archive.
+
+The data_3d / data_2d npz files hold one pickled nested dict (subject -> action -> array, or list of arrays
+for the cameras of the 2D files) that every process decompresses and unpickles into its own memory.
+The archive keeps the same content uncompressed next to the npz
+
+    data/data_3d_h36m.npz  ->  data/data_3d_h36m.mmap/
+        index.json          subjects, actions, cameras and frame offsets of every sequence, metadata
+        positions_3d.npy    all sequences concatenated along the frames
+
+load_pose_archive maps the npy with np.load(mmap_mode='r') and returns the nested dict of read-only views,
+so loading is immediate and the pages are shared by all processes (e.g. DataLoader workers).
+load_pose_data reads the archive if it exists and was converted from the current npz (mtime and size
+recorded in index.json), and falls back to the npz otherwise.
+
+convert npz files with
+    python -m common.pose_archive data/data_3d_h36m.npz data/data_2d_h36m_gt.npz
+'''
+
+index_filename = 'index.json'
+
+
+def archive_path(npz_path):
+    return os.path.splitext(npz_path)[0] + '.mmap'
+
+
+def save_pose_archive(path, data, key, metadata=None, source=None):
+    """
+    data: subject -> action -> array (N, ...) or list of arrays (one per camera), all with the same frame shape
+    source: signature of the file data was read from (see archive_is_current)
+    """
+    sequences = []
+    num = 0
+    frame_shape, dtype = None, None
+    for subject in data.keys():
+        for action in data[subject].keys():
+            arrays = data[subject][action]
+            cameras = [None] if isinstance(arrays, np.ndarray) else list(range(len(arrays)))
+            for camera in cameras:
+                array = arrays if camera is None else arrays[camera]
+                if frame_shape is None:
+                    frame_shape, dtype = array.shape[1:], array.dtype
+                assert array.shape[1:] == frame_shape, 'Frame shape mismatch'
+                sequences.append({'subject': subject, 'action': action, 'camera': camera,
+                                  'start': num, 'stop': num + array.shape[0]})
+                num += array.shape[0]
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    # written sequence by sequence, the concatenation is never held in memory
+    out = np.lib.format.open_memmap(os.path.join(path, key + '.npy'), mode='w+', dtype=dtype,
+                                    shape=(num,) + tuple(frame_shape))
+    for seq in sequences:
+        arrays = data[seq['subject']][seq['action']]
+        out[seq['start']:seq['stop']] = arrays if seq['camera'] is None else arrays[seq['camera']]
+    out.flush()
+    del out
+
+    index = {'key': key, 'sequences': sequences, 'metadata': metadata, 'source': source}
+    with open(os.path.join(path, index_filename), 'w') as f:
+        json.dump(index, f, default=_to_json)
+
+
+def load_pose_archive(path, key):
+    # returns (data, metadata), data as the nested dict of the npz with read-only memory-mapped arrays
+    with open(os.path.join(path, index_filename)) as f:
+        index = json.load(f)
+    assert index['key'] == key, 'Archive {} holds {}, not {}'.format(path, index['key'], key)
+    frames = np.load(os.path.join(path, key + '.npy'), mmap_mode='r')
+
+    data = {}
+    for seq in index['sequences']:
+        actions = data.setdefault(seq['subject'], {})
+        array = frames[seq['start']:seq['stop']]
+        if seq['camera'] is None:
+            actions[seq['action']] = array
+        else:
+            actions.setdefault(seq['action'], []).append(array)
+    return data, index['metadata']
+
+
+def archive_is_current(npz_path):
+    # the archive of npz_path was converted from its current content (or the npz is not kept next to it)
+    with open(os.path.join(archive_path(npz_path), index_filename)) as f:
+        source = json.load(f).get('source')
+    if not os.path.isfile(npz_path):
+        return True
+    return source == source_signature([npz_path])
+
+
+def load_pose_data(npz_path, key):
+    # nested dict stored under key in npz_path, from its memory-mapped archive if one was converted from it
+    if os.path.isfile(os.path.join(archive_path(npz_path), index_filename)):
+        if archive_is_current(npz_path):
+            return load_pose_archive(archive_path(npz_path), key)[0]
+        print('==> {} was not converted from the current {}, reading the npz (convert it again with python -m common.pose_archive)'.format(
+            archive_path(npz_path), npz_path))
+    return np.load(npz_path, allow_pickle=True)[key].item()
+
+
+def convert_npz(npz_path):
+    npz = np.load(npz_path, allow_pickle=True)
+    key = 'positions_3d' if 'positions_3d' in npz.files else 'positions_2d'
+    metadata = npz['metadata'].item() if 'metadata' in npz.files else None
+    save_pose_archive(archive_path(npz_path), npz[key].item(), key, metadata, source=source_signature([npz_path]))
+    return archive_path(npz_path)
+
+
+def _to_json(obj):
+    # numpy scalars / arrays in the metadata
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(obj).__name__))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='convert pose npz files to memory-mappable archives')
+    parser.add_argument('npz', nargs='+', type=str, help='data_3d_*.npz / data_2d_*.npz files')
+    args = parser.parse_args()
+    for npz_path in args.npz:
+        print('Converting {} -> {}'.format(npz_path, convert_npz(npz_path)))
@@ -1,10 +1,13 @@
 from __future__ import print_function, absolute_import, division
 
 import argparse
+import hashlib
+import json
 import os
 import zipfile
 import numpy as np
 from glob import glob
+from multiprocessing import Pool
 from shutil import rmtree
 
 import sys
@@ -13,12 +16,137 @@ sys.path.append('../')
 
 from common.h36m_dataset import Human36mDataset
 from common.camera import world_to_camera, project_to_2d, image_coordinates
+from common.annotation_cache import source_signature
+from common.pose_archive import convert_npz
 from utils.utils import wrap
 
 output_filename = 'data_3d_h36m'
 output_filename_2d = 'data_2d_h36m_gt'
 subjects = ['S1', 'S5', 'S6', 'S7', 'S8', 'S9', 'S11']
 
+"""
+the raw files are converted by a process pool into one shard (.npy) per sequence under --shard-dir,
+    <shard-dir>/3d/<subject>/<action>.npy      (N, 32, 3) world positions in meters
+    <shard-dir>/2d/<subject>/<action>.npy      (C, N, J, 2) ground-truth 2D poses in pixels
+and the finished shards are recorded in <shard-dir>/manifest.json with the key of their input
+    3d : mtime and size of the source file
+    2d : key of the 3d shard and sha1 of the 3D positions and cameras it was projected from
+so a rerun only converts the shards missing or whose input changed.
+the shards are assembled into the npz files at the end, in the order of the source files as before
+(converted to memory-mapped archives with --mmap).
+"""
+
+
+class Manifest(object):
+    # completed shards {'shard': path, 'key': input key}, rewritten atomically after each one
+    def __init__(self, path):
+        self.path = path
+        self.done = {'3d': {}, '2d': {}}
+        if os.path.isfile(path):
+            with open(path) as f:
+                self.done = json.load(f)
+
+    def entry(self, kind, subject, action):
+        entry = self.done[kind].get(subject, {}).get(action)
+        if not isinstance(entry, dict) or not os.path.isfile(entry['shard']):
+            return None  # missing, or recorded by an older version of this script
+        return entry
+
+    def key(self, kind, subject, action):
+        entry = self.entry(kind, subject, action)
+        return None if entry is None else entry['key']
+
+    def shard(self, kind, subject, action, key):
+        # path of the shard if it was converted from the same input
+        entry = self.entry(kind, subject, action)
+        if entry is None or entry['key'] != key:
+            return None
+        return entry['shard']
+
+    def add(self, kind, subject, action, shard, key):
+        self.done[kind].setdefault(subject, {})[action] = {'shard': shard, 'key': key}
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(self.done, f, indent=1)
+        os.replace(self.path + '.tmp', self.path)
+
+
+def save_shard(shard, array):
+    if not os.path.isdir(os.path.dirname(shard)):
+        os.makedirs(os.path.dirname(shard), exist_ok=True)
+    with open(shard + '.tmp', 'wb') as f:
+        np.save(f, array)
+    os.replace(shard + '.tmp', shard)
+
+
+def convert_archive_file(task):
+    # preprocessed h5 of Martinez et al.
+    subject, action, f, shard = task
+    import h5py
+    with h5py.File(f) as hf:
+        positions = hf['3D_positions'].value.reshape(32, 3, -1).transpose(2, 0, 1)
+        positions /= 1000  # Meters instead of millimeters
+    save_shard(shard, positions.astype('float32'))
+    return subject, action, shard
+
+
+def convert_source_file(task):
+    # original cdf.mat
+    subject, action, f, shard = task
+    from scipy.io import loadmat
+    hf = loadmat(f)
+    positions = hf['data'][0, 0].reshape(-1, 32, 3)
+    positions /= 1000  # Meters instead of millimeters
+    save_shard(shard, positions.astype('float32'))
+    return subject, action, shard
+
+
+def project_sequence(task):
+    # ground-truth 2D poses of all cameras of one sequence
+    subject, action, positions, cameras, shard = task
+    positions_2d = []
+    for cam in cameras:
+        pos_3d = world_to_camera(positions, R=cam['orientation'], t=cam['translation'])
+        pos_2d = wrap(project_to_2d, True, pos_3d, cam['intrinsic'])
+        pos_2d_pixel_space = image_coordinates(pos_2d, w=cam['res_w'], h=cam['res_h'])
+        positions_2d.append(pos_2d_pixel_space.astype('float32'))
+    save_shard(shard, np.stack(positions_2d))
+    return subject, action, shard
+
+
+def positions_key(positions, cameras):
+    # sha1 of the inputs of project_sequence
+    sha = hashlib.sha1(np.ascontiguousarray(positions).tobytes())
+    for cam in cameras:
+        for name in ('orientation', 'translation', 'intrinsic', 'res_w', 'res_h'):
+            sha.update(np.ascontiguousarray(cam[name]).tobytes())
+    return sha.hexdigest()
+
+
+def run_tasks(pool, func, tasks, keys, manifest, kind):
+    # converts the tasks missing from the manifest or recorded with another key,
+    # records each shard as soon as it is written
+    todo = [(task, key) for task, key in zip(tasks, keys) if manifest.shard(kind, task[0], task[1], key) is None]
+    print('{} of {} sequences already converted'.format(len(tasks) - len(todo), len(tasks)))
+    todo_keys = {(task[0], task[1]): key for task, key in todo}
+    for i, (subject, action, shard) in enumerate(pool.imap_unordered(func, [task for task, _ in todo])):
+        manifest.add(kind, subject, action, shard, todo_keys[(subject, action)])
+        print('[{}/{}] {} {}'.format(i + 1, len(todo), subject, action))
+
+
+def shard_path(shard_dir, kind, subject, action):
+    return os.path.join(shard_dir, kind, subject, action + '.npy')
+
+
+def assemble(manifest, kind, tasks):
+    # nested dict of the shards of tasks, in the order of tasks (the order of the former single-process output)
+    output = {}
+    for task in tasks:
+        subject, action = task[0], task[1]
+        shard = np.load(manifest.entry(kind, subject, action)['shard'])
+        output.setdefault(subject, {})[action] = shard if kind == '3d' else list(shard)
+    return output
+
+
 if __name__ == '__main__':
     if os.path.basename(os.getcwd()) != 'data':
         print('This script must be launched from the "data" directory')
@@ -32,28 +160,38 @@ if __name__ == '__main__':
     # Alternatively, convert dataset from original source (the Human3.6M dataset path must be specified manually)
     parser.add_argument('--from-source', default='', type=str, metavar='PATH', help='convert original dataset')
 
+    parser.add_argument('--num-workers', default=os.cpu_count(), type=int, metavar='N', help='conversion processes')
+    parser.add_argument('--shard-dir', default='shards_h36m', type=str, metavar='PATH',
+                        help='per-sequence shards and manifest, kept to resume an interrupted conversion')
+    parser.add_argument('--mmap', action='store_true', help='also write the memory-mapped archives (common.pose_archive)')
+
     args = parser.parse_args()
 
     if args.from_archive and args.from_source:
         print('Please specify only one argument')
         exit(0)
 
-    if os.path.exists(output_filename + '.npz'):
+    if os.path.exists(output_filename + '.npz') and os.path.exists(output_filename_2d + '.npz'):
         print('The dataset already exists at', output_filename + '.npz')
         exit(0)
 
-    if args.from_archive:
-        print('Extracting Human3.6M dataset from', args.from_archive)
-        with zipfile.ZipFile(args.from_archive, 'r') as archive:
-            archive.extractall()
+    if not os.path.isdir(args.shard_dir):
+        os.makedirs(args.shard_dir)
+    manifest = Manifest(os.path.join(args.shard_dir, 'manifest.json'))
+    pool = Pool(args.num_workers)
 
-        print('Converting...')
-        output = {}
+    if os.path.exists(output_filename + '.npz'):
+        print('The dataset already exists at', output_filename + '.npz', ', computing the 2D poses only')
 
-        import h5py
+    elif args.from_archive:
+        if not os.path.isdir('h36m'):
+            print('Extracting Human3.6M dataset from', args.from_archive)
+            with zipfile.ZipFile(args.from_archive, 'r') as archive:
+                archive.extractall()
 
+        print('Converting...')
+        tasks = []
         for subject in subjects:
-            output[subject] = {}
             file_list = glob('h36m/' + subject + '/MyPoses/3D_positions/*.h5')
             assert len(file_list) == 30, "Expected 30 files for subject " + subject + ", got " + str(len(file_list))
             for f in file_list:
@@ -62,13 +200,11 @@ if __name__ == '__main__':
                 if subject == 'S11' and action == 'Directions':
                     continue  # Discard corrupted video
 
-                with h5py.File(f) as hf:
-                    positions = hf['3D_positions'].value.reshape(32, 3, -1).transpose(2, 0, 1)
-                    positions /= 1000  # Meters instead of millimeters
-                    output[subject][action] = positions.astype('float32')
+                tasks.append((subject, action, f, shard_path(args.shard_dir, '3d', subject, action)))
+        run_tasks(pool, convert_archive_file, tasks, [source_signature([task[2]]) for task in tasks], manifest, '3d')
 
         print('Saving...')
-        np.savez_compressed(output_filename, positions_3d=output)
+        np.savez_compressed(output_filename, positions_3d=assemble(manifest, '3d', tasks))
 
         print('Cleaning up...')
         rmtree('h36m')
@@ -77,12 +213,8 @@ if __name__ == '__main__':
 
     elif args.from_source:
         print('Converting original Human3.6M dataset from', args.from_source)
-        output = {}
-
-        from scipy.io import loadmat
-
+        tasks = []
         for subject in subjects:
-            output[subject] = {}
             file_list = glob(args.from_source + '/' + subject + '/MyPoseFeatures/D3_Positions/*.cdf.mat')
             assert len(file_list) == 30, "Expected 30 files for subject " + subject + ", got " + str(len(file_list))
             for f in file_list:
@@ -93,14 +225,11 @@ if __name__ == '__main__':
 
                 # Use consistent naming convention
                 canonical_name = action.replace('TakingPhoto', 'Photo').replace('WalkingDog', 'WalkDog')
-
-                hf = loadmat(f)
-                positions = hf['data'][0, 0].reshape(-1, 32, 3)
-                positions /= 1000  # Meters instead of millimeters
-                output[subject][canonical_name] = positions.astype('float32')
+                tasks.append((subject, canonical_name, f, shard_path(args.shard_dir, '3d', subject, canonical_name)))
+        run_tasks(pool, convert_source_file, tasks, [source_signature([task[2]]) for task in tasks], manifest, '3d')
 
         print('Saving...')
-        np.savez_compressed(output_filename, positions_3d=output)
+        np.savez_compressed(output_filename, positions_3d=assemble(manifest, '3d', tasks))
 
         print('Done.')
 
@@ -112,25 +241,27 @@ if __name__ == '__main__':
     print('')
     print('Computing ground-truth 2D poses...')
     dataset = Human36mDataset(output_filename + '.npz')
-    output_2d_poses = {}
+    tasks, keys = [], []
     for subject in dataset.subjects():
-        output_2d_poses[subject] = {}
         for action in dataset[subject].keys():
             anim = dataset[subject][action]
-
-            positions_2d = []
-            for cam in anim['cameras']:
-                pos_3d = world_to_camera(anim['positions'], R=cam['orientation'], t=cam['translation'])
-                pos_2d = wrap(project_to_2d, True, pos_3d, cam['intrinsic'])
-                pos_2d_pixel_space = image_coordinates(pos_2d, w=cam['res_w'], h=cam['res_h'])
-                positions_2d.append(pos_2d_pixel_space.astype('float32'))
-            output_2d_poses[subject][action] = positions_2d
+            tasks.append((subject, action, anim['positions'], anim['cameras'],
+                          shard_path(args.shard_dir, '2d', subject, action)))
+            keys.append({'3d': manifest.key('3d', subject, action), 'positions': positions_key(anim['positions'], anim['cameras'])})
+    run_tasks(pool, project_sequence, tasks, keys, manifest, '2d')
+    pool.close()
+    pool.join()
 
     print('Saving...')
     metadata = {
         'num_joints': dataset.skeleton().num_joints(),
         'keypoints_symmetry': [dataset.skeleton().joints_left(), dataset.skeleton().joints_right()]
     }
-    np.savez_compressed(output_filename_2d, positions_2d=output_2d_poses, metadata=metadata)
+    np.savez_compressed(output_filename_2d, positions_2d=assemble(manifest, '2d', tasks), metadata=metadata)
+
+    if args.mmap:
+        print('Writing memory-mapped archives...')
+        convert_npz(output_filename + '.npz')
+        convert_npz(output_filename_2d + '.npz')
 
     print('Done.')
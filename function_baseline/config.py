@@ -10,6 +10,8 @@ def get_parse_args():
     parser.add_argument('--keypoints', default='gt', type=str, metavar='NAME', help='2D detections to use, \
     gt/hr/cpn_ft_h36m_dbb/detectron_ft_h36m')
     parser.add_argument('--path_2d', default = '../final_state.pth.tar', type=str, help = 'weight path of the 2D estimation network')
+    parser.add_argument('--estimators', default='', type=str, help='2D estimators run together by run_2d_save.py (e.g. pelee,resnet_50,resnet_101), one export each')
+    parser.add_argument('--paths_2d', default='', type=str, help='weight paths of --estimators, comma separated in the same order')
     parser.add_argument('--pelee_imagenet_pretrain_path', default = 'data/Human3.6M/peleenet_acc7208.pth.tar', type=str, help = 'peleenet weight to finetune')
     parser.add_argument('--actions', default='*', type=str, metavar='LIST',
                         help='actions to train/test on, separated by comma, or * for all')
@@ -34,10 +36,15 @@ def get_parse_args():
     parser.add_argument('--dec_start', default=17, type=int, metavar='N', help='the first epoch to lr_decay')
     parser.add_argument('--dec_end', default=21, type=int, metavar='N', help='the last epoch to lr_decay')
     parser.add_argument('--dec_fac', default=10, type=int, metavar='N', help='the last epoch to lr_decay')
+    parser.add_argument('--device_augment', default=False, type=lambda x: (str(x).lower() == 'true'), help='warp / flip / color scale / occlusion of the training batches on the device instead of the loader workers. approximation: source regions larger than the 512 px canvas (large bboxes) are area-downsampled first, those patches are smoother than the per-sample path (a few grey levels on average, single pixels up to ~100 on textured images), the others match within 1 grey level')
     
     # Evaluate choice
     parser.add_argument('--evaluate', default='', type=str, metavar='FILENAME',
                         help='checkpoint to evaluate (file name)')
+    parser.add_argument('--evaluate_sweep', default='', type=str, metavar='PATTERNS',
+                        help='checkpoints to evaluate in one pass (comma separated files or globs)')
+    parser.add_argument('--sweep_workers', default=0, type=int, metavar='N', help='models evaluated concurrently in a sweep, 0: one per core')
+    parser.add_argument('--sweep_output', default='eval_sweep.json', type=str, metavar='PATH', help='json results of a sweep')
     parser.add_argument('--action-wise', default=True, type=lambda x: (str(x).lower() == 'true'), help='train s1only')
 
     # Model arguments
@@ -60,9 +67,34 @@ def get_parse_args():
     # Experimental setting
     parser.add_argument('--random_seed', type=int, default=0)
     parser.add_argument('--downsample', default=1, type=int, metavar='FACTOR', help='downsample frame rate by factor')
+    parser.add_argument('--cache_3d', default=False, type=lambda x: (str(x).lower() == 'true'),
+                        help='cache the camera space 3D poses next to the 3D dataset npz')
     parser.add_argument('--pretrain', default=False, type=lambda x: (str(x).lower() == 'true'), help='used in poseaug')
     parser.add_argument('--s1only', default=False, type=lambda x: (str(x).lower() == 'true'), help='train S1 only')
     parser.add_argument('--num_workers', default=2, type=int, metavar='N', help='num of workers for data loading')
+    parser.add_argument('--lifting_batch_mode', default=False, type=lambda x: (str(x).lower() == 'true'), help='precompute the lifting inputs/targets as tensors and load whole batches at once')
+    parser.add_argument('--device_loader', default=False, type=lambda x: (str(x).lower() == 'true'), help='keep the whole 2D-3D pose dataset on the training device and shuffle it there (no DataLoader workers)')
+    parser.add_argument('--subpixel_2d', default=False, type=lambda x: (str(x).lower() == 'true'), help='quarter pixel refinement of the decoded heatmap maxima')
+    parser.add_argument('--export_chunk', default=4096, type=int, metavar='N', help='frames per chunk of the 2D keypoint export (progress is saved after each chunk)')
+    parser.add_argument('--export_format', default='npz', type=str, help='format of the exported 2D keypoints: npz ({keypoints}_train/_valid.npz) or npy (memory-mappable _x/_y .npy pair)')
+    parser.add_argument('--eval_cache', default=False, type=lambda x: (str(x).lower() == 'true'), help='evaluate from the memory-mapped test set tensors (built by the first run) instead of the Human36M dataset')
+    parser.add_argument('--load_workers', default=0, type=int, metavar='N', help='num of processes parsing the Human3.6M annotations (one subject each), 0: sequential')
+
+    # Inference device (common/inference.py)
+    parser.add_argument('--device', default='auto', type=str, help='auto (cuda if available) / cuda / cpu')
+    parser.add_argument('--num_threads', default=0, type=int, metavar='N', help='intra-op threads of the CPU kernels, 0: torch default')
+    parser.add_argument('--interop_threads', default=0, type=int, metavar='N', help='inter-op threads, 0: torch default')
+    parser.add_argument('--channels_last', default=False, type=lambda x: (str(x).lower() == 'true'), help='NHWC memory format for the image networks (pelee / resnet / one_stage)')
+    parser.add_argument('--latency_report', default=False, type=lambda x: (str(x).lower() == 'true'), help='print the latency per batch and the throughput of the forward passes')
+
+    # ONNX export (run_export_onnx.py), .onnx files are run by ONNX Runtime where weights are expected
+    parser.add_argument('--onnx_dir', default='onnx', type=str, metavar='PATH', help='directory of the exported .onnx files')
+    parser.add_argument('--onnx_opset', default=13, type=int, metavar='N', help='ONNX opset version of the export')
+    parser.add_argument('--onnx_atol', default=1e-4, type=float, help='max abs difference between the ONNX Runtime and PyTorch outputs')
+
+    # Benchmark (run_benchmark_dataset.py)
+    parser.add_argument('--bench_loaders', default='only_lifting', type=str, help='dataset loaders to time, separated by comma: only_lifting/2d/3d_mppe/occlusion')
+    parser.add_argument('--bench_samples', default=2000, type=int, metavar='N', help='num of samples read per loader')
 
     args = parser.parse_args()
 
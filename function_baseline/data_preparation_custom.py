@@ -6,7 +6,9 @@ import numpy as np
 from torch.utils.data import DataLoader
 import torchvision.transforms as transforms
 
-from common.common_dataset import DatasetLoader, DatasetLoader_only_lifting
+from common.common_dataset import DatasetLoader, DatasetLoader_only_lifting, batch_sampler_loader
+from common.data_loader import DeviceBatchLoader
+from common.inference import get_device
 
 pixel_mean = (0.485, 0.456, 0.406)
 pixel_std = (0.229, 0.224, 0.225)
@@ -22,6 +24,7 @@ class Data_Custom(object):
         
     def data_preparation(self, args):
         print('==> Data preparation using 3DMPPE...')
+        device = get_device(args)
         
         path_3d = 'common.' + 'h36m_dataset_custom'
         exec('from ' + path_3d + ' import ' + 'Human36M')
@@ -29,58 +32,82 @@ class Data_Custom(object):
         # for just visualizing
         if self.vis:
             if self.original:
-                dataset_3d = DatasetLoader(eval('Human36M')('vis', True), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
+                dataset_3d = DatasetLoader(eval('Human36M')('vis', True, load_workers=args.load_workers), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
                                                                                                                         transforms.ToTensor()
                                                                                                                     , transforms.Normalize(mean=pixel_mean, std=pixel_std)]), vis=self.vis, detection_2d = self.detection_2d_save, args=args)
             else:
-                dataset_3d = DatasetLoader(eval('Human36M')('vis'), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
+                dataset_3d = DatasetLoader(eval('Human36M')('vis', load_workers=args.load_workers), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
                                                                                                                             transforms.ToTensor()
                                                                                                                             , transforms.Normalize(mean=pixel_mean, std=pixel_std)]), vis=self.vis, detection_2d = self.detection_2d_save, args=args)
             
-            loader = DataLoader(dataset_3d, batch_size=args.batch_size, shuffle=False, num_workers=args.num_workers, pin_memory=True)
+            loader = DataLoader(dataset_3d, batch_size=args.batch_size, shuffle=False, num_workers=args.num_workers, pin_memory=device.type == 'cuda')
             return loader
         # to save the results of the 2D detector
         if self.detection_2d_save:
             if self.is_train:
-                dataset_3d = DatasetLoader(eval('Human36M')('train'), ref_joints_name=None, is_train=True, transform=transforms.Compose([\
+                dataset_3d = DatasetLoader(eval('Human36M')('train', load_workers=args.load_workers), ref_joints_name=None, is_train=True, transform=transforms.Compose([\
                                                                                                                         transforms.ToTensor(),
                                                                                                                         transforms.Normalize(mean=pixel_mean, std=pixel_std)]), detection_2d=True, finetune=self.finetune)
             else:
-                dataset_3d = DatasetLoader(eval('Human36M')('test'), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
+                dataset_3d = DatasetLoader(eval('Human36M')('test', load_workers=args.load_workers), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
                                                                                                                         transforms.ToTensor()
                                                                                                                         , transforms.Normalize(mean=pixel_mean, std=pixel_std)]), detection_2d=True)
                 
             # finetune -> dataloader.shuffle = True
             if self.finetune:
-                train_loader = DataLoader(dataset_3d, batch_size=args.batch_size, shuffle=True, num_workers=args.num_workers, pin_memory=True)
-                valid_dataset_3d = DatasetLoader(eval('Human36M')('test'), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
+                train_loader = DataLoader(dataset_3d, batch_size=args.batch_size, shuffle=True, num_workers=args.num_workers, pin_memory=device.type == 'cuda')
+                valid_dataset_3d = DatasetLoader(eval('Human36M')('test', load_workers=args.load_workers), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
                                                                                                                         transforms.ToTensor()
                                                                                                                         , transforms.Normalize(mean=pixel_mean, std=pixel_std)]), detection_2d=True, finetune=self.finetune)
-                valid_loader = DataLoader(valid_dataset_3d, batch_size=args.batch_size, shuffle=False, num_workers=args.num_workers, pin_memory=True)
+                valid_loader = DataLoader(valid_dataset_3d, batch_size=args.batch_size, shuffle=False, num_workers=args.num_workers, pin_memory=device.type == 'cuda')
                 return {
                     'train_loader' : train_loader,
                     'valid_loader' : valid_loader
                 }
             else:
-                train_loader = DataLoader(dataset_3d, batch_size=args.batch_size, shuffle=False, num_workers=args.num_workers, pin_memory=True)
+                train_loader = DataLoader(dataset_3d, batch_size=args.batch_size, shuffle=False, num_workers=args.num_workers, pin_memory=device.type == 'cuda')
             return train_loader
 
         # train -> train loader & valid loader , valid -> None & valid_laoder
         if self.is_train:
-            train_dataset_3d = DatasetLoader_only_lifting(eval('Human36M')('train'), ref_joints_name=None, is_train=True, transform=transforms.Compose([\
+            train_dataset_3d = DatasetLoader_only_lifting(eval('Human36M')('train', load_workers=args.load_workers), ref_joints_name=None, is_train=True, transform=transforms.Compose([\
                                                                                                                     transforms.ToTensor(),
-                                                                                                                    transforms.Normalize(mean=pixel_mean, std=pixel_std)]), keypoints=args.keypoints)
+                                                                                                                    transforms.Normalize(mean=pixel_mean, std=pixel_std)]), keypoints=args.keypoints, precompute=args.lifting_batch_mode or args.device_loader)
         else:
             train_dataset_3d = None
 
-        valid_dataset_3d = DatasetLoader_only_lifting(eval('Human36M')('test'), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
+        valid_dataset_3d = DatasetLoader_only_lifting(eval('Human36M')('test', load_workers=args.load_workers), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
                                                                                                             transforms.ToTensor(),
-                                                                                                                    transforms.Normalize(mean=pixel_mean, std=pixel_std)]), keypoints=args.keypoints)
+                                                                                                                    transforms.Normalize(mean=pixel_mean, std=pixel_std)]), keypoints=args.keypoints, precompute=args.lifting_batch_mode or args.device_loader)
+        # the precomputed tensors are kept on the training device and shuffled there
+        if args.device_loader:
+            if self.is_train:
+                train_loader = DeviceBatchLoader(train_dataset_3d.arrays, args.batch_size, shuffle=True, device=device)
+            else:
+                train_loader = None
+            valid_loader = DeviceBatchLoader(valid_dataset_3d.arrays, int(args.batch_size / 8), shuffle=False, device=device)
+            return {
+                'train_loader' : train_loader,
+                'valid_loader' : valid_loader
+            }
+
+        # whole batches are sliced from the precomputed tensors, no per-sample calls nor collate
+        if args.lifting_batch_mode:
+            if self.is_train:
+                train_loader = batch_sampler_loader(train_dataset_3d, args.batch_size, shuffle=True, num_workers=args.num_workers, pin_memory=device.type == 'cuda')
+            else:
+                train_loader = None
+            valid_loader = batch_sampler_loader(valid_dataset_3d, int(args.batch_size / 8), shuffle=False, num_workers=args.num_workers, pin_memory=device.type == 'cuda')
+            return {
+                'train_loader' : train_loader,
+                'valid_loader' : valid_loader
+            }
+
         if self.is_train:
-            train_loader = DataLoader(train_dataset_3d, batch_size=args.batch_size, shuffle=True, num_workers=args.num_workers, pin_memory=True)
+            train_loader = DataLoader(train_dataset_3d, batch_size=args.batch_size, shuffle=True, num_workers=args.num_workers, pin_memory=device.type == 'cuda')
         else:
             train_loader = None
-        valid_loader = DataLoader(valid_dataset_3d, batch_size=int(args.batch_size / 8), shuffle=False, num_workers=args.num_workers, pin_memory=True)
+        valid_loader = DataLoader(valid_dataset_3d, batch_size=int(args.batch_size / 8), shuffle=False, num_workers=args.num_workers, pin_memory=device.type == 'cuda')
         
         return {
             'train_loader' : train_loader,
@@ -11,8 +11,8 @@ def soft_argmax(heatmaps):
     accu_x = heatmaps.sum(dim=(2))
     accu_y = heatmaps.sum(dim=(3))
 
-    accu_x = accu_x * torch.arange(out_x).float().cuda()[None,None,:]
-    accu_y = accu_y * torch.arange(out_y).float().cuda()[None,None,:]
+    accu_x = accu_x * torch.arange(out_x, dtype=torch.float32, device=heatmaps.device)[None,None,:]
+    accu_y = accu_y * torch.arange(out_y, dtype=torch.float32, device=heatmaps.device)[None,None,:]
     
     accu_x = accu_x.sum(dim=2, keepdim=True)
     accu_y = accu_y.sum(dim=2, keepdim=True)
@@ -46,6 +46,8 @@ def get_parse_args():
     # Experimental setting
     parser.add_argument('--random_seed', type=int, default=0)  # change this if GAN collapse
     parser.add_argument('--downsample', default=1, type=int, metavar='FACTOR', help='downsample frame rate by factor')
+    parser.add_argument('--cache_3d', default=False, type=lambda x: (str(x).lower() == 'true'),
+                        help='cache the camera space 3D poses next to the 3D dataset npz')
     parser.add_argument('--pretrain', default=True, type=lambda x: (str(x).lower() == 'true'), help='pretrain model')
     parser.add_argument('--s1only', default=False, type=lambda x: (str(x).lower() == 'true'), help='train S1 only')
     parser.add_argument('--num_workers', default=2, type=int, metavar='N', help='num of workers for data loading')
@@ -6,7 +6,7 @@ import numpy as np
 from torch.utils.data import DataLoader
 
 from common.data_loader import PoseDataSet, PoseBuffer, PoseTarget
-from utils.data_utils import fetch, read_3d_data, create_2d_data
+from utils.data_utils import PoseStore, read_3d_data, positions_3d_cache_path, create_2d_data, camera_table
 
 '''
 this code is used for prepare data loader
@@ -31,14 +31,15 @@ def data_preparation(args):
         raise KeyError('Invalid dataset')
 
     print('==> Loading 3D data...')
-    dataset = read_3d_data(dataset)
+    cache_path = positions_3d_cache_path(dataset_path) if args.cache_3d else None
+    dataset = read_3d_data(dataset, cache_path=cache_path, source_path=dataset_path)
 
     print('==> Loading 2D detections...')
     keypoints = create_2d_data(path.join('data', 'data_2d_' + args.dataset + '_' + args.keypoints + '.npz'), dataset)
 
     action_filter = None if args.actions == '*' else args.actions.split(',')
     if action_filter is not None:
-        action_filter = map(lambda x: dataset.define_actions(x)[0], action_filter)
+        action_filter = list(map(lambda x: dataset.define_actions(x)[0], action_filter))
         print('==> Selected actions: {}'.format(action_filter))
 
     stride = args.downsample
@@ -46,21 +47,21 @@ def data_preparation(args):
     ############################################
     # general 2D-3D pair dataset
     ############################################
-    poses_train, poses_train_2d, actions_train, cams_train = fetch(subjects_train, dataset, keypoints, action_filter,
-                                                        stride)
-    poses_valid, poses_valid_2d, actions_valid, cams_valid = fetch(subjects_test, dataset, keypoints, action_filter,
-                                                        stride)
+    cam_table, _ = camera_table(dataset)
+    store = PoseStore(dataset, keypoints)
+    poses_train, poses_train_2d, actions_train, cams_train = [[a] for a in store.fetch(subjects_train, action_filter, stride)]
+    poses_valid, poses_valid_2d, actions_valid, cams_valid = [[a] for a in store.fetch(subjects_test, action_filter, stride)]
     # prepare train loader for detected 2D.
-    train_det2d3d_loader = DataLoader(PoseDataSet(poses_train, poses_train_2d, actions_train, cams_train),
+    train_det2d3d_loader = DataLoader(PoseDataSet(poses_train, poses_train_2d, actions_train, cams_train, action_names=store.action_names, cam_table=cam_table),
                                       batch_size=args.batch_size,
                                       shuffle=True, num_workers=args.num_workers, pin_memory=True)
 
     # prepare train loader for GT 2D - 3D, which will update by using projection.
-    train_gt2d3d_loader = DataLoader(PoseDataSet(poses_train, poses_train_2d, actions_train, cams_train),
+    train_gt2d3d_loader = DataLoader(PoseDataSet(poses_train, poses_train_2d, actions_train, cams_train, action_names=store.action_names, cam_table=cam_table),
                                      batch_size=args.batch_size,
                                      shuffle=True, num_workers=args.num_workers, pin_memory=True)
 
-    valid_loader = DataLoader(PoseDataSet(poses_valid, poses_valid_2d, actions_valid, cams_valid),
+    valid_loader = DataLoader(PoseDataSet(poses_valid, poses_valid_2d, actions_valid, cams_valid, action_names=store.action_names, cam_table=cam_table),
                               batch_size=args.batch_size,
                               shuffle=False, num_workers=args.num_workers, pin_memory=True)
 
@@ -2,9 +2,10 @@ from __future__ import print_function, absolute_import, division
 
 import time
 
+import torch
 from torch.utils.data import DataLoader
 
-from common.camera import project_to_2d
+from common.camera import project_to_2d, expand_camera_params
 from common.data_loader import PoseDataSet, PoseTarget
 from models_poseaug.gan_generator import random_bl_aug
 from progress.bar import Bar
@@ -28,13 +29,16 @@ def dataloader_update(args, data_dict, device):
     buffer_poses_train_2d = []
     buffer_actions_train = []
     buffer_cams_train = []
+    cam_table = data_dict['train_gt2d3d_loader'].dataset.cam_table
+    cam_table_device = torch.from_numpy(cam_table).to(device)
     bar = Bar('Update training loader', max=len(data_dict['train_gt2d3d_loader']))
-    for i, (targets_3d, _, action, cam_param) in enumerate(data_dict['train_gt2d3d_loader']):
+    for i, (targets_3d, _, action, cam_idx) in enumerate(data_dict['train_gt2d3d_loader']):
         # Measure data loading time
         data_time.update(time.time() - end)
         num_poses = targets_3d.size(0)
 
-        targets_3d, cam_param = targets_3d.to(device), cam_param.to(device)
+        targets_3d = targets_3d.to(device)
+        cam_param = expand_camera_params(cam_idx, cam_table_device)
         # do bone length random swap argumentation.
         targets_3d = random_bl_aug(targets_3d)
 
@@ -43,8 +47,8 @@ def dataloader_update(args, data_dict, device):
 
         buffer_poses_train.append(targets_3d.detach().cpu().numpy())
         buffer_poses_train_2d.append(inputs_2d.detach().cpu().numpy())
-        buffer_actions_train.append(action)
-        buffer_cams_train.append(cam_param.detach().cpu().numpy())
+        buffer_actions_train.append(action)  # action codes of the current train dataset
+        buffer_cams_train.append(cam_idx.numpy())
 
         # Measure elapsed time
         batch_time.update(time.time() - end)
@@ -62,8 +66,10 @@ def dataloader_update(args, data_dict, device):
 
     # update all the poseaug train dataloader for stable training.
     print('==> Random Bone Length (S15678) swap completed')
+    action_names = data_dict['train_gt2d3d_loader'].dataset.action_names
     data_dict['train_gt2d3d_loader'] = DataLoader(PoseDataSet(buffer_poses_train, buffer_poses_train_2d,
-                                                              buffer_actions_train, buffer_cams_train),
+                                                              buffer_actions_train, buffer_cams_train,
+                                                              action_names=action_names, cam_table=cam_table),
                                                   batch_size=args.batch_size,
                                                   shuffle=True, num_workers=args.num_workers, pin_memory=True)
 
@@ -9,7 +9,7 @@ import torch.nn as nn
 from torch.autograd import Variable
 from torch.utils.data import DataLoader
 
-from common.camera import project_to_2d
+from common.camera import project_to_2d, expand_camera_params
 from common.data_loader import PoseDataSet
 from function_poseaug.poseaug_viz import plot_poseaug
 from progress.bar import Bar
@@ -225,8 +225,10 @@ def train_gan(args, poseaug_dict, data_dict, model_pos, criterion, fake_3d_sampl
     tmp_2d_pose_buffer_list = []
     tmp_camparam_buffer_list = []
 
+    cam_table = data_dict['train_gt2d3d_loader'].dataset.cam_table
+    cam_table_device = torch.from_numpy(cam_table).to(device)
     bar = Bar('Train pose gan', max=len(data_dict['train_gt2d3d_loader']))
-    for i, ((inputs_3d, _, _, cam_param), target_d2d, target_d3d) in enumerate(
+    for i, ((inputs_3d, _, _, cam_idx), target_d2d, target_d3d) in enumerate(
             zip(data_dict['train_gt2d3d_loader'], data_dict['target_2d_loader'], data_dict['target_3d_loader'])):
         lr_now = g_optimizer.param_groups[0]['lr']
 
@@ -242,7 +244,8 @@ def train_gan(args, poseaug_dict, data_dict, model_pos, criterion, fake_3d_sampl
         # Measure data loading time
         data_time.update(time.time() - end)
 
-        inputs_3d, cam_param = inputs_3d.to(device), cam_param.to(device)
+        inputs_3d = inputs_3d.to(device)
+        cam_param = expand_camera_params(cam_idx, cam_table_device)
         inputs_2d = project_to_2d(inputs_3d, cam_param)
 
         # poseaug: BA BL RT
@@ -310,7 +313,7 @@ def train_gan(args, poseaug_dict, data_dict, model_pos, criterion, fake_3d_sampl
         valid_rt_idx = torch.sum(outputs_2d_rt > 1, dim=(1, 2)) < 1
         tmp_3d_pose_buffer_list.append(outputs_3d_rt.detach()[valid_rt_idx].cpu().numpy())
         tmp_2d_pose_buffer_list.append(outputs_2d_rt.detach()[valid_rt_idx].cpu().numpy())
-        tmp_camparam_buffer_list.append(cam_param.detach()[valid_rt_idx].cpu().numpy())
+        tmp_camparam_buffer_list.append(cam_idx[valid_rt_idx.cpu()].numpy())
 
         # update writer iter num
         summary.summary_train_iter_num_update()
@@ -334,9 +337,10 @@ def train_gan(args, poseaug_dict, data_dict, model_pos, criterion, fake_3d_sampl
     ###################################
     # buffer loader will be used to save fake pose pair
     print('\nprepare buffer loader for train on fake pose')
+    num_fake = sum(len(cam_idx) for cam_idx in tmp_camparam_buffer_list)
     train_fake2d3d_loader = DataLoader(PoseDataSet(tmp_3d_pose_buffer_list, tmp_2d_pose_buffer_list,
-                                                   [['none'] * len(np.concatenate(tmp_camparam_buffer_list))],
-                                                   tmp_camparam_buffer_list),
+                                                   [np.zeros(num_fake, dtype=np.int16)],
+                                                   tmp_camparam_buffer_list, action_names=['none'], cam_table=cam_table),
                                        batch_size=args.batch_size,
                                        shuffle=True, num_workers=args.num_workers, pin_memory=True)
 
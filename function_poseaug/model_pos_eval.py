@@ -8,7 +8,6 @@ from torch.utils.data import DataLoader
 
 from common.data_loader import PoseDataSet
 from progress.bar import Bar
-from utils.data_utils import fetch
 from utils.loss import mpjpe, p_mpjpe, compute_PCK, compute_AUC
 from utils.utils import AverageMeter
 
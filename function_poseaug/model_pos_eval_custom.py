@@ -1,6 +1,7 @@
 from __future__ import print_function, absolute_import, division
 
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import torch
@@ -8,11 +9,11 @@ from torch.utils.data import DataLoader
 
 from common.data_loader import PoseDataSet
 from progress.bar import Bar
-from utils.data_utils import fetch
 from utils.loss import mpjpe, p_mpjpe, compute_PCK, compute_AUC
 from utils.utils import AverageMeter
 from data_extra.dataset_converter import COCO2HUMAN, MPII2HUMAN
-from run_visualize import get_max_preds
+from common.heatmap_decoder import decode_heatmaps
+from common.inference import inference_mode
 ####################################################################
 # ### evaluate p1 p2 pck auc dataset with test-flip-augmentation
 ####################################################################
@@ -35,7 +36,7 @@ def evaluate(data_loader, model_pos_eval, device, keypoints='gt', summary=None,
         num_poses = targets_3d.size(0)
         inputs_2d = joint_img[:, :, :2].to(device)
 
-        with torch.no_grad():
+        with inference_mode():
             if flipaug:  # flip the 2D pose Left <-> Right
                 joints_left = [4, 5, 6, 9, 10, 11]
                 joints_right = [1, 2, 3, 12, 13, 14]
@@ -83,6 +84,45 @@ def evaluate(data_loader, model_pos_eval, device, keypoints='gt', summary=None,
     bar.finish()
     return epoch_p1.avg, epoch_p2.avg
 
+def evaluate_multi(data_loader, models, device, num_workers=1):
+    """
+    evaluate() of several models in one pass over data_loader: every batch is moved to the device once
+    and given to all the models, concurrently on num_workers threads (the forward passes release the GIL).
+    returns [(p1, p2)] in the order of models
+    """
+    epoch_p1 = [AverageMeter() for _ in models]
+    epoch_p2 = [AverageMeter() for _ in models]
+    for model_pos_eval in models:
+        model_pos_eval.eval()
+
+    def run(k, inputs_2d, targets_3d):
+        num_poses = targets_3d.size(0)
+        with inference_mode():
+            outputs_3d = models[k](inputs_2d.view(num_poses, -1)).view(num_poses, -1, 3).cpu()
+        outputs_3d = outputs_3d[:, :, :] - outputs_3d[:, :1, :]
+        epoch_p1[k].update(mpjpe(outputs_3d, targets_3d).item() * 1000.0, num_poses)
+        epoch_p2[k].update(p_mpjpe(outputs_3d.numpy(), targets_3d.numpy()).item() * 1000.0, num_poses)
+
+    pool = ThreadPoolExecutor(num_workers) if num_workers > 1 else None
+    bar = Bar('Eval {} posenets'.format(len(models)), max=len(data_loader))
+    for i, temp in enumerate(data_loader):
+        joint_img, targets_3d = temp[0], temp[1]
+        inputs_2d = joint_img[:, :, :2].to(device)
+        # caculate the relative position.
+        targets_3d = targets_3d[:, :, :] - targets_3d[:, :1, :]  # the output is relative to the 0 joint
+        if pool is None:
+            for k in range(len(models)):
+                run(k, inputs_2d, targets_3d)
+        else:
+            list(pool.map(lambda k: run(k, inputs_2d, targets_3d), range(len(models))))
+        bar.suffix = '({batch}/{size}) | Total: {ttl:} | ETA: {eta:}'.format(batch=i + 1, size=len(data_loader),
+                                                                         ttl=bar.elapsed_td, eta=bar.eta_td)
+        bar.next()
+    bar.finish()
+    if pool is not None:
+        pool.shutdown()
+    return [(p1.avg, p2.avg) for p1, p2 in zip(epoch_p1, epoch_p2)]
+
 def evaluate_2d(data_loader, model_pos_eval, device, keypoints='gt', summary=None, writer=None, key='', tag='', flipaug=''):
     batch_time = AverageMeter()
     data_time = AverageMeter()
@@ -102,7 +142,7 @@ def evaluate_2d(data_loader, model_pos_eval, device, keypoints='gt', summary=Non
         num_poses = targets_3d.size(0)
         inputs_2d = joint_img[:, :, :2].to(device).clone()
 
-        with torch.no_grad():
+        with inference_mode():
             if flipaug:  # flip the 2D pose Left <-> Right
                 joints_left = [4, 5, 6, 9, 10, 11]
                 joints_right = [1, 2, 3, 12, 13, 14]
@@ -168,13 +208,11 @@ def evaluate_only_2d(data_loader, estimator, device, keypoints='gt', summary=Non
         data_time.update(time.time() - end)
         num_poses = joint_img.size(0)
 
-        with torch.no_grad():
+        with inference_mode():
             if (keypoints == 'pelee') or ('resnet' in keypoints):
-                # inference
-                outputs_heatmaps = estimator(img_patch).cpu().numpy()
-                # to original space
-                hmap_h, hmap_w = outputs_heatmaps.shape[-2:]
-                pred = get_max_preds(outputs_heatmaps)
+                # inference, decoded to the original space on the device
+                outputs_heatmaps = estimator(img_patch)
+                pred = decode_heatmaps(outputs_heatmaps, bbox)[:, :, :2].cpu().numpy()
                 # keypoint transformation
                 if keypoints == 'pelee':
                     pred = COCO2HUMAN(pred)
@@ -185,13 +223,12 @@ def evaluate_only_2d(data_loader, estimator, device, keypoints='gt', summary=Non
                 else:
                     raise NotImplementedError("Not supported")
             elif keypoints == 'one_stage':
-                pred = estimator(img_patch_not_norm).cpu().numpy()
+                pred = estimator(img_patch_not_norm.to(device)).cpu().numpy()
                 pred = pred[:, [0, 1, 2, 3, 4, 5, 6, 7, 10, 11, 12, 13, 14, 15, 16, 17], :]
                 eval_joint = [0,1,2,3,4,5,6,7,8,9,10,11,12,13,14]
-            
-            # to original coordinate
-            pred[:, :, 0] = pred[:, :, 0] * bbox[:, 2:3].numpy() / 64 + bbox[:, :1].numpy()
-            pred[:, :, 1] = pred[:, :, 1] * bbox[:, 3:].numpy() / 64 + bbox[:, 1:2].numpy()
+                # to original coordinate
+                pred[:, :, 0] = pred[:, :, 0] * bbox[:, 2:3].numpy() / 64 + bbox[:, :1].numpy()
+                pred[:, :, 1] = pred[:, :, 1] * bbox[:, 3:].numpy() / 64 + bbox[:, 1:2].numpy()
             
             # to 3D (each points' depth is same as GT)
             pred [:, :, 0] = (pred[:, :, 0] - c[:, :1]) / f[:, :1] * joint_cam[:, :, 2]
@@ -227,9 +264,10 @@ def evaluate_3d_mppe(data_loader, model_pos_eval, device, summary=None, writer=N
     output = []
     target = []
     bar = Bar('Eval posenet on {}'.format(key), max=len(data_loader))
-    with torch.no_grad():
+    with inference_mode():
         for i, temp in enumerate(data_loader):
             img_patch, targets_3d, bbox, f, c, root_cam, _ = temp
+            img_patch = img_patch.to(device)
             bbox, root_cam = bbox.to(device), root_cam.to(device)
             # inferencing
             output_coord = model_pos_eval(img_patch)
@@ -280,9 +318,10 @@ def evaluate_3d_mppe_2d(data_loader, model_pos_eval, device, summary=None, write
     output = []
     target = []
     bar = Bar('Eval posenet on {}'.format(key), max=len(data_loader))
-    with torch.no_grad():
+    with inference_mode():
         for i, temp in enumerate(data_loader):
             img_patch, targets_3d, bbox, f, c, root_cam, joint_img = temp
+            img_patch = img_patch.to(device)
             bbox, root_cam = bbox.to(device), root_cam.to(device)
             # inferencing
             output_coord = model_pos_eval(img_patch)
@@ -325,9 +364,10 @@ def evluate_MOBIS_2d(data_loader, model_pos_eval, device, summary=None, writer=N
     target_depth = []
     
     bar = Bar('Eval posenet on {}'.format(key), max=len(data_loader))
-    with torch.no_grad():
+    with inference_mode():
         for i, temp in enumerate(data_loader):
             img_patch, joint_img, joint_vis, bbox = temp
+            img_patch = img_patch.to(device)
             bbox, joint_vis, joint_img = bbox.to(device), joint_vis.to(device), joint_img.to(device)
             # inferencing
             output_coord = model_pos_eval(img_patch)
@@ -18,13 +18,17 @@ import torch
 from torch.utils.data import Dataset
 
 from utils.transforms import get_affine_transform
-from utils.transforms import affine_transform
 from utils.transforms import fliplr_joints
 
 
 logger = logging.getLogger(__name__)
 
 
+def affine_transform_batch(pts, t):
+    # utils.transforms.affine_transform of all points at once. pts: (N, 2), t: (2, 3)
+    return np.dot(pts, t[:, :2].T) + t[:, 2]
+
+
 class JointsDataset(Dataset):
     def __init__(self, cfg, root, image_set, is_train, transform=None):
         self.num_joints = 0
@@ -174,9 +178,8 @@ class JointsDataset(Dataset):
         if self.transform:
             input = self.transform(input)
 
-        for i in range(self.num_joints):
-            if joints_vis[i, 0] > 0.0:
-                joints[i, 0:2] = affine_transform(joints[i, 0:2], trans)
+        visible = joints_vis[:, 0] > 0.0
+        joints[visible, 0:2] = affine_transform_batch(joints[visible, 0:2], trans)
 
         target, target_weight = self.generate_target(joints, joints_vis)
 
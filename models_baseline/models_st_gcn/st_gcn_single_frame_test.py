@@ -62,11 +62,12 @@ class Model_defaultDropout(nn.Module):
         # original graph
         self.graph = st_gcn_Graph(self.layout, self.strategy, pad=self.pad)
         # get adjacency matrix of K clusters
-        self.A = torch.tensor(self.graph.A, dtype=torch.float32, requires_grad=False).cuda()  # K, T*V, T*V
+        # buffers (not saved in the state_dict), they follow the module to its device
+        self.register_buffer('A', torch.tensor(self.graph.A, dtype=torch.float32), persistent=False)  # K, T*V, T*V
 
         # pooled graph
         self.graph_pool = st_gcn_Graph_pool(self.layout, self.strategy, pad=self.pad)
-        self.A_pool = torch.tensor(self.graph_pool.A, dtype=torch.float32, requires_grad=False).cuda()
+        self.register_buffer('A_pool', torch.tensor(self.graph_pool.A, dtype=torch.float32), persistent=False)
 
         # build networks
         kernel_size = self.A.size(0)
@@ -158,7 +159,7 @@ class Model_defaultDropout(nn.Module):
         x_up_sub = self.conv2(x_up_sub)  # N, C, T, 5
 
         # upsample
-        x_up = torch.zeros((N * M, fc_out, T, V)).cuda()
+        x_up = torch.zeros((N * M, fc_out, T, V), device=x.device)
         for i in range(len(self.graph.part)):
             num_node = len(self.graph.part[i])
             x_up[:, :, :, self.graph.part[i]] = x_up_sub[:, :, :, i].unsqueeze(-1).repeat(1, 1, 1, num_node)
@@ -218,11 +219,12 @@ class Model(nn.Module):
         # original graph
         self.graph = st_gcn_Graph(self.layout, self.strategy, pad=self.pad)
         # get adjacency matrix of K clusters
-        self.A = torch.tensor(self.graph.A, dtype=torch.float32, requires_grad=False).cuda()  # K, T*V, T*V
+        # buffers (not saved in the state_dict), they follow the module to its device
+        self.register_buffer('A', torch.tensor(self.graph.A, dtype=torch.float32), persistent=False)  # K, T*V, T*V
 
         # pooled graph
         self.graph_pool = st_gcn_Graph_pool(self.layout, self.strategy, pad=self.pad)
-        self.A_pool = torch.tensor(self.graph_pool.A, dtype=torch.float32, requires_grad=False).cuda()
+        self.register_buffer('A_pool', torch.tensor(self.graph_pool.A, dtype=torch.float32), persistent=False)
 
         # build networks
         kernel_size = self.A.size(0)
@@ -314,7 +316,7 @@ class Model(nn.Module):
         x_up_sub = self.conv2(x_up_sub)  # N, C, T, 5
 
         # upsample
-        x_up = torch.zeros((N * M, fc_out, T, V)).cuda()
+        x_up = torch.zeros((N * M, fc_out, T, V), device=x.device)
         for i in range(len(self.graph.part)):
             num_node = len(self.graph.part[i])
             x_up[:, :, :, self.graph.part[i]] = x_up_sub[:, :, :, i].unsqueeze(-1).repeat(1, 1, 1, num_node)
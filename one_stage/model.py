@@ -140,9 +140,9 @@ def soft_argmax(heatmaps, joint_num):
     accu_y = heatmaps.sum(dim=(2,4))
     accu_z = heatmaps.sum(dim=(3,4))
 
-    accu_x = accu_x * torch.arange(output_shape[1]).float().cuda()[None,None,:]
-    accu_y = accu_y * torch.arange(output_shape[0]).float().cuda()[None,None,:]
-    accu_z = accu_z * torch.arange(depth_dim).float().cuda()[None,None,:]
+    accu_x = accu_x * torch.arange(output_shape[1], dtype=torch.float32, device=heatmaps.device)[None,None,:]
+    accu_y = accu_y * torch.arange(output_shape[0], dtype=torch.float32, device=heatmaps.device)[None,None,:]
+    accu_z = accu_z * torch.arange(depth_dim, dtype=torch.float32, device=heatmaps.device)[None,None,:]
 
     accu_x = accu_x.sum(dim=2, keepdim=True)
     accu_y = accu_y.sum(dim=2, keepdim=True)
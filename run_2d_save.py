@@ -1,5 +1,6 @@
 from __future__ import print_function, absolute_import, division
 
+import copy
 import datetime
 import os
 import os.path as path
@@ -17,6 +18,10 @@ from function_baseline.model_pose_train_custom import train
 from function_poseaug.model_pos_eval_custom import evaluate
 from pelee.lib.models.MOBIS_peleenet import get_pose_pelee_net
 from common import get_resnet
+from common.heatmap_decoder import decode_heatmaps, get_max_preds_torch
+from common.inference import get_device, configure_threads, inference_mode, prepare_model, prepare_input, LatencyMeter
+from common.keypoint_export import KeypointWriter, loader_from
+from common.onnx_model import OnnxModel, is_onnx
 from utils.log import Logger, savefig
 from utils.utils import save_ckpt
 import cv2
@@ -34,63 +39,133 @@ pixel_std = (0.229, 0.224, 0.225)
 
 def main(args):
     print('==> Using settings {}'.format(args))
-    device = torch.device("cuda")
+    device = get_device(args)
+    configure_threads(args)
 
     print('==> Loading dataset...')
     data_class = Data_Custom(is_train = args.is_train, detection_2d=True)
     loader = data_class.data_preparation(args)
     
-    if 'pelee' == args.keypoints:
-        print("==> Creating 2D pose estimation model...")
-        estimator_2d = get_pose_pelee_net(is_train=False).cuda()
-        estimator_2d.load_state_dict(torch.load(args.path_2d, map_location='cpu'))
-    elif 'resnet' in args.keypoints:
-        print("==> Creating 2D pose estimation model...")
-        estimator_2d = get_resnet(args).cuda()
-        estimator_2d.load_state_dict(torch.load(args.path_2d, map_location='cpu'))
-    estimator_2d.eval()
+    estimator_2d = build_estimator_2d(args, args.keypoints, args.path_2d, device)
     
     #################################################
     # ########## start inferencing
     #################################################
     print("==> Inferencing...")
-    keypoints_2d = []
-    with torch.no_grad():
+    if args.is_train:
+        save_name = args.keypoints + '_train'
+    else:
+        save_name = args.keypoints + '_valid'
+    # written chunk by chunk to a memory-mapped file, a restarted run continues after the last chunk
+    writer = KeypointWriter(save_name, len(loader.dataset), chunk_size=args.export_chunk, weights=args.path_2d,
+                            subpixel=args.subpixel_2d)
+    loader = writer.remaining_loader(loader)
+    meter = LatencyMeter(device, args.keypoints, enabled=args.latency_report)
+    with inference_mode():
         # data loading
         bar = Bar('2D save', max=len(loader))
         for i, temp in enumerate(loader):
             img_patch, joint_img, joint_cam, joint_vis, bbox, img_width, img_height = temp
-            img_patch = img_patch.to(device)
+            img_patch = prepare_input(img_patch, device, args.channels_last)
             
             # inferencing
+            meter.start()
             output_heatmaps = estimator_2d(img_patch)
-            heatmap_h, heatmap_w = output_heatmaps.shape[2:]
+            meter.stop(len(img_patch))
             
             # save_batch_heatmaps(img_patch, output_heatmaps, 'heatmap.jpg') # activate to save heatmap images
             
             # to keypoints
-            detected_2d = get_max_preds(output_heatmaps.cpu().numpy())
-            detected_2d[:, :, 0] = detected_2d[:, :, 0] * bbox[:, 2:3].cpu().numpy() / heatmap_h + bbox[:, :1].cpu().numpy()
-            detected_2d[:, :, 1] = detected_2d[:, :, 1] * bbox[:, 3:].cpu().numpy() / heatmap_w + bbox[:, 1:2].cpu().numpy()
+            # decoded and back-projected to the image on the device, only (B, J, 3) [x, y, maxval] is copied
+            detected_2d = decode_heatmaps(output_heatmaps, bbox, subpixel=args.subpixel_2d).cpu().numpy()
             
-            keypoints_2d.append(detected_2d)
+            writer.write(detected_2d)
             
             bar.suffix = 'Processing '
             bar.next()
         bar.finish()
-    keypoints_2d = np.concatenate(keypoints_2d, axis=0)
-    
-    if args.is_train:
-        save_name = args.keypoints + '_train'
+    meter.report()
+    writer.finalize(args.export_format)
+
+def build_estimator_2d(args, keypoints, path_2d, device):
+    # pelee or resnet_{50,101,152}, with the weights of path_2d, on device
+    print("==> Creating 2D pose estimation model {}...".format(keypoints))
+    if is_onnx(path_2d):
+        # exported by run_export_onnx.py, run by ONNX Runtime on the CPU
+        return OnnxModel(path_2d, args.num_threads, args.interop_threads)
+    if 'pelee' == keypoints:
+        estimator_2d = get_pose_pelee_net(is_train=False)
+    elif 'resnet' in keypoints:
+        model_args = copy.copy(args)
+        model_args.keypoints = keypoints
+        estimator_2d = get_resnet(model_args)
     else:
-        save_name = args.keypoints + '_valid'
-    np.savez_compressed(save_name, x = keypoints_2d[:, :, 0], y = keypoints_2d[:, :, 1])
+        raise KeyError('Invalid 2D estimator: {}'.format(keypoints))
+    estimator_2d.load_state_dict(torch.load(path_2d, map_location='cpu'))
+    estimator_2d = prepare_model(estimator_2d, device, args.channels_last)
+    estimator_2d.eval()
+    return estimator_2d
+
+def main_multi(args):
+    """
+    --estimators pelee,resnet_50,... with --paths_2d of the same length:
+    every batch of the dataset is decoded and cropped once and given to all the estimators,
+    one {estimator}_train / _valid export per estimator
+    """
+    print('==> Using settings {}'.format(args))
+    device = get_device(args)
+    configure_threads(args)
+
+    names = args.estimators.split(',')
+    paths_2d = args.paths_2d.split(',')
+    assert len(names) == len(paths_2d), '--paths_2d needs one weight file per estimator'
+
+    print('==> Loading dataset...')
+    data_class = Data_Custom(is_train = args.is_train, detection_2d=True)
+    loader = data_class.data_preparation(args)
+
+    estimators = [build_estimator_2d(args, name, path_2d, device) for name, path_2d in zip(names, paths_2d)]
+
+    print("==> Inferencing...")
+    suffix = '_train' if args.is_train else '_valid'
+    writers = [KeypointWriter(name + suffix, len(loader.dataset), chunk_size=args.export_chunk, weights=path_2d,
+                              subpixel=args.subpixel_2d) for name, path_2d in zip(names, paths_2d)]
+    # from the first frame missing in any export, the others skip what they already have
+    start = min(writer.done for writer in writers)
+    loader = loader_from(loader, start)
+    meters = [LatencyMeter(device, name, enabled=args.latency_report) for name in names]
+    with inference_mode():
+        bar = Bar('2D save', max=len(loader))
+        for i, temp in enumerate(loader):
+            img_patch, joint_img, joint_cam, joint_vis, bbox, img_width, img_height = temp
+            img_patch = prepare_input(img_patch, device, args.channels_last)
+            
+            for estimator_2d, writer, meter in zip(estimators, writers, meters):
+                if writer.done + writer.buffered >= start + len(img_patch):
+                    continue
+                meter.start()
+                output_heatmaps = estimator_2d(img_patch)
+                meter.stop(len(img_patch))
+                detected_2d = decode_heatmaps(output_heatmaps, bbox, subpixel=args.subpixel_2d).cpu().numpy()
+                writer.write(detected_2d, start=start)
+            start += len(img_patch)
+            
+            bar.suffix = 'Processing '
+            bar.next()
+        bar.finish()
+    for meter in meters:
+        meter.report()
+    for writer in writers:
+        writer.finalize(args.export_format)
 
 def get_max_preds(batch_heatmaps):
     '''
     get predictions from score maps
     heatmaps: numpy.ndarray([batch_size, num_joints, height, width])
+              or torch.Tensor, decoded on its device (common/heatmap_decoder.py)
     '''
+    if torch.is_tensor(batch_heatmaps):
+        return get_max_preds_torch(batch_heatmaps)[0].cpu().numpy()
     assert isinstance(batch_heatmaps, np.ndarray), \
         'batch_heatmaps should be numpy.ndarray'
     assert batch_heatmaps.ndim == 4, 'batch_images should be 4-ndim'
@@ -146,7 +221,7 @@ def save_batch_heatmaps(batch_image, batch_heatmaps, file_name,
                         3),
                         dtype=np.uint8)
 
-    preds = get_max_preds(batch_heatmaps.detach().cpu().numpy())
+    preds = get_max_preds(batch_heatmaps.detach())
 
     for i in range(batch_size):
         image = batch_image[i].mul(255)\
@@ -199,4 +274,7 @@ if __name__ == '__main__':
     torch.backends.cudnn.deterministic = True
     cudnn.benchmark = True
 
-    main(args)
+    if args.estimators:
+        main_multi(args)
+    else:
+        main(args)
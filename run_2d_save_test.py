@@ -22,6 +22,7 @@ from utils.utils import save_ckpt
 from torch.utils.data import DataLoader
 from data_extra.dataset_converter import COCO2HUMAN, MPII2HUMAN
 from common.common_dataset import DatasetLoader_saved_test
+from common.inference import get_device, configure_threads, inference_mode
 import torchvision.transforms as transforms
 import matplotlib.pyplot as plt
 import cv2
@@ -49,15 +50,16 @@ def main(args):
         keypoints_saved = COCO2HUMAN(keypoints_saved.copy())
     
     print('==> Using settings {}'.format(args))
-    device = torch.device("cuda")
+    device = get_device(args)
+    configure_threads(args)
 
     print('==> Loading dataset...')
     path_3d = 'common.' + 'h36m_dataset_custom'
     exec('from ' + path_3d + ' import ' + 'Human36M')
-    dataset_3d = DatasetLoader_saved_test(eval('Human36M')('test'), ref_joints_name=None, is_train=True, transform=transforms.Compose([\
+    dataset_3d = DatasetLoader_saved_test(eval('Human36M')('test', load_workers=args.load_workers), ref_joints_name=None, is_train=True, transform=transforms.Compose([\
                                                                                                                             transforms.ToTensor(),
                                                                                                                             transforms.Normalize(mean=pixel_mean, std=pixel_std)]), detection_2d=True)
-    loader = DataLoader(dataset_3d, batch_size=1, shuffle=False, num_workers=2, pin_memory=True)
+    loader = DataLoader(dataset_3d, batch_size=1, shuffle=False, num_workers=2, pin_memory=device.type == 'cuda')
     
     print('==> Visualization preparation...')
     cmap = plt.get_cmap('rainbow')
@@ -68,7 +70,7 @@ def main(args):
     # ########## start inferencing
     #################################################
     print("==> Inferencing...")
-    with torch.no_grad():
+    with inference_mode():
         # data loading
         for i, temp in enumerate(loader):
             if i == 10:
@@ -149,7 +151,8 @@ if __name__ == '__main__':
     # fix random
     random_seed = args.random_seed
     torch.manual_seed(random_seed)
-    torch.cuda.manual_seed(random_seed)
+    if torch.cuda.is_available():
+        torch.cuda.manual_seed(random_seed)
     np.random.seed(random_seed)
     random.seed(random_seed)
     os.environ['PYTHONHASHSEED'] = str(random_seed)
@@ -15,6 +15,7 @@ from function_baseline.data_preparation import data_preparation
 from function_baseline.model_pos_preparation import model_pos_preparation
 from function_baseline.model_pos_train import train
 from function_poseaug.model_pos_eval import evaluate
+from common.inference import get_device, configure_threads
 from utils.log import Logger, savefig
 from utils.utils import save_ckpt
 
@@ -30,7 +31,8 @@ code are modified from https://github.com/garyzhao/SemGCN
 
 def main(args):
     print('==> Using settings {}'.format(args))
-    device = torch.device("cuda")
+    device = get_device(args)
+    configure_threads(args)
 
     print('==> Loading dataset...')
     data_dict = data_preparation(args)
@@ -91,7 +93,8 @@ if __name__ == '__main__':
     # fix random
     random_seed = args.random_seed
     torch.manual_seed(random_seed)
-    torch.cuda.manual_seed(random_seed)
+    if torch.cuda.is_available():
+        torch.cuda.manual_seed(random_seed)
     np.random.seed(random_seed)
     random.seed(random_seed)
     os.environ['PYTHONHASHSEED'] = str(random_seed)
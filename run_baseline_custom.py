@@ -17,6 +17,7 @@ from function_baseline.model_pose_train_custom import train
 from function_poseaug.model_pos_eval_custom import evaluate
 from pelee.lib.models.MOBIS_peleenet import get_pose_pelee_net
 from common import get_resnet
+from common.inference import get_device, configure_threads
 from utils.log import Logger, savefig
 from utils.utils import save_ckpt
 
@@ -32,7 +33,8 @@ code are modified from https://github.com/garyzhao/SemGCN
 
 def main(args):
     print('==> Using settings {}'.format(args))
-    device = torch.device("cuda")
+    device = get_device(args)
+    configure_threads(args)
 
     print('==> Loading dataset...')
     data_class = Data_Custom()
@@ -91,7 +93,8 @@ if __name__ == '__main__':
     # fix random
     random_seed = args.random_seed
     torch.manual_seed(random_seed)
-    torch.cuda.manual_seed(random_seed)
+    if torch.cuda.is_available():
+        torch.cuda.manual_seed(random_seed)
     np.random.seed(random_seed)
     random.seed(random_seed)
     os.environ['PYTHONHASHSEED'] = str(random_seed)
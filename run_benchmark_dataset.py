@@ -0,0 +1,158 @@
+from __future__ import print_function, absolute_import, division
+
+import copy
+import random
+import time
+
+import numpy as np
+import torchvision.transforms as transforms
+
+from function_baseline.config import get_parse_args
+from common.common_dataset import DatasetLoader, DatasetLoader_only_lifting, DatasetLoader_3d_mppe, synthetic_occlusion, \
+    sample_occlusion, occlusion_inside_image
+
+pixel_mean = (0.485, 0.456, 0.406)
+pixel_std = (0.229, 0.224, 0.225)
+
+"""
+microbenchmark of the dataset loaders (samples/sec of __getitem__, single process)
+
+every loader is timed twice on the same random indices
+    views     : the current loader, records are read as views of the dataset store
+    deepcopy  : the same loader with copy.deepcopy of every record first
+the ratio isolates the per-record copy cost only. it is not a comparison with the loaders before the
+view change (per-sample dicts, in-place joint transform, rejection-sampled occlusion), which are not timed here
+usage
+    python run_benchmark_dataset.py --bench_loaders only_lifting,2d --bench_samples 2000
+
+'occlusion' in --bench_loaders times synthetic_occlusion alone (worst case latency) on bboxes touching
+or crossing the image border, where the old rejection loop used to spin, after checking on the same bboxes
+that every rectangle is drawn with a bounded number of random draws and in bounded time, and lies inside the image
+"""
+
+
+class _DeepCopyRecords(object):
+    # copy.deepcopy(self.db[index]) in front of the store
+    def __init__(self, db):
+        self.db = db
+
+    def __len__(self):
+        return len(self.db)
+
+    def __getitem__(self, index):
+        return copy.deepcopy(self.db[index])
+
+
+def time_loader(loader, indices):
+    start = time.perf_counter()
+    for index in indices:
+        loader[index]
+    elapsed = time.perf_counter() - start
+    return len(indices) / elapsed
+
+
+class _CountingRandom(object):
+    # random.random with a count of the draws, given to sample_occlusion as rng
+    def __init__(self):
+        self.draws = 0
+
+    def random(self):
+        self.draws += 1
+        return random.random()
+
+
+def check_occlusion(bboxes, img_width, img_height, num, max_draws=4, max_time=0.05):
+    # sample_occlusion on every bbox: at most max_draws draws and max_time seconds per rectangle
+    # (no retry loop), and the rectangle inside the image. raises AssertionError
+    rng = _CountingRandom()
+    for bbox in bboxes:
+        bbox = np.array(bbox, dtype=np.float64)
+        max_draws_seen, max_elapsed = 0, 0.
+        for _ in range(num):
+            rng.draws = 0
+            start = time.perf_counter()
+            occlusion = sample_occlusion(bbox, img_width, img_height, rng)
+            max_elapsed = max(max_elapsed, time.perf_counter() - start)
+            max_draws_seen = max(max_draws_seen, rng.draws)
+            assert occlusion_inside_image(occlusion, img_width, img_height), \
+                'Occlusion {} outside the {}x{} image for the bbox {}'.format(occlusion, img_width, img_height, bbox.tolist())
+        assert max_draws_seen <= max_draws, \
+            '{} random draws (> {}) for the bbox {}'.format(max_draws_seen, max_draws, bbox.tolist())
+        assert max_elapsed <= max_time, \
+            'Occlusion drawn in {:.3f} s (> {} s) for the bbox {}'.format(max_elapsed, max_time, bbox.tolist())
+    print('==> Occlusion check: {} rectangles per bbox inside the image, at most {} draws each'.format(num, max_draws))
+
+
+def bench_occlusion(num):
+    img_height, img_width = 1000, 1000
+    img = np.zeros((img_height, img_width, 3), dtype=np.uint8)
+    bboxes = [
+        [0, 0, 400, 400],  # top-left corner
+        [img_width - 300, 200, 300, 300],  # right border
+        [-200, -200, 500, 500],  # out of the image
+        [-100, 100, img_width + 200, img_height + 200],  # larger than the image
+        [1, 1, img_width - 2, img_height - 2],  # almost the image size
+        [img_width - 2, img_height - 2, 600, 600],  # almost outside
+    ]
+    check_occlusion(bboxes, img_width, img_height, num)
+    # the noise bank is generated by the first call
+    synthetic_occlusion(img, np.array(bboxes[0], dtype=np.float64))
+
+    print('{:<35s}{:>12s}{:>12s}{:>12s}'.format('bbox', 'mean (us)', 'p99 (us)', 'max (us)'))
+    for bbox in bboxes:
+        bbox = np.array(bbox, dtype=np.float64)
+        latency = []
+        for _ in range(num):
+            start = time.perf_counter()
+            synthetic_occlusion(img, bbox)
+            latency.append(time.perf_counter() - start)
+        latency = np.array(latency) * 1e6
+        print('{:<35s}{:>12.1f}{:>12.1f}{:>12.1f}'.format(str(bbox.astype(int).tolist()), latency.mean(), np.percentile(latency, 99), latency.max()))
+
+
+def build_loader(name, dataset_3d):
+    transform = transforms.Compose([transforms.ToTensor(), transforms.Normalize(mean=pixel_mean, std=pixel_std)])
+    if name == 'only_lifting':
+        return DatasetLoader_only_lifting(dataset_3d, ref_joints_name=None, is_train=True, transform=transform)
+    elif name == '2d':
+        return DatasetLoader(dataset_3d, ref_joints_name=None, is_train=True, transform=transform)
+    elif name == '3d_mppe':
+        return DatasetLoader_3d_mppe(dataset_3d, ref_joints_name=None, is_train=True, transform=transform)
+    raise KeyError('Invalid loader name: {}'.format(name))
+
+
+def main(args):
+    print('==> Using settings {}'.format(args))
+    random.seed(args.random_seed)
+    np.random.seed(args.random_seed)
+
+    names = args.bench_loaders.split(',')
+    if 'occlusion' in names:
+        names.remove('occlusion')
+        bench_occlusion(args.bench_samples)
+    if len(names) == 0:
+        return
+
+    print('==> Loading dataset...')
+    path_3d = 'common.' + 'h36m_dataset_custom'
+    exec('from ' + path_3d + ' import ' + 'Human36M')
+    dataset_3d = eval('Human36M')('train', load_workers=args.load_workers)
+
+    num = min(args.bench_samples, len(dataset_3d.data))
+    indices = np.random.randint(0, len(dataset_3d.data), num).tolist()
+
+    print('{:<15s}{:>15s}{:>15s}{:>10s}'.format('loader', 'deepcopy', 'views', 'ratio')) # samples/sec
+    for name in names:
+        loader = build_loader(name, dataset_3d)
+        # warm up the page cache / memory map before timing
+        time_loader(loader, indices[:min(num, 100)])
+
+        rate = time_loader(loader, indices)
+        loader.db = _DeepCopyRecords(loader.db)
+        deepcopy_rate = time_loader(loader, indices)
+        print('{:<15s}{:>15.1f}{:>15.1f}{:>9.2f}x'.format(name, deepcopy_rate, rate, rate / deepcopy_rate))
+
+
+if __name__ == '__main__':
+    args = get_parse_args()
+    main(args)
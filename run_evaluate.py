@@ -12,13 +12,15 @@ from function_baseline.config import get_parse_args
 from function_baseline.data_preparation import data_preparation
 from function_baseline.model_pos_preparation import model_pos_preparation
 from function_poseaug.model_pos_eval import evaluate
+from common.inference import get_device, configure_threads
 
 
 def main(args):
     print('==> Using settings {}'.format(args))
     stride = args.downsample
     cudnn.benchmark = True
-    device = torch.device("cuda")
+    device = get_device(args)
+    configure_threads(args)
 
     print('==> Loading dataset...')
     data_dict = data_preparation(args)
@@ -29,7 +31,7 @@ def main(args):
     # Check if evaluate checkpoint file exist:
     assert path.isfile(args.evaluate), '==> No checkpoint found at {}'.format(args.evaluate)
     print("==> Loading checkpoint '{}'".format(args.evaluate))
-    ckpt = torch.load(args.evaluate)
+    ckpt = torch.load(args.evaluate, map_location=device)
     model_pos.load_state_dict(ckpt['state_dict'])
 
     print('==> Evaluating...')
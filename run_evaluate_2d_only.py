@@ -20,6 +20,8 @@ from common.common_dataset import DatasetLoader
 import torchvision.transforms as transforms
 from torch.utils.data import DataLoader
 from one_stage import get_pose_net
+from common.inference import get_device, configure_threads, prepare_model, LatencyMeter
+from common.onnx_model import OnnxModel, is_onnx
 # from function_poseaug.model_pos_eval import evaluate
 
 pixel_mean = (0.485, 0.456, 0.406)
@@ -28,35 +30,42 @@ def main(args):
     print('==> Using settings {}'.format(args))
     stride = args.downsample
     cudnn.benchmark = True
-    device = torch.device("cuda")
+    device = get_device(args)
+    configure_threads(args)
 
     path_3d = 'common.' + 'h36m_dataset_custom'
     exec('from ' + path_3d + ' import ' + 'Human36M')
     
     print('==> Loading dataset...')
-    dataset = DatasetLoader(eval('Human36M')('test'), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
+    dataset = DatasetLoader(eval('Human36M')('test', load_workers=args.load_workers), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
                                                                             transforms.ToTensor()
                                                                             , transforms.Normalize(mean=pixel_mean, std=pixel_std)]), detection_2d = True, only_2d = True)
-    loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=False, num_workers=args.num_workers, pin_memory=True)
+    loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=False, num_workers=args.num_workers, pin_memory=device.type == 'cuda')
     print("==> Creating model...")
-    if args.keypoints == 'pelee':
-        estimator = get_pose_pelee_net(False).cuda().eval()
+    if ((args.keypoints == 'pelee') or ('resnet' in args.keypoints)) and is_onnx(args.path_2d):
+        # exported by run_export_onnx.py, run by ONNX Runtime on the CPU
+        estimator = OnnxModel(args.path_2d, args.num_threads, args.interop_threads)
+    elif args.keypoints == 'pelee':
+        estimator = get_pose_pelee_net(False)
         estimator.load_state_dict(torch.load(args.path_2d, map_location='cpu'))
     elif 'resnet' in args.keypoints:
-        estimator = get_resnet(args).cuda()
+        estimator = get_resnet(args)
         estimator.load_state_dict(torch.load(args.path_2d, map_location='cpu'))
     elif 'one_stage' == args.keypoints:
-        estimator = get_pose_net(50, False, 18).cuda()
+        estimator = get_pose_net(50, False, 18)
         estimator = torch.nn.DataParallel(estimator)
         estimator.load_state_dict(torch.load(args.path_one_stage, map_location='cpu')['network'])
     else:
         raise NotImplementedError("Not supported")
+    estimator = prepare_model(estimator, device, args.channels_last)
     estimator.eval()
+    meter = LatencyMeter(device, args.keypoints, enabled=args.latency_report).attach(estimator)
 
     print('==> Evaluating...')
     assert args.only_2d
     pck = evaluate_only_2d(loader, estimator, device, args.keypoints)
     print('H36M: Protocol #1   (PCK) overall average: {:.2f} (mm)'.format(pck))
+    meter.report()
 
 if __name__ == '__main__':
     args = get_parse_args()
@@ -1,8 +1,12 @@
 from __future__ import print_function, absolute_import, division
 
+import copy
+import glob
+import json
 import os
 import os.path as path
 import random
+from collections import OrderedDict
 
 import numpy as np
 import torch
@@ -11,8 +15,11 @@ import torch.backends.cudnn as cudnn
 from function_baseline.config import get_parse_args
 # from function_baseline.data_preparation import data_preparation
 from function_baseline.data_preparation_custom import Data_Custom
+from common.eval_cache import load_eval_cache, EvalCacheLoader
+from common.inference import get_device, configure_threads, LatencyMeter
+from common.onnx_model import OnnxModel, is_onnx
 from function_baseline.model_pos_preparation import model_pos_preparation
-from function_poseaug.model_pos_eval_custom import evaluate, evaluate_2d
+from function_poseaug.model_pos_eval_custom import evaluate, evaluate_2d, evaluate_multi
 from pelee.lib.models.MOBIS_peleenet import get_pose_pelee_net
 from common import get_resnet
 from data_extra.dataset_converter import COCO2HUMAN, MPII2HUMAN
@@ -23,19 +30,29 @@ def main(args):
     print('==> Using settings {}'.format(args))
     stride = args.downsample
     cudnn.benchmark = True
-    device = torch.device("cuda")
+    device = get_device(args)
+    configure_threads(args)
 
     print('==> Loading dataset...')
-    data_class = Data_Custom(is_train=False)
-    data_dict = data_class.data_preparation(args)
-    print("==> Creating model...")
-    model_pos = model_pos_preparation(args, device).cuda()
-
+    if args.eval_cache:
+        # memory-mapped test tensors, built by the first run (common/eval_cache.py)
+        columns, num = load_eval_cache(args.keypoints, load_workers=args.load_workers)
+        data_dict = {'valid_loader': EvalCacheLoader(columns, num, int(args.batch_size / 8))}
+    else:
+        data_class = Data_Custom(is_train=False)
+        data_dict = data_class.data_preparation(args)
     # Check if evaluate checkpoint file exist:
     assert path.isfile(args.evaluate), '==> No checkpoint found at {}'.format(args.evaluate)
-    print("==> Loading checkpoint '{}'".format(args.evaluate))
-    ckpt = torch.load(args.evaluate)
-    model_pos.load_state_dict(ckpt['state_dict'])
+    if is_onnx(args.evaluate):
+        # exported by run_export_onnx.py, run by ONNX Runtime on the CPU
+        model_pos = OnnxModel(args.evaluate, args.num_threads, args.interop_threads)
+    else:
+        print("==> Creating model...")
+        model_pos = model_pos_preparation(args, device)
+        print("==> Loading checkpoint '{}'".format(args.evaluate))
+        ckpt = torch.load(args.evaluate, map_location=device)
+        model_pos.load_state_dict(ckpt['state_dict'])
+    meter = LatencyMeter(device, args.posenet_name, enabled=args.latency_report).attach(model_pos)
 
     print('==> Evaluating...')
     if args.evaluate_2d:
@@ -45,6 +62,79 @@ def main(args):
         error_h36m_p1, error_h36m_p2 = evaluate(data_dict['valid_loader'], model_pos, device, args.keypoints, flipaug=False)
         print('H36M: Protocol #1   (MPJPE) overall average: {:.2f} (mm)'.format(error_h36m_p1))
         print('H36M: Protocol #2 (P-MPJPE) overall average: {:.2f} (mm)'.format(error_h36m_p2))
+    meter.report()
+
+def checkpoint_setting(ckpt_path, args):
+    # (posenet_name, keypoints) of ./checkpoint/pretrain_baseline/{posenet_name}/{keypoints}/*/ckpt_*.pth.tar,
+    # the command line settings for checkpoints stored elsewhere
+    parts = path.normpath(ckpt_path).split(os.sep)
+    if 'pretrain_baseline' in parts and len(parts) - parts.index('pretrain_baseline') >= 5:
+        i = parts.index('pretrain_baseline')
+        return parts[i + 1], parts[i + 2]
+    return args.posenet_name, args.keypoints
+
+
+def main_sweep(args):
+    """
+    evaluate every checkpoint matched by --evaluate_sweep (comma separated files / globs).
+    checkpoints are grouped by their 2D keypoint source, the test set of each source is streamed once
+    (evaluation cache) and every model of the group runs on each batch.
+    """
+    print('==> Using settings {}'.format(args))
+    cudnn.benchmark = True
+    device = get_device(args)
+    configure_threads(args)
+
+    ckpt_paths = []
+    for pattern in args.evaluate_sweep.split(','):
+        for ckpt_path in sorted(glob.glob(pattern)):
+            if ckpt_path not in ckpt_paths:
+                ckpt_paths.append(ckpt_path)
+    assert len(ckpt_paths) > 0, '==> No checkpoint found at {}'.format(args.evaluate_sweep)
+
+    # keypoints -> posenet_name -> checkpoints
+    groups = OrderedDict()
+    for ckpt_path in ckpt_paths:
+        posenet_name, keypoints = checkpoint_setting(ckpt_path, args)
+        groups.setdefault(keypoints, OrderedDict()).setdefault(posenet_name, []).append(ckpt_path)
+
+    results = []
+    for keypoints, archs in groups.items():
+        print('==> Loading the test set of {}...'.format(keypoints))
+        columns, num = load_eval_cache(keypoints, load_workers=args.load_workers)
+        loader = EvalCacheLoader(columns, num, int(args.batch_size / 8))
+
+        models, settings = [], []
+        for posenet_name, arch_ckpts in archs.items():
+            model_args = copy.copy(args)
+            model_args.posenet_name, model_args.keypoints, model_args.pretrain = posenet_name, keypoints, False
+            for ckpt_path in arch_ckpts:
+                print("==> Loading checkpoint '{}'".format(ckpt_path))
+                ckpt = torch.load(ckpt_path, map_location=device)
+                model_pos = model_pos_preparation(model_args, device)
+                model_pos.load_state_dict(ckpt['state_dict'] if 'state_dict' in ckpt else ckpt['model_pos'])
+                models.append(model_pos)
+                settings.append({'checkpoint': ckpt_path, 'posenet_name': posenet_name, 'keypoints': keypoints,
+                                 'epoch': ckpt.get('epoch')})
+
+        num_workers = args.sweep_workers if args.sweep_workers > 0 else min(len(models), os.cpu_count() or 1)
+        if device.type == 'cpu' and num_workers > 1 and args.num_threads == 0:
+            # share the cores between the concurrent models
+            torch.set_num_threads(max(1, (os.cpu_count() or 1) // num_workers))
+        print('==> Evaluating {} checkpoints on {} workers...'.format(len(models), num_workers))
+        for setting, (p1, p2) in zip(settings, evaluate_multi(loader, models, device, num_workers)):
+            setting.update({'mpjpe': p1, 'p_mpjpe': p2})
+            results.append(setting)
+
+    name_width = max(len(r['checkpoint']) for r in results) + 2
+    print('{:<{w}s}{:>12s}{:>12s}{:>8s}{:>12s}{:>12s}'.format('checkpoint', 'posenet', 'keypoints', 'epoch', 'MPJPE', 'P-MPJPE', w=name_width))
+    for r in results:
+        print('{:<{w}s}{:>12s}{:>12s}{:>8s}{:>12.2f}{:>12.2f}'.format(r['checkpoint'], r['posenet_name'], r['keypoints'],
+                                                                    str(r['epoch']), r['mpjpe'], r['p_mpjpe'], w=name_width))
+    with open(args.sweep_output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('==> Results saved to {}'.format(args.sweep_output))
+
 
 if __name__ == '__main__':
     args = get_parse_args()
@@ -58,4 +148,7 @@ if __name__ == '__main__':
     # copy from #https://pytorch.org/docs/stable/notes/randomness.html
     torch.backends.cudnn.deterministic = True
 
-    main(args)
+    if args.evaluate_sweep:
+        main_sweep(args)
+    else:
+        main(args)
@@ -12,6 +12,7 @@ from function_poseaug.model_pos_eval_custom import evaluate, evaluate_3d_mppe, e
 from one_stage import get_pose_net
 # from function_poseaug.model_pos_eval import evaluate
 from common.common_dataset import DatasetLoader_3d_mppe
+from common.inference import get_device, configure_threads, prepare_model, LatencyMeter
 import torchvision.transforms as transforms
 from torch.utils.data import DataLoader
 
@@ -22,22 +23,24 @@ pixel_std = (0.229, 0.224, 0.225)
 def main(args):    
     print('==> Using settings {}'.format(args))
     cudnn.benchmark = True
-    device = torch.device("cuda")
+    device = get_device(args)
+    configure_threads(args)
 
     print('==> Loading dataset...')
     path_3d = 'common.' + 'h36m_dataset_custom'
     exec('from ' + path_3d + ' import ' + 'Human36M')
-    dataset_3d = DatasetLoader_3d_mppe(eval('Human36M')('test', True), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
+    dataset_3d = DatasetLoader_3d_mppe(eval('Human36M')('test', True, load_workers=args.load_workers), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
                                                                                                                         transforms.ToTensor()
                                                                                                                         , transforms.Normalize(mean=pixel_mean, std=pixel_std)]))
-    valid_loader = DataLoader(dataset_3d, batch_size=32, shuffle=False, num_workers=args.num_workers, pin_memory=True)
+    valid_loader = DataLoader(dataset_3d, batch_size=32, shuffle=False, num_workers=args.num_workers, pin_memory=device.type == 'cuda')
     
     print("==> Creating model...")
     model = get_pose_net(50, False, 18)
     model = torch.nn.DataParallel(model)
     model.load_state_dict(torch.load(args.path_one_stage, map_location='cpu')['network'])
     print(f"==> Loading from {args.path_one_stage}")
-    model = model.cuda().eval()
+    model = prepare_model(model, device, args.channels_last).eval()
+    meter = LatencyMeter(device, 'one_stage', enabled=args.latency_report).attach(model)
 
     print('==> Evaluating...')
     
@@ -46,6 +49,7 @@ def main(args):
         evaluate_3d_mppe_2d(valid_loader, model, device)
     else:
         evaluate_3d_mppe(valid_loader, model, device)
+    meter.report()
 
 if __name__ == '__main__':
     args = get_parse_args()
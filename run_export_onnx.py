@@ -0,0 +1,72 @@
+from __future__ import print_function, absolute_import, division
+
+import copy
+import os
+import os.path as path
+import random
+
+import numpy as np
+import torch
+
+from function_baseline.config import get_parse_args
+from function_baseline.model_pos_preparation import model_pos_preparation
+from common.common_dataset import input_shape
+from common.onnx_model import export_onnx, check_parity
+from run_2d_save import build_estimator_2d
+
+"""
+export the inference networks to ONNX (common/onnx_model.py), with a dynamic batch dimension
+    2D estimator       --keypoints pelee / resnet_{50,101,152} with --path_2d   -> {onnx_dir}/{keypoints}.onnx
+    lifting network    --posenet_name mlp with the checkpoint --evaluate         -> {onnx_dir}/{posenet_name}_{keypoints}.onnx
+every file is checked against the PyTorch outputs (max abs difference <= --onnx_atol).
+usage
+    python run_export_onnx.py --keypoints pelee --path_2d pelee.pth --posenet_name mlp --evaluate ckpt_best.pth.tar
+the .onnx files are then given in place of the weights
+    python run_2d_save.py --keypoints pelee --path_2d onnx/pelee.onnx --device cpu
+    python run_evaluate_custom.py --keypoints pelee --evaluate onnx/mlp_pelee.onnx --device cpu
+"""
+
+
+def main(args):
+    print('==> Using settings {}'.format(args))
+    device = torch.device('cpu')
+    exported = []
+
+    if ('pelee' == args.keypoints) or ('resnet' in args.keypoints):
+        model_args = copy.copy(args)
+        model_args.channels_last = False
+        estimator_2d = build_estimator_2d(model_args, args.keypoints, args.path_2d, device)
+        frame_shape = (3,) + tuple(input_shape)
+        onnx_path = path.join(args.onnx_dir, args.keypoints + '.onnx')
+        exported.append((estimator_2d, frame_shape, onnx_path))
+
+    if args.evaluate:
+        print("==> Creating model...")
+        model_args = copy.copy(args)
+        model_args.pretrain = False
+        model_pos = model_pos_preparation(model_args, device)
+        assert path.isfile(args.evaluate), '==> No checkpoint found at {}'.format(args.evaluate)
+        print("==> Loading checkpoint '{}'".format(args.evaluate))
+        ckpt = torch.load(args.evaluate, map_location=device)
+        model_pos.load_state_dict(ckpt['state_dict'])
+        onnx_path = path.join(args.onnx_dir, '{}_{}.onnx'.format(args.posenet_name, args.keypoints))
+        exported.append((model_pos, (16, 2), onnx_path))
+
+    assert len(exported) > 0, 'Nothing to export: --keypoints pelee / resnet_* and / or --evaluate'
+    for model, frame_shape, onnx_path in exported:
+        print('==> Exporting {}'.format(onnx_path))
+        export_onnx(model, torch.randn((2,) + frame_shape), onnx_path, opset_version=args.onnx_opset)
+        max_error = check_parity(model, onnx_path, frame_shape, atol=args.onnx_atol, num_threads=args.num_threads)
+        print('==> {}: max abs difference with PyTorch {:.3g}'.format(onnx_path, max_error))
+
+
+if __name__ == '__main__':
+    args = get_parse_args()
+    # fix random
+    random_seed = args.random_seed
+    torch.manual_seed(random_seed)
+    np.random.seed(random_seed)
+    random.seed(random_seed)
+    os.environ['PYTHONHASHSEED'] = str(random_seed)
+
+    main(args)
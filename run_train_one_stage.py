@@ -12,6 +12,8 @@ from function_poseaug.model_pos_eval_custom import evaluate, evaluate_3d_mppe, e
 from one_stage import get_pose_net
 # from function_poseaug.model_pos_eval import evaluate
 from common.common_dataset import DatasetLoader_3d_mppe, MultipleDatasets, DatasetLoader_MOBIS
+from common.batch_augmentation import BatchAugmenter
+from common.inference import get_device, configure_threads, prepare_model, prepare_input
 import torchvision.transforms as transforms
 from torch.utils.data import DataLoader
 from utils.utils import AverageMeter
@@ -24,19 +26,20 @@ pixel_std = (0.229, 0.224, 0.225)
 def main(args):    
     print('==> Using settings {}'.format(args))
     cudnn.benchmark = True
-    device = torch.device("cuda")
+    device = get_device(args)
+    configure_threads(args)
 
     print('==> Loading dataset...')
     # 3d
     if args.one_stage_dataset == 'Human36M':
         path_3d = 'common.' + 'h36m_dataset_custom'
         exec('from ' + path_3d + ' import ' + 'Human36M')
-        train_dataset_3d = DatasetLoader_3d_mppe(eval('Human36M')('train', True), ref_joints_name=None, is_train=True, transform=transforms.Compose([\
+        train_dataset_3d = DatasetLoader_3d_mppe(eval('Human36M')('train', True, load_workers=args.load_workers), ref_joints_name=None, is_train=True, transform=transforms.Compose([\
                                                                                                                             transforms.ToTensor()
-                                                                                                                            , transforms.Normalize(mean=pixel_mean, std=pixel_std)]))
+                                                                                                                            , transforms.Normalize(mean=pixel_mean, std=pixel_std)]), device_augment=args.device_augment)
         
         
-        valid_dataset_3d = DatasetLoader_3d_mppe(eval('Human36M')('test', True), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
+        valid_dataset_3d = DatasetLoader_3d_mppe(eval('Human36M')('test', True, load_workers=args.load_workers), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
                                                                                                                             transforms.ToTensor()
                                                                                                                             , transforms.Normalize(mean=pixel_mean, std=pixel_std)]))
         ref_joints_name = train_dataset_3d.joints_name
@@ -47,14 +50,14 @@ def main(args):
         train_dataset_2d = DatasetLoader_3d_mppe(eval("MPII")("train"), ref_joints_name, True, transforms.Compose([\
                                                                                                             transforms.ToTensor(),
                                                                                                             transforms.Normalize(mean=pixel_mean, std=pixel_std)]\
-                                                                                                            ))
+                                                                                                            ), device_augment=args.device_augment)
         
         trainset_3d_loader = MultipleDatasets([train_dataset_3d], make_same_len=False)
         trainset_2d_loader = MultipleDatasets([train_dataset_2d], make_same_len=False)
         trainset_loader = MultipleDatasets([trainset_3d_loader, trainset_2d_loader], make_same_len=True)
         
-        train_loader = DataLoader(dataset=trainset_loader, batch_size=args.batch_size, shuffle=True, num_workers=args.num_workers, pin_memory=True)
-        valid_loader = DataLoader(valid_dataset_3d, batch_size=32, shuffle=False, num_workers=args.num_workers, pin_memory=True)
+        train_loader = DataLoader(dataset=trainset_loader, batch_size=args.batch_size, shuffle=True, num_workers=args.num_workers, pin_memory=device.type == 'cuda')
+        valid_loader = DataLoader(valid_dataset_3d, batch_size=32, shuffle=False, num_workers=args.num_workers, pin_memory=device.type == 'cuda')
         
     elif args.one_stage_dataset == 'MOBIS':
         path_3d = 'common.' + 'mobis_dataset_custom'
@@ -62,19 +65,22 @@ def main(args):
 
         train_dataset_3d = DatasetLoader_MOBIS(eval('MOBIS_DATASET')('train', args), ref_joints_name=None, is_train=True, transform=transforms.Compose([\
                                                                                                                             transforms.ToTensor()
-                                                                                                                            , transforms.Normalize(mean=pixel_mean, std=pixel_std)]))
+                                                                                                                            , transforms.Normalize(mean=pixel_mean, std=pixel_std)]), device_augment=args.device_augment)
         valid_dataset_3d = DatasetLoader_MOBIS(eval('MOBIS_DATASET')('test', args), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
                                                                                                                             transforms.ToTensor()
                                                                                                                             , transforms.Normalize(mean=pixel_mean, std=pixel_std)]))
-        train_loader = DataLoader(train_dataset_3d, batch_size=args.batch_size, shuffle=True, num_workers=args.num_workers, pin_memory=True)
-        valid_loader = DataLoader(valid_dataset_3d, batch_size=32, shuffle=False, num_workers=args.num_workers, pin_memory=True)
+        train_loader = DataLoader(train_dataset_3d, batch_size=args.batch_size, shuffle=True, num_workers=args.num_workers, pin_memory=device.type == 'cuda')
+        valid_loader = DataLoader(valid_dataset_3d, batch_size=32, shuffle=False, num_workers=args.num_workers, pin_memory=device.type == 'cuda')
+    
+    # augmentation of the training batches on the device
+    augmenter = BatchAugmenter(pixel_mean, pixel_std, device) if args.device_augment else None
     
     ckpt_dir_path = args.save_path_one_stage
     os.makedirs(ckpt_dir_path, exist_ok=True)
     print('==> Making checkpoint dir: {}'.format(ckpt_dir_path))
     
     print("==> Creating model...")
-    model = get_pose_net(50, is_train=True, joint_num=train_dataset_3d.joint_num).cuda()
+    model = prepare_model(get_pose_net(50, is_train=True, joint_num=train_dataset_3d.joint_num), device, args.channels_last)
     model = torch.nn.DataParallel(model)
     if args.one_stage_continue_train:
         state_dict = torch.load(path.join(ckpt_dir_path, f'one_stage_best.pth.tar'), map_location='cpu')
@@ -119,8 +125,10 @@ def main(args):
         model.train()
         for i, (img_patch, joint_img, joint_vis, joints_have_depth) in enumerate(train_loader):
             # data loading
+            if augmenter is not None:
+                img_patch = augmenter(img_patch)
             img_patch, joint_img, joint_vis, joints_have_depth = \
-                img_patch.to(device), joint_img.to(device), joint_vis.to(device), joints_have_depth.to(device)
+                prepare_input(img_patch, device, args.channels_last), joint_img.to(device), joint_vis.to(device), joints_have_depth.to(device)
             
             # forwarding
             target = {'coord': joint_img, 'vis': joint_vis, 'have_depth': joints_have_depth}
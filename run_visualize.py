@@ -17,6 +17,8 @@ from function_baseline.model_pos_preparation import model_pos_preparation
 from one_stage import get_pose_net
 from pelee.lib.models.MOBIS_peleenet import get_pose_pelee_net
 from common import get_resnet
+from common.heatmap_decoder import decode_heatmaps, get_max_preds_torch
+from common.inference import get_device, configure_threads, inference_mode, prepare_model, prepare_input, synchronize, LatencyMeter
 from common.viz import show_3d_moon
 from common.common_dataset import DatasetLoader_3d_mppe
 from data_extra.dataset_converter import COCO2HUMAN, MPII2HUMAN
@@ -37,7 +39,8 @@ pixel_std = (0.229, 0.224, 0.225)
 
 def main(args):
     print('==> Using settings {}'.format(args))
-    device = torch.device("cuda")
+    device = get_device(args)
+    configure_threads(args)
 
     print('==> Loading dataset...')
     assert args.batch_size == 1
@@ -47,7 +50,7 @@ def main(args):
     
     # loader
     if args.keypoints == 'one_stage':
-        dataset_3d = DatasetLoader_3d_mppe(eval('Human36M')('vis', True), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
+        dataset_3d = DatasetLoader_3d_mppe(eval('Human36M')('vis', True, load_workers=args.load_workers), ref_joints_name=None, is_train=False, transform=transforms.Compose([\
                                                                                                                         transforms.ToTensor()
                                                                                                                         , transforms.Normalize(mean=pixel_mean, std=pixel_std)]), vis=True)
         loader = DataLoader(dataset_3d, batch_size=args.batch_size, shuffle=False, num_workers=args.num_workers, pin_memory=True)
@@ -58,10 +61,10 @@ def main(args):
     # activate lifting 
     if args.keypoints != 'one_stage':
         print("==> Creating model...")
-        model_pos = model_pos_preparation(args, device).cuda()
+        model_pos = model_pos_preparation(args, device).to(device)
         assert path.isfile(args.evaluate), '==> No checkpoint found at {}'.format(args.evaluate)
         print("==> Loading checkpoint '{}'".format(args.evaluate))
-        ckpt = torch.load(args.evaluate)
+        ckpt = torch.load(args.evaluate, map_location=device)
         model_pos.eval()
         model_pos.load_state_dict(ckpt['state_dict'])
     
@@ -69,18 +72,20 @@ def main(args):
     # activate one-stage model or lifting model
     if 'pelee' == args.keypoints:
         print("==> Creating 2D pose estimation model...")
-        estimator_2d = get_pose_pelee_net(is_train=False).cuda()
+        estimator_2d = get_pose_pelee_net(is_train=False)
         estimator_2d.load_state_dict(torch.load(args.path_2d, map_location='cpu'))
+        estimator_2d = prepare_model(estimator_2d, device, args.channels_last)
         estimator_2d.eval()
     elif 'resnet' in args.keypoints:
         print("==> Creating 2D pose estimation model...")
-        estimator_2d = get_resnet(args).cuda()
+        estimator_2d = get_resnet(args)
         estimator_2d.load_state_dict(torch.load(args.path_2d, map_location='cpu'))
+        estimator_2d = prepare_model(estimator_2d, device, args.channels_last)
         estimator_2d.eval()
     elif 'one_stage' == args.keypoints:
-        one_stage_model = get_pose_net(50, is_train=False, joint_num=18).cuda()
+        one_stage_model = prepare_model(get_pose_net(50, is_train=False, joint_num=18), device, args.channels_last)
         one_stage_model = torch.nn.DataParallel(one_stage_model)
-        one_stage_model.load_state_dict(torch.load(args.path_one_stage)['network'])
+        one_stage_model.load_state_dict(torch.load(args.path_one_stage, map_location=device)['network'])
         one_stage_model.eval()
     elif 'gt' == args.keypoints:
         pass
@@ -96,16 +101,17 @@ def main(args):
     #################################################
     print("==> Inferencing...")
     
-    with torch.no_grad():
+    meter = LatencyMeter(device, args.keypoints, enabled=args.latency_report)
+    with inference_mode():
         # data loading
         save_paths = []
         for i, temp in enumerate(loader):
             if args.keypoints == 'one_stage':
                 raw_img_path, img_patch, bbox, f, c, root_cam = temp
-                img_patch, bbox, f, c, root_cam = img_patch.to(device), bbox.to(device), f.to(device), c.to(device), root_cam.to(device)
+                img_patch, bbox, f, c, root_cam = prepare_input(img_patch, device, args.channels_last), bbox.to(device), f.to(device), c.to(device), root_cam.to(device)
             else:
                 raw_img_path, img_patch, bbox, joint_img = temp
-                img_patch, bbox, joint_img = img_patch.to(device), bbox.to(device), joint_img.to(device)
+                img_patch, bbox, joint_img = prepare_input(img_patch, device, args.channels_last), bbox.to(device), joint_img.to(device)
             if not(args.what_to_vis in raw_img_path[0]):
                 continue
             # print('raw_img_path : ', raw_img_path[0])
@@ -117,10 +123,12 @@ def main(args):
             
             # 1-stage
             if 'one_stage' == args.keypoints:
+                meter.start()
                 start_time = time.time()
                 output_coord = one_stage_model(img_patch)
-                torch.cuda.synchronize()
+                synchronize(device)
                 taken_time = time.time() - start_time
+                meter.stop(len(img_patch))
                 output_coord[:, :, 0] = output_coord[:, :, 0] / 64 * bbox[0][2] + bbox[0][0]
                 output_coord[:, :, 1] = output_coord[:, :, 1] / 64 * bbox[0][3] + bbox[0][1]
                 output_coord[:, :, 2] = (output_coord[:, :, 2] / 64 * 2 - 1) * (1000) + root_cam[0][2]
@@ -134,31 +142,33 @@ def main(args):
 
             # 2-stage
             if ('pelee' == args.keypoints) or ('resnet' in args.keypoints):
+                meter.start()
                 start_time = time.time()
                 output_heatmaps = estimator_2d(img_patch)
-                heatmap_h, heatmap_w = output_heatmaps.shape[-2:]
-                outputs_2d = get_max_preds(output_heatmaps.cpu().numpy())
-                outputs_2d[:, :, 0] = outputs_2d[:, :, 0] * bbox[:, 2:3].cpu().numpy() / heatmap_h + bbox[:, :1].cpu().numpy()
-                outputs_2d[:, :, 1] = outputs_2d[:, :, 1] * bbox[:, 3:].cpu().numpy() / heatmap_w + bbox[:, 1:2].cpu().numpy()
+                outputs_2d = decode_heatmaps(output_heatmaps, bbox, subpixel=args.subpixel_2d)[:, :, :2].cpu().numpy()
                 if 'pelee' == args.keypoints:
                     outputs_2d = COCO2HUMAN(outputs_2d.copy())
                 else:
                     outputs_2d = MPII2HUMAN(outputs_2d.copy())
                 outputs_2d = normalize_screen_coordinates(outputs_2d, img_w, img_h).astype(np.float32)
-                outputs_2d = torch.from_numpy(outputs_2d).cuda()
+                outputs_2d = torch.from_numpy(outputs_2d).to(device)
                 
                 outputs_3d = model_pos(outputs_2d)
-                torch.cuda.synchronize()
+                synchronize(device)
                 taken_time = time.time() - start_time
+                meter.stop(len(img_patch))
                 fps = str(1 / taken_time)[:6]
                 print('fps : ', fps)
                 outputs_3d = outputs_3d[:, :, :] - outputs_3d[:, :1, :]
             
             # 2-stage, 'gt'
             if 'gt' == args.keypoints:
+                meter.start()
                 start_time = time.time()
                 outputs_3d = model_pos(joint_img)
+                synchronize(device)
                 taken_time = time.time() - start_time
+                meter.stop(len(joint_img))
                 outputs_3d = outputs_3d[:, :, :] - outputs_3d[:, :1, :]
                 fps = str(1 / taken_time)[:6]
                 print('fps : ', fps)
@@ -180,6 +190,7 @@ def main(args):
             cv2.putText(save_img, 'FPS : ' + fps, (30, 30), cv2.FONT_HERSHEY_COMPLEX, 1, (255,255,255), 2, cv2.LINE_AA)
             cv2.imwrite(save_path, save_img)
             
+        meter.report()
         
         # to_video
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
@@ -194,7 +205,10 @@ def get_max_preds(batch_heatmaps):
     '''
     get predictions from score maps
     heatmaps: numpy.ndarray([batch_size, num_joints, height, width])
+              or torch.Tensor, decoded on its device (common/heatmap_decoder.py)
     '''
+    if torch.is_tensor(batch_heatmaps):
+        return get_max_preds_torch(batch_heatmaps)[0].cpu().numpy()
     assert isinstance(batch_heatmaps, np.ndarray), \
         'batch_heatmaps should be numpy.ndarray'
     assert batch_heatmaps.ndim == 4, 'batch_images should be 4-ndim'
@@ -250,7 +264,7 @@ def save_batch_heatmaps(batch_image, batch_heatmaps, file_name,
                         3),
                         dtype=np.uint8)
 
-    preds = get_max_preds(batch_heatmaps.detach().cpu().numpy())
+    preds = get_max_preds(batch_heatmaps.detach())
 
     for i in range(batch_size):
         image = batch_image[i].mul(255)\
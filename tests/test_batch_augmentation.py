@@ -0,0 +1,57 @@
+from __future__ import absolute_import, division
+
+import cv2
+import numpy as np
+import pytest
+import torch
+
+from common.batch_augmentation import BatchAugmenter
+from common.common_dataset import generate_patch_canvas, generate_patch_image, transform_joints_to_patch, canvas_shape
+
+'''
+the batched (device) augmentation, generate_patch_canvas + BatchAugmenter, against the per-sample
+generate_patch_image: same trans and joints, same patch within 1 grey level when the source region fits
+in the canvas, a few grey levels on average when it is area-downsampled into it.
+'''
+
+
+def textured_image(seed=0, height=1002, width=1000):
+    rng = np.random.RandomState(seed)
+    img = cv2.GaussianBlur((rng.rand(height, width, 3) * 255).astype(np.uint8), (0, 0), 3)
+    return cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX)
+
+
+def batch_patch(img, bbox, do_flip, scale, rot):
+    # (H, W, 3) RGB float patch of the device path, before normalization
+    canvas, theta, occlusion, trans = generate_patch_canvas(img, bbox, do_flip, scale, rot, False, canvas_shape)
+    augmenter = BatchAugmenter((0., 0., 0.), (1., 1., 1.), torch.device('cpu'))
+    patch = augmenter({'canvas': torch.from_numpy(canvas)[None], 'theta': torch.from_numpy(theta)[None],
+                       'color_scale': torch.ones(1, 3), 'occlusion': torch.from_numpy(occlusion)[None]})
+    return patch[0].permute(1, 2, 0).numpy(), trans
+
+
+@pytest.mark.parametrize('bbox, scale, rot, do_flip, downsampled', [
+    ([300, 200, 300, 300], 1.0, 0., False, False),
+    ([-50, -60, 300, 300], 0.8, -30., True, False),  # partly outside the image
+    ([100, 150, 400, 400], 1.2, 20., True, True),
+    ([0, 0, 1000, 1000], 1.25, 30., True, True),
+])
+def test_canvas_matches_patch_image(bbox, scale, rot, do_flip, downsampled):
+    img = textured_image()
+    bbox = np.array(bbox, dtype=np.float64)
+    expected, expected_trans = generate_patch_image(img, bbox, do_flip, scale, rot, False)
+    patch, trans = batch_patch(img, bbox, do_flip, scale, rot)
+
+    np.testing.assert_array_equal(trans, expected_trans)
+    rng = np.random.RandomState(1)
+    joint_img = (rng.rand(18, 3) * [1000, 1000, 2400] - [0, 0, 1200]).astype(np.float32)
+    joint_vis = np.ones((18, 1), dtype=np.float32)
+    for actual, wanted in zip(transform_joints_to_patch(joint_img, joint_vis, trans),
+                              transform_joints_to_patch(joint_img, joint_vis, expected_trans)):
+        np.testing.assert_array_equal(actual, wanted)
+
+    diff = np.abs(patch - expected.astype(np.float32))
+    if downsampled:
+        assert diff.mean() <= 4.
+    else:
+        assert diff.max() <= 1.
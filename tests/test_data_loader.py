@@ -0,0 +1,54 @@
+from __future__ import absolute_import, division
+
+import numpy as np
+import torch
+
+from common.data_loader import intern_actions, PoseDataSet
+
+'''
+PoseDataSet keeps the actions as int16 codes (intern_actions): the names looked up in action_names
+are the per-frame names of the former list of strings.
+'''
+
+names = ['Walking', 'Eating', 'Directions', 'SittingDown', 'Photo']
+
+
+def random_actions(rng, num_sequences=12):
+    # one list of per-frame names per sequence, as the nested-dict fetch gave them
+    return [[names[rng.randint(len(names))]] * rng.randint(0, 30) for _ in range(num_sequences)]
+
+
+def test_intern_actions_round_trip():
+    rng = np.random.RandomState(0)
+    actions = random_actions(rng)
+    codes, action_names = intern_actions(actions)
+    assert codes.dtype == np.int16
+    assert [action_names[code] for code in codes] == sum(actions, [])
+
+    # with an existing table: its codes are kept, new names are appended
+    more = random_actions(rng) + [['Greeting'] * 3]
+    more_codes, more_names = intern_actions(more, action_names)
+    assert more_names[:len(action_names)] == action_names
+    assert [more_names[code] for code in more_codes] == sum(more, [])
+
+    # codes (numpy or torch) are taken as they are
+    again, same_names = intern_actions([torch.from_numpy(more_codes[:10]), more_codes[10:]], more_names)
+    np.testing.assert_array_equal(again, more_codes)
+    assert same_names == more_names
+
+
+def test_pose_dataset_actions():
+    rng = np.random.RandomState(1)
+    actions = random_actions(rng)
+    num = [len(chunk) for chunk in actions]
+    poses_3d = [rng.rand(n, 16, 3) for n in num]
+    poses_2d = [rng.rand(n, 16, 2) for n in num]
+    cams = [rng.rand(n, 9) for n in num]
+    frames = sum(actions, [])
+
+    decoded = PoseDataSet(poses_3d, poses_2d, actions, cams, decode_actions=True)
+    encoded = PoseDataSet(poses_3d, poses_2d, actions, cams)
+    assert len(decoded) == len(frames)
+    for index in range(len(frames)):
+        assert decoded[index][2] == frames[index]
+        assert encoded.action_names[encoded[index][2]] == frames[index]
@@ -0,0 +1,61 @@
+from __future__ import absolute_import, division
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from common.h36m_dataset_custom import Human36M
+
+'''
+Human36M(vectorized=True) projects every (subject, camera) group at once (project_batch),
+Human36M(vectorized=False) frame by frame (project_per_frame): both must give the same data.
+'''
+
+
+def write_annotations(root, subjects, num_frames=130, seed=0):
+    # synthetic Human36M_subject{s}_data / _camera / _joint_3d json files, with some degenerate bboxes
+    rng = np.random.RandomState(seed)
+    annot_path = os.path.join(root, 'data', 'Human3.6M', 'annotations')
+    os.makedirs(annot_path)
+    image_id = 0
+    for subject in subjects:
+        images, anns, joints, cameras = [], [], {}, {}
+        for cam in range(1, 5):
+            angle = rng.rand() * 2 * np.pi
+            R = [[np.cos(angle), 0, np.sin(angle)], [0, 1, 0], [-np.sin(angle), 0, np.cos(angle)]]
+            cameras[str(cam)] = {'R': R, 't': (rng.randn(3) * 100 + [0, 0, 4500]).tolist(),
+                                 'f': [1145.0 + cam, 1144.0], 'c': [512.5, 515.4]}
+        for action in (2, 3):
+            joints[str(action)] = {'1': {str(frame): (rng.randn(17, 3) * 300).tolist() for frame in range(num_frames)}}
+            for cam in range(1, 5):
+                for frame in range(num_frames):
+                    image_id += 1
+                    images.append({'id': image_id, 'width': 1000, 'height': 1002 if cam % 2 else 1000,
+                                   'file_name': 's_%02d_act_%02d_subact_01_ca_%02d/%06d.jpg' % (subject, action, cam, frame + 1),
+                                   'subject': subject, 'action_idx': action, 'subaction_idx': 1, 'cam_idx': cam,
+                                   'frame_idx': frame})
+                    width = rng.rand() * 400 if (frame // 2) % 3 != 2 else -10.  # invalid bbox, dropped by both paths
+                    anns.append({'id': image_id, 'image_id': image_id,
+                                 'bbox': [rng.rand() * 900 - 50, rng.rand() * 900 - 50, width, rng.rand() * 500]})
+        for suffix, content in (('_data', {'images': images, 'annotations': anns}), ('_camera', cameras), ('_joint_3d', joints)):
+            with open(os.path.join(annot_path, 'Human36M_subject{}{}.json'.format(subject, suffix)), 'w') as f:
+                json.dump(content, f)
+
+
+@pytest.mark.parametrize('data_split', ['test', 'vis'])
+@pytest.mark.parametrize('original', [False, True])
+def test_project_batch_matches_per_frame(tmp_path, monkeypatch, data_split, original):
+    write_annotations(str(tmp_path), subjects=[9, 11])
+    monkeypatch.chdir(tmp_path)
+
+    batch = Human36M(data_split, original, use_cache=False, vectorized=True).data.to_columns()
+    per_frame = Human36M(data_split, original, use_cache=False, vectorized=False).data.to_columns()
+
+    assert sorted(batch.keys()) == sorted(per_frame.keys())
+    assert len(batch['img_id']) > 0
+    for name in per_frame:
+        expected, actual = np.asarray(per_frame[name]), np.asarray(batch[name])
+        assert actual.dtype == expected.dtype, name
+        np.testing.assert_array_equal(actual, expected, err_msg=name)
@@ -0,0 +1,90 @@
+from __future__ import absolute_import, division
+
+import math
+
+import numpy as np
+import pytest
+import torch
+
+from common.heatmap_decoder import decode_heatmaps
+
+'''
+decode_heatmaps (torch, on the device of the heatmaps) gives the keypoints of the numpy decoding it replaces:
+get_max_preds, the quarter-pixel refinement of get_final_preds (TEST.POST_PROCESS) and the back-projection
+to the bbox, on non-square heatmaps.
+'''
+
+
+def get_max_preds(batch_heatmaps):
+    # pelee/lib/core/inference.py (its module needs the upstream utils.transforms, not in this tree)
+    batch_size = batch_heatmaps.shape[0]
+    num_joints = batch_heatmaps.shape[1]
+    width = batch_heatmaps.shape[3]
+    heatmaps_reshaped = batch_heatmaps.reshape((batch_size, num_joints, -1))
+    idx = np.argmax(heatmaps_reshaped, 2)
+    maxvals = np.amax(heatmaps_reshaped, 2)
+
+    maxvals = maxvals.reshape((batch_size, num_joints, 1))
+    idx = idx.reshape((batch_size, num_joints, 1))
+
+    preds = np.tile(idx, (1, 1, 2)).astype(np.float32)
+
+    preds[:, :, 0] = (preds[:, :, 0]) % width
+    preds[:, :, 1] = np.floor((preds[:, :, 1]) / width)
+
+    pred_mask = np.tile(np.greater(maxvals, 0.0), (1, 1, 2))
+    pred_mask = pred_mask.astype(np.float32)
+
+    preds *= pred_mask
+    return preds, maxvals
+
+
+def refine(batch_heatmaps, coords):
+    # post-processing of get_final_preds
+    heatmap_height = batch_heatmaps.shape[2]
+    heatmap_width = batch_heatmaps.shape[3]
+    coords = coords.copy()
+    for n in range(coords.shape[0]):
+        for p in range(coords.shape[1]):
+            hm = batch_heatmaps[n][p]
+            px = int(math.floor(coords[n][p][0] + 0.5))
+            py = int(math.floor(coords[n][p][1] + 0.5))
+            if 1 < px < heatmap_width-1 and 1 < py < heatmap_height-1:
+                diff = np.array([hm[py][px+1] - hm[py][px-1],
+                                 hm[py+1][px]-hm[py-1][px]])
+                coords[n][p] += np.sign(diff) * .25
+    return coords
+
+
+def random_heatmaps(rng, batch_size, num_joints, height, width):
+    heatmaps = rng.randn(batch_size, num_joints, height, width).astype(np.float32)
+    heatmaps[0, 0] -= 10.  # no positive maximum: keypoint at 0
+    heatmaps[0, 1, 0, width - 1] = 100.  # maxima on the border: not refined
+    heatmaps[1 % batch_size, 2, height - 1, 3] = 100.
+    heatmaps[-1, 3, 1, 1] = 100.
+    return heatmaps
+
+
+@pytest.mark.parametrize('subpixel', [False, True])
+@pytest.mark.parametrize('shape', [(64, 48), (48, 64), (64, 64)])
+def test_decode_matches_numpy(subpixel, shape):
+    rng = np.random.RandomState(0)
+    height, width = shape
+    heatmaps = random_heatmaps(rng, 5, 17, height, width)
+    bbox = np.concatenate([rng.rand(5, 2) * 500, rng.rand(5, 2) * 300 + 50], 1).astype(np.float32)
+
+    coords, maxvals = get_max_preds(heatmaps)
+    if subpixel:
+        coords = refine(heatmaps, coords)
+    expected_x = coords[:, :, 0] * bbox[:, 2:3] / width + bbox[:, 0:1]
+    expected_y = coords[:, :, 1] * bbox[:, 3:4] / height + bbox[:, 1:2]
+
+    keypoints = decode_heatmaps(torch.from_numpy(heatmaps), torch.from_numpy(bbox), subpixel=subpixel).numpy()
+    assert keypoints.shape == (5, 17, 3)
+    np.testing.assert_allclose(keypoints[:, :, 0], expected_x, rtol=1e-6, atol=1e-4)
+    np.testing.assert_allclose(keypoints[:, :, 1], expected_y, rtol=1e-6, atol=1e-4)
+    np.testing.assert_array_equal(keypoints[:, :, 2], maxvals[:, :, 0])
+
+    # without bbox: the heatmap coordinates themselves
+    keypoints = decode_heatmaps(torch.from_numpy(heatmaps), subpixel=subpixel).numpy()
+    np.testing.assert_array_equal(keypoints[:, :, :2], coords)
@@ -0,0 +1,57 @@
+from __future__ import absolute_import, division
+
+import random
+
+import numpy as np
+
+from common.common_dataset import sample_occlusion, occlusion_inside_image, _sample_occlusion_start
+
+'''
+sample_occlusion draws every rectangle in one pass (no rejection loop), inside the image, even for bboxes
+on the border, outside the image or about the image size.
+'''
+
+img_width, img_height = 1000, 1002
+
+
+def test_occlusion_bounded_and_inside_image(monkeypatch):
+    rng = random.Random(0)
+    draws = [0]
+
+    def counted_random():
+        draws[0] += 1
+        return rng.random()
+
+    monkeypatch.setattr(random, 'random', counted_random)
+    bboxes = [
+        [0, 0, 400, 400],
+        [img_width - 300, 200, 300, 300],
+        [-200, -200, 500, 500],
+        [-100, 100, img_width + 200, img_height + 200],
+        [0, 0, img_width, img_height],
+        [1, 1, img_width - 2, img_height - 2],
+        [img_width - 2, img_height - 2, 600, 600],
+        [img_width + 50, -400, 300, 300],
+        [0, 100, 10, 800],  # thin bbox on the border: a single feasible xmin whenever w >= 9
+    ]
+    for bbox in bboxes:
+        bbox = np.array(bbox, dtype=np.float64)
+        for _ in range(500):
+            draws[0] = 0
+            occlusion = sample_occlusion(bbox, img_width, img_height)
+            assert draws[0] == 4, bbox
+            assert occlusion_inside_image(occlusion, img_width, img_height), (bbox, occlusion)
+
+
+def test_occlusion_single_feasible_position(monkeypatch):
+    # low == high: the rectangle stays at the bbox start, not anywhere in the image
+    monkeypatch.setattr(random, 'random', random.Random(0).random)
+    assert _sample_occlusion_start(100., 51., 50., img_width) == 100.
+    bbox = np.array([0, 100, 10, 800], dtype=np.float64)
+    widths = 0
+    for _ in range(500):
+        xmin, ymin, w, h = sample_occlusion(bbox, img_width, img_height)
+        if w >= 9:
+            widths += 1
+            assert xmin == 0, (xmin, w)
+    assert widths > 0
@@ -0,0 +1,33 @@
+from __future__ import absolute_import, division
+
+import os
+
+import numpy as np
+import pytest
+import torch
+
+from common.onnx_model import export_onnx, OnnxModel
+from models_baseline.mlp.linear_model import LinearModel
+
+'''
+the lifting network exported with a dynamic batch dimension (export_onnx) gives the PyTorch outputs
+when run by ONNX Runtime (OnnxModel), for batch sizes other than the exported one.
+'''
+
+
+@pytest.mark.parametrize('batch_size', [1, 3, 17])
+def test_lifting_network_onnx_parity(tmp_path, batch_size):
+    pytest.importorskip('onnx')
+    pytest.importorskip('onnxruntime')
+    torch.manual_seed(0)
+    model = LinearModel(16 * 2, (16 - 1) * 3).eval()
+    path = export_onnx(model, torch.randn(2, 16, 2), os.path.join(str(tmp_path), 'mlp.onnx'))
+
+    session = OnnxModel(path)
+    inputs = torch.randn(batch_size, 16, 2)
+    with torch.no_grad():
+        expected = model(inputs).numpy()
+    outputs = session(inputs.view(batch_size, -1)).numpy()  # (B, 32) is reshaped to the exported (B, 16, 2)
+
+    assert outputs.shape == expected.shape == (batch_size, 16, 3)
+    np.testing.assert_allclose(outputs, expected, rtol=0, atol=1e-4)
@@ -0,0 +1,87 @@
+from __future__ import absolute_import, division
+
+import numpy as np
+import pytest
+import torch
+
+from common.camera import expand_camera_params
+from utils.data_utils import PoseStore, camera_table
+
+'''
+PoseStore.fetch returns the frames of the former nested-dict fetch(): subject by subject in the order
+of the subjects argument, every stride-th frame of each (action, camera) sequence.
+its camera ids, expanded through camera_table, are the dense per-frame intrinsics the loaders used to carry.
+'''
+
+
+class FakeDataset(object):
+    # the subjects() / [subject][action]['positions_3d'] / cameras() interface of Human36mDataset
+    def __init__(self, data, cameras):
+        self.data = data
+        self._cameras = cameras
+
+    def subjects(self):
+        return list(self.data.keys())
+
+    def __getitem__(self, subject):
+        return self.data[subject]
+
+    def cameras(self):
+        return self._cameras
+
+
+def make_dataset(seed=0, num_cameras=2):
+    rng = np.random.RandomState(seed)
+    data, keypoints, cameras = {}, {}, {}
+    for subject in ('S1', 'S5', 'S9', 'S11'):
+        cameras[subject] = [{'intrinsic': rng.rand(9)} for _ in range(num_cameras)]
+        data[subject], keypoints[subject] = {}, {}
+        for action in ('Walking 1', 'Eating', 'Directions 2', 'Walking'):
+            num = rng.randint(5, 20)
+            data[subject][action] = {'positions_3d': [rng.rand(num, 17, 3) for _ in range(num_cameras)],
+                                     'cameras': cameras[subject]}
+            keypoints[subject][action] = [rng.rand(num, 17, 2) for _ in range(num_cameras)]
+    return FakeDataset(data, cameras), keypoints
+
+
+def test_fetch_follows_subjects_order():
+    dataset, keypoints = make_dataset()
+    store = PoseStore(dataset, keypoints)
+    subjects, action_filter, stride = ['S11', 'S1'], ['Walking', 'Eating'], 3
+
+    poses_3d, poses_2d, actions, cams = store.fetch(subjects, action_filter, stride)
+
+    expected_3d, expected_2d, expected_actions = [], [], []
+    for subject in subjects:
+        for action in keypoints[subject]:
+            if action.split(' ')[0] not in action_filter:
+                continue
+            for i in range(len(keypoints[subject][action])):
+                expected_3d.append(dataset[subject][action]['positions_3d'][i][::stride])
+                expected_2d.append(keypoints[subject][action][i][::stride])
+                expected_actions += [action.split(' ')[0]] * len(expected_2d[-1])
+    np.testing.assert_array_equal(poses_3d, np.concatenate(expected_3d).astype(np.float32))
+    np.testing.assert_array_equal(poses_2d, np.concatenate(expected_2d).astype(np.float32))
+    assert [store.action_names[code] for code in actions] == expected_actions
+    assert len(cams) == len(poses_3d)
+
+
+@pytest.mark.parametrize('stride', [1, 4])
+def test_camera_ids_expand_to_intrinsics(stride):
+    dataset, keypoints = make_dataset(seed=1, num_cameras=4)
+    store = PoseStore(dataset, keypoints)
+    subjects = ['S9', 'S1', 'S11']
+
+    _, _, _, cams = store.fetch(subjects, stride=stride)
+    assert cams.dtype == np.uint8
+
+    # the former per-frame intrinsics: the camera of every sequence repeated over its (strided) frames
+    expected = []
+    for subject in subjects:
+        for action in keypoints[subject]:
+            for i in range(len(keypoints[subject][action])):
+                num = len(keypoints[subject][action][i][::stride])
+                expected.append(np.tile(dataset[subject][action]['cameras'][i]['intrinsic'], (num, 1)))
+    cam_table, _ = camera_table(dataset)
+    intrinsics = expand_camera_params(torch.from_numpy(cams), torch.from_numpy(cam_table))
+    np.testing.assert_array_equal(intrinsics.numpy(), np.concatenate(expected).astype(np.float32))
@@ -0,0 +1,8 @@
+from __future__ import absolute_import, division
+
+import numpy as np
+
+
+def affine_transform_batch(pts_2d, trans):
+    # 2D affine transform of all points at once. pts_2d: (N, 2), trans: (2, 3)
+    return np.dot(pts_2d, trans[:, :2].T) + trans[:, 2]
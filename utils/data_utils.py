@@ -1,83 +1,195 @@
 from __future__ import absolute_import, division
 
+import os
+
 import numpy as np
 
-from common.camera import world_to_camera, normalize_screen_coordinates
+from common.camera import world_to_camera_batch, normalize_screen_coordinates
+from common.pose_archive import load_pose_data
 
 input_shape = (256, 256) 
 def create_2d_data(data_path, dataset):
-    keypoints = np.load(data_path, allow_pickle=True)
-    keypoints = keypoints['positions_2d'].item()
+    keypoints = load_pose_data(data_path, 'positions_2d')
 
     for subject in keypoints.keys():
         for action in keypoints[subject]:
             for cam_idx, kps in enumerate(keypoints[subject][action]):
                 # Normalize camera frame
                 cam = dataset.cameras()[subject][cam_idx]
+                if not kps.flags.writeable:  # memory-mapped archive
+                    kps = np.array(kps)
                 kps[..., :2] = normalize_screen_coordinates(kps[..., :2], w=cam['res_w'], h=cam['res_h'])
                 keypoints[subject][action][cam_idx] = kps
 
     return keypoints
 
 
-def read_3d_data(dataset):
+def read_3d_data(dataset, cache_path=None, source_path=None):
+    """
+    camera space positions of every sequence, anim['positions_3d'] (one array per camera).
+    all cameras of a sequence are transformed by one matmul (world_to_camera_batch).
+    with cache_path, the result is loaded from / saved to that npz, which is recomputed
+    if it is older than source_path or does not match the joints of the dataset.
+    """
+    if cache_path is not None and load_positions_3d(dataset, cache_path, source_path):
+        return dataset
+
     for subject in dataset.subjects():
         for action in dataset[subject].keys():
             anim = dataset[subject][action]
 
-            positions_3d = []
-            for cam in anim['cameras']:
-                pos_3d = world_to_camera(anim['positions'], R=cam['orientation'], t=cam['translation'])
-                # pos_3d[:, :] -= pos_3d[:, :1]  # keep this, remove at model training.
-                positions_3d.append(pos_3d)
-            anim['positions_3d'] = positions_3d
+            R = np.stack([cam['orientation'] for cam in anim['cameras']])
+            t = np.stack([cam['translation'] for cam in anim['cameras']])
+            # pos_3d[:, :] -= pos_3d[:, :1]  # keep this, remove at model training.
+            anim['positions_3d'] = list(world_to_camera_batch(anim['positions'], R=R, t=t))
 
+    if cache_path is not None:
+        save_positions_3d(dataset, cache_path)
     return dataset
 
 
-def fetch(subjects, dataset, keypoints, action_filter=None, stride=1, parse_3d_poses=True):
-    out_poses_3d = []
-    out_poses_2d = []
-    out_actions = []
-    out_cam = []
+def positions_3d_cache_path(dataset_path):
+    # data/data_3d_h36m.npz -> data/data_3d_h36m_positions_3d.npz
+    return os.path.splitext(dataset_path)[0] + '_positions_3d.npz'
 
-    for subject in subjects:
-        for action in keypoints[subject].keys():
-            if action_filter is not None:
-                found = False
-                for a in action_filter:
-                    # if action.startswith(a):
-                    if action.split(' ')[0] == a:
-                        found = True
-                        break
-                if not found:
+
+def save_positions_3d(dataset, cache_path):
+    # one (C, N, J, 3) array per sequence, keyed by 'subject action'
+    arrays = {}
+    for subject in dataset.subjects():
+        for action in dataset[subject].keys():
+            arrays[subject + ' ' + action] = np.stack(dataset[subject][action]['positions_3d'])
+    np.savez(cache_path, **arrays)
+
+
+def load_positions_3d(dataset, cache_path, source_path=None):
+    # returns False (nothing loaded) if the cache is missing, stale or made for other joints
+    if not os.path.isfile(cache_path):
+        return False
+    if source_path is not None and os.path.getmtime(cache_path) < os.path.getmtime(source_path):
+        return False
+    cache = np.load(cache_path)
+    positions_3d = {}
+    for subject in dataset.subjects():
+        for action in dataset[subject].keys():
+            key = subject + ' ' + action
+            anim = dataset[subject][action]
+            if key not in cache.files:
+                return False
+            pos_3d = cache[key]
+            if pos_3d.shape != (len(anim['cameras']),) + anim['positions'].shape:
+                return False
+            positions_3d[key] = pos_3d
+
+    for subject in dataset.subjects():
+        for action in dataset[subject].keys():
+            dataset[subject][action]['positions_3d'] = list(positions_3d[subject + ' ' + action])
+    return True
+
+
+def camera_table(dataset):
+    # intrinsics of every camera of the dataset (K, 9) and the id of each (subject, camera index) in it
+    table = []
+    cam_ids = {}
+    for subject in sorted(dataset.cameras().keys()):
+        for i, cam in enumerate(dataset.cameras()[subject]):
+            cam_ids[(subject, i)] = len(table)
+            table.append(cam['intrinsic'])
+    return np.array(table, dtype=np.float32), cam_ids
+
+
+class PoseStore(object):
+    """
+    flat version of the nested subject -> action -> camera dicts of the dataset and the 2D keypoints.
+    all 3D poses (camera space) and 2D keypoints of the dataset are kept in two contiguous arrays,
+    described by an index table with one row per sequence (subject, action, subaction, camera, frame range).
+    subject/action selection and downsampling are index arithmetic over the table, see select.
+    the 3DHP test set (PoseBuffer of test_3dhp.npz) does not go through the store: it is already two flat
+    arrays, with no subject / action / camera to select on.
+    """
+    index_dtype = np.dtype([('subject', np.int16), ('action', np.int16), ('subaction', np.int16),
+                            ('camera', np.uint8), ('start', np.int64), ('stop', np.int64)])
+
+    def __init__(self, dataset, keypoints):
+        _, cam_ids = camera_table(dataset)
+        self.subject_names = []
+        self.action_names = []  # base action names ('Directions'), the action codes of the store
+        poses_3d = []
+        poses_2d = []
+        index = []
+        num = 0
+        for subject in keypoints.keys():
+            if subject not in dataset.subjects():
+                continue
+            for action in keypoints[subject].keys():
+                if 'positions_3d' not in dataset[subject][action]:
                     continue
+                name = action.split(' ')
+                if name[0] not in self.action_names:
+                    self.action_names.append(name[0])
+                if subject not in self.subject_names:
+                    self.subject_names.append(subject)
+                subaction = int(name[1]) if len(name) > 1 and name[1].isdigit() else 0
 
-            poses_2d = keypoints[subject][action]
-            for i in range(len(poses_2d)):  # Iterate across cameras
-                out_poses_2d.append(poses_2d[i])
-                out_actions.append([action.split(' ')[0]] * poses_2d[i].shape[0])
+                kps = keypoints[subject][action]
+                pos_3d = dataset[subject][action]['positions_3d']
+                assert len(pos_3d) == len(kps), 'Camera count mismatch'
+                for i in range(len(kps)):  # Iterate across cameras
+                    assert pos_3d[i].shape[0] == kps[i].shape[0], 'Frame count mismatch'
+                    poses_3d.append(pos_3d[i])
+                    poses_2d.append(kps[i])
+                    index.append((self.subject_names.index(subject), self.action_names.index(name[0]), subaction,
+                                  cam_ids[(subject, i)], num, num + kps[i].shape[0]))
+                    num += kps[i].shape[0]
 
-            if parse_3d_poses and 'positions_3d' in dataset[subject][action]:
-                poses_3d = dataset[subject][action]['positions_3d']
-                assert len(poses_3d) == len(poses_2d), 'Camera count mismatch'
-                for i in range(len(poses_3d)):  # Iterate across cameras
-                    out_poses_3d.append(poses_3d[i])
-                    cam = dataset[subject][action]['cameras'][i]['intrinsic']
-                    out_cam.append([cam] * poses_3d[i].shape[0])
+        self.poses_3d = np.concatenate(poses_3d).astype(np.float32)
+        self.poses_2d = np.concatenate(poses_2d).astype(np.float32)
+        self.index = np.array(index, dtype=self.index_dtype)
 
-    if len(out_poses_3d) == 0:
-        out_poses_3d = None
+    def __len__(self):
+        return len(self.poses_3d)
 
-    if stride > 1:
-        # Downsample as requested
-        for i in range(len(out_poses_2d)):
-            out_poses_2d[i] = out_poses_2d[i][::stride]
-            out_actions[i] = out_actions[i][::stride]
-            if out_poses_3d is not None:
-                out_poses_3d[i] = out_poses_3d[i][::stride]
+    def select_sequences(self, subjects, action_filter=None):
+        """
+        rows of the index table of the given subjects and base action names,
+        subject by subject in the order of subjects, in dataset order within a subject
+        """
+        index = self.index
+        rows = []
+        for subject in subjects:
+            if subject not in self.subject_names:
+                continue
+            mask = index['subject'] == self.subject_names.index(subject)
+            if action_filter is not None:
+                mask &= np.isin(index['action'], [self.action_names.index(a) for a in action_filter if a in self.action_names])
+            rows.append(np.flatnonzero(mask))
+        return index[np.concatenate(rows)] if rows else index[:0]
+
+    def select(self, subjects, action_filter=None, stride=1):
+        """
+        returns the frame indices (int64) of the given subjects and base action names, every stride-th frame of each sequence,
+        in the order of select_sequences
+        """
+        return self._frames(self.select_sequences(subjects, action_filter), stride)[0]
+
+    @staticmethod
+    def _frames(index, stride):
+        # frames kept per sequence, then start + k * stride within every sequence
+        counts = (index['stop'] - index['start'] + stride - 1) // stride
+        first = np.cumsum(counts) - counts
+        k = np.arange(counts.sum()) - np.repeat(first, counts)
+        return np.repeat(index['start'], counts) + k * stride, counts
 
-    return out_poses_3d, out_poses_2d, out_actions, out_cam
+    def fetch(self, subjects, action_filter=None, stride=1):
+        """
+        frames of subjects / action_filter, every stride-th of each sequence, in the order of subjects as the
+        former fetch(): (poses_3d, poses_2d, action codes into self.action_names, camera ids)
+        """
+        index = self.select_sequences(subjects, action_filter)
+        frames, counts = self._frames(index, stride)
+        out_actions = np.repeat(index['action'], counts)
+        out_cam = np.repeat(index['camera'], counts)
+        return self.poses_3d[frames], self.poses_2d[frames], out_actions, out_cam
 
 def world2cam(world_coord, R, t):
     cam_coord = np.dot(R, world_coord.transpose(1,0)).transpose(1,0) + t.reshape(1,3)
@@ -130,4 +242,31 @@ def process_bbox(bbox, width, height):
     bbox[3] = h*1.25
     bbox[0] = c_x - bbox[2]/2.
     bbox[1] = c_y - bbox[3]/2.
-    return bbox
\ No newline at end of file
+    return bbox
+
+def process_bbox_batch(bbox, width, height):
+    # array version of process_bbox. bbox: (N, 4), width/height: (N,)
+    # returns (bbox, valid), rows of invalid boxes are meaningless
+    bbox = np.asarray(bbox)
+    x, y, w, h = bbox[:, 0], bbox[:, 1], bbox[:, 2], bbox[:, 3]
+    x1 = np.maximum(0, x)
+    y1 = np.maximum(0, y)
+    x2 = np.minimum(width - 1, x1 + np.maximum(0, w - 1))
+    y2 = np.minimum(height - 1, y1 + np.maximum(0, h - 1))
+    valid = (w * h > 0) & (x2 >= x1) & (y2 >= y1)
+    bbox = np.stack([x1, y1, x2 - x1, y2 - y1], axis=1)
+
+    # aspect ratio preserving bbox
+    w = bbox[:, 2].copy()
+    h = bbox[:, 3].copy()
+    c_x = bbox[:, 0] + w / 2.
+    c_y = bbox[:, 1] + h / 2.
+    aspect_ratio = input_shape[1] / input_shape[0]
+    wide = w > aspect_ratio * h
+    tall = w < aspect_ratio * h
+    w, h = np.where(tall, h * aspect_ratio, w), np.where(wide, w / aspect_ratio, h)
+    bbox[:, 2] = w * 1.25
+    bbox[:, 3] = h * 1.25
+    bbox[:, 0] = c_x - bbox[:, 2] / 2.
+    bbox[:, 1] = c_y - bbox[:, 3] / 2.
+    return bbox, valid